@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Microblog_API.middleware.InstrumentationMiddleware',  # First, so it times everything else
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,9 +55,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'Microblog_API.middleware.RateLimitHeadersMiddleware',
+    'Microblog_API.middleware.AsyncReadsMiddleware',
 ]
 
 ROOT_URLCONF = 'Microblog.urls'
+ASYNC_URLCONF = 'Microblog_API.async_urls'  # Used by the ASGI workers, see Microblog_API/async_views.py
 
 TEMPLATES = [
     {
@@ -90,6 +94,104 @@ DATABASES = {
     }
 }
 
+# DB_ENGINE=sqlite runs on a SQLite file instead (DB_NAME, db.sqlite3 by default), e.g. for benchmarks without Postgres.
+# Full-text search then falls back to DRF's SearchFilter.
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+# Cache
+# Redis when REDIS_URL is set (docker-compose), otherwise a per-process memory cache (local runs and tests)
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'socket_connect_timeout': 0.5,
+                'socket_timeout': 0.5,
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+RESPONSE_CACHE_TIMEOUT = 60  # Seconds an anonymous read of posts/comments stays cached
+RESPONSE_CACHE_FALLBACK_SIZE = 1000  # Entries kept in memory while Redis is unreachable
+
+# Home timeline (Microblog_API/feed.py)
+
+FEED_FANOUT_THRESHOLD = 10000  # Authors with at least this many followers are pulled at read time instead of fanned out
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_BACKFILL_SIZE = 50  # Latest posts copied into a timeline when following someone
+FEED_CELEBRITIES_CACHE_TIMEOUT = 300
+
+# Bulk endpoints (Microblog_API/bulk.py)
+
+BULK_MAX_ITEMS = 1000  # Items accepted by one request
+BULK_BATCH_SIZE = 500  # Rows per INSERT/UPDATE statement
+
+# Streaming exports (Microblog_API/export.py)
+
+EXPORT_CHUNK_SIZE = 2000  # Rows read and serialized at a time
+
+# Comment threads (Microblog_API/threads.py)
+
+COMMENT_MAX_DEPTH = 20  # Deepest reply level, at most 25 with the 255 characters of Comment.path
+THREAD_MAX_COMMENTS = 500  # Replies returned by /thread/ at most, the rest are paged through /replies/
+
+# Trending posts (Microblog_API/trending.py)
+# Scores are trimmed by 'manage.py update_trending --loop'
+
+TRENDING_HALF_LIFE = 6 * 3600  # Seconds after which a like or comment counts half
+TRENDING_LIKE_WEIGHT = 1.0
+TRENDING_COMMENT_WEIGHT = 3.0
+TRENDING_MIN_SCORE = 0.5  # Decayed scores under this are dropped (NULL), out of the trending index
+TRENDING_MAX_RESULTS = 100  # Highest ?limit= of /api/posts/trending/
+
+# Rate limiting (Microblog_API/throttling.py)
+# 'redis' shares the counters between workers (checked and incremented by a Lua script), 'memory' keeps them per process
+
+RATE_LIMIT_STORE = 'redis' if REDIS_URL else 'memory'
+
+# Request instrumentation (Microblog_API/instrumentation.py)
+
+SERVER_TIMING = True  # Server-Timing header with the time spent in the database, serializers and renderer
+SLOW_REQUEST_THRESHOLD = 1.0  # Seconds, requests at least this slow are logged with their SQL (None disables it)
+SLOW_REQUEST_MAX_STATEMENTS = 100  # SQL statements kept for that log
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Bearer token of /metrics, which is only open without it when DEBUG
+
+# Like buffering (Microblog_API/likes.py)
+# None writes every like toggle to the database right away. 'redis' (shared by all workers, flushed by
+# 'manage.py flush_likes --loop' or by the requests themselves) or 'memory' (single process only, flushed by a
+# thread of that process) buffer the toggles and write them in bulk.
+
+LIKE_BUFFER = os.getenv('LIKE_BUFFER') or None
+LIKE_BUFFER_FLUSH_INTERVAL = 1.0  # Seconds
+LIKE_BUFFER_MAX_PENDING = 1000  # Posts with pending toggles that trigger a flush
+
+# Background jobs (Microblog_API/jobs.py)
+# With JOBS_EAGER the jobs run inline as soon as they're queued (development and tests). Otherwise they're
+# stored in the Job table and run by 'manage.py run_worker'.
+
+JOBS_EAGER = True
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 10  # Seconds before the first retry, doubled on every attempt
+JOBS_RETRY_BACKOFF_MAX = 3600
+JOBS_LOCK_TIMEOUT = 600  # Seconds after which a job still running is considered lost with its worker
+JOBS_RETENTION = 7 * 24 * 3600  # Seconds finished jobs (and their idempotency keys) are kept
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -161,14 +263,43 @@ LOGGING = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # request.user comes from the token claims, without a query for reads (Microblog_API/authentication.py)
+        'Microblog_API.authentication.ClaimsJWTAuthentication',
     ),
+    # orjson, with the same output as DRF's JSONRenderer/JSONParser (Microblog_API/renderers.py)
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'Microblog_API.renderers.ORJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'Microblog_API.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
-    'DATETIME_FORMAT': "%d/%m/%Y - %H:%M:%S"
-}
\ No newline at end of file
+    # Sliding window rate limits of the endpoints that set a throttle class (Microblog_API/throttling.py)
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '20/min',  # Per IP
+        'register': '100/hour',  # Per IP
+        'like': '120/min',  # Per user
+    },
+    'DATETIME_FORMAT': "%d/%m/%Y - %H:%M:%S",
+    'PAGE_SIZE': 20,
+}
+
+SIMPLE_JWT = {
+    'TOKEN_USER_CLASS': 'Microblog_API.authentication.ClaimsUser',
+    'TOKEN_REFRESH_SERIALIZER': 'Microblog_API.authentication.ClaimsTokenRefreshSerializer',
+}
+
+# Revoked refresh tokens are checked in the cache instead of the database (Microblog_API/revocation.py).
+# Only with Redis: the memory cache isn't shared by the worker processes.
+TOKEN_REVOCATION_CACHE = bool(REDIS_URL)
+TOKEN_REVOCATION_RELOAD_INTERVAL = 300  # Seconds between reloads from the database, in case revoked jtis were evicted
+
+AUTH_USER_CACHE_TIMEOUT = 30  # Seconds the User row of a token user is cached once a view needs it (is_staff...)
+
+# PAGE_SIZE is used by the keyset paginators, which are set per view instead of globally
+SILENCED_SYSTEM_CHECKS = ['rest_framework.W001']
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Production settings: DJANGO_SETTINGS_MODULE=Microblog.settings_prod, served by gunicorn or uvicorn (see serve.sh).
+Everything not overridden here comes from settings.py.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, REST_FRAMEWORK, os, sys
+
+DEBUG = False
+
+SECRET_KEY = os.getenv('SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured("Set the SECRET_KEY environment variable to use the production settings.")
+
+ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+
+# Persistent connections: each worker (thread) keeps its connection for DB_CONN_MAX_AGE seconds instead of opening
+# one per request, and checks it's still alive before reusing it. Under uvicorn every async request borrows a
+# thread from a pool, so connections aren't kept there by default.
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 0 if os.getenv('SERVER') == 'uvicorn' else 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Side effects (fan-out, backfills) run in 'manage.py run_worker' processes, out of the requests
+JOBS_EAGER = os.getenv('JOBS_EAGER') == '1'
+
+# JSON only, the browsable API renders a full HTML page (and its forms) for every response
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['Microblog_API.renderers.ORJSONRenderer'],
+}
+
+# Warnings and errors only: at DEBUG level django.db.backends formats every SQL statement
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'stream': sys.stdout,
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.getenv('LOG_LEVEL', 'WARNING'),
+    },
+    'loggers': {
+        'django.db.backends': {
+            'level': 'WARNING',
+        },
+    },
+}
@@ -2,4 +2,5 @@ from django.contrib import admin
 import Microblog_API.models as models
 
 admin.site.register(models.Post)
-admin.site.register(models.Comment)
\ No newline at end of file
+admin.site.register(models.Comment)
+admin.site.register(models.Job)
@@ -1,13 +1,27 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from rest_framework.response import Response
 from rest_framework import viewsets, status, permissions, filters
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import ClaimsRefreshToken, as_author
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Post, Comment
 from django.contrib.auth.models import User
 from .serializers import UserSerializer, PostSerializer, LoginSerializer, RegisterSerializer, CommentSerializer
+from .pagination import PostPagination, CommentPagination, ReplyPagination, LikePagination, positive_int
+from .counters import adjust_counters
+from .cache import cache_anonymous_reads, response_cache
+from .conditional import conditional_post_reads, touch_post
+from .instrumentation import timed
+from .throttling import LikeRateThrottle, LoginRateThrottle, RegisterRateThrottle
+from .signals import post_liked
+from .search import FullTextSearchFilter
+from .feed import FeedPagination, follow, queue_fan_out, unfollow
+from .likes import apply_liked_by, apply_pending_likes, get_like_buffer, likers_page, likes_queryset
+from . import bulk, export, threads, trending
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -17,11 +31,27 @@ class UserViewSet(viewsets.ModelViewSet):
     def get_permissions(self):
         if self.request.method in permissions.SAFE_METHODS:
             return [permissions.AllowAny()]
+        elif self.action == 'follow':
+            return [permissions.IsAuthenticated()]
         else:
             return [permissions.IsAdminUser()]
+    
+    # POST /api/users/{pk}/follow/ -> follow/unfollow the user
+    @action(detail=True, methods=['post'])
+    def follow(self, request, pk = None):
+        followee = get_object_or_404(User, id = pk)
+        if followee.id == request.user.id:
+            return Response({"detail": "You can't follow yourself"}, status = status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            if unfollow(request.user.id, followee.id):
+                return Response({"detail": "Unfollowed"})
+            follow(request.user.id, followee.id)
+        return Response({"detail": "Followed"})
 
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [LoginRateThrottle]
 
     def get(self, request):
         return Response({"detail": "Use POST to log in."})
@@ -31,7 +61,7 @@ class LoginView(APIView):
         if serializer.is_valid():
             user = serializer.validated_data['user']
             
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             
             return Response({
                 'user_id': user.id,
@@ -47,7 +77,7 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = ClaimsRefreshToken(refresh_token)
             token.blacklist()  # Invalids the token
             return Response({"detail": "Logout successful."}, status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
@@ -58,6 +88,11 @@ class RegisterViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.AllowAny]
     serializer_class = RegisterSerializer
     
+    def get_throttles(self):
+        if self.action == 'create':
+            return [RegisterRateThrottle()]
+        return super().get_throttles()
+    
     # viewset's create() method is overwritten to custom the JSON response sent to the client.
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -74,59 +109,161 @@ class RegisterViewSet(viewsets.ModelViewSet):
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = PostPagination
+    # The search filter goes last: it ranks results by relevance unless ?ordering= was given
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['author']
-    search_fields = ['title', 'content']  # fields where you can search for key words
+    search_fields = ['title', 'content']  # fields where you can search for key words (full-text indexed on Postgres)
     ordering_fields = ['created_at', 'title']  # fields to order the list
     ordering = ['-created_at']  # default order    
     
     def get_permissions(self):
-        if self.request.method in ["POST"]:
-            return [permissions.IsAuthenticated()]
+        if self.request.method in ["POST"] or self.action == 'bulk':
+            return [permissions.IsAuthenticated()] # Bulk edits/deletes check the author of every post themselves
         
         if self.request.method in ["PUT","PATCH","DELETE"]:
-            post = Post.objects.get(id = self.kwargs['pk'])
-            if post.author == self.request.user:
+            post = Post.objects.only('author').get(id = self.kwargs['pk'])
+            if post.author_id == self.request.user.id:
                 return [permissions.IsAuthenticated()] # To create a post the user must be authenticated
             else:
                 return [permissions.IsAdminUser()]
         
         return [permissions.AllowAny()] # The list of all the posts can be viewed without being authenticated
     
+    # The author is fetched in the same query and the counters are columns of Post, so listing N posts is a single query.
+    # Only the columns PostSerializer reads are loaded (not the author's password, email...)
+    def get_queryset(self):
+        return Post.objects.select_related('author').only(*PostSerializer.read_columns)
+    
     # Upon creating a new post, it is assigned automatically to the user who created it
+    # With LIKE_BUFFER enabled, likes that weren't flushed yet are added to the counters of the posts sent back
+    # Authenticated users also get liked_by_me on every post, read for the whole page in one query
+    def paginate_queryset(self, queryset):
+        return apply_liked_by(self.request.user, apply_pending_likes(super().paginate_queryset(queryset)))
+    
+    def get_object(self):
+        return apply_liked_by(self.request.user, apply_pending_likes([super().get_object()]))[0]
+    
+    # liked_by_me depends on who is asking
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS:
+            patch_vary_headers(response, ['Authorization'])
+        return response
+    
+    # The new post is also copied into the timelines of the author's followers, by a background job queued with it
     def perform_create(self, serializer):
-        serializer.save(author = self.request.user)
+        with transaction.atomic():
+            post = serializer.save(author = as_author(self.request.user))
+            queue_fan_out([post])
+    
+    # Anonymous reads are answered from the response cache, which Microblog_API/signals.py invalidates on every write
+    @cache_anonymous_reads(lambda kwargs: 'posts')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @conditional_post_reads(lambda kwargs: kwargs['pk'])
+    @cache_anonymous_reads(lambda kwargs: f"post:{kwargs['pk']}")
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     # @action is a way to add custom endpoints to a ViewSet
     # detail=True means that is applied upon one single object (/api/posts/5/like)
     # In short, this line generates this new action -> POST /api/posts/{pk}/like/
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], throttle_classes=[LikeRateThrottle])
     def like(self, request, pk = None):
         post = get_object_or_404(Post, id = pk)
         user = request.user
+        Like = Post.likes.through
         
-        if post.likes.filter(id = user.id).exists():
-            post.likes.remove(user)
-            return Response({"detail": "Like removed"})
-        else:
-            post.likes.add(user)
-            return Response({"detail": "Like added"})
+        # Buffered mode: the toggle is recorded in the like buffer and written to the database in bulk later (see likes.py)
+        buffer = get_like_buffer()
+        if buffer is not None:
+            liked = buffer.toggle(user.id, post.id)
+            post_liked.send(sender = Post, post_id = post.id, user_id = user.id, liked = liked)
+            return Response({"detail": "Like added" if liked else "Like removed"})
+        
+        # The join table and like_count change in the same transaction, and like_count is updated with F() so concurrent likes add up
+        with transaction.atomic():
+            removed, _ = Like.objects.filter(post_id = post.id, user_id = user.id).delete()
+            if removed:
+                adjust_counters(Post, post.id, like_count = -removed)
+                post_liked.send(sender = Post, post_id = post.id, user_id = user.id, liked = False)
+                return Response({"detail": "Like removed"})
+        
+        try:
+            with transaction.atomic():
+                Like.objects.create(post_id = post.id, user_id = user.id)
+                adjust_counters(Post, post.id, like_count = 1)
+        except IntegrityError:
+            pass # A concurrent request of the same user already added it
+        post_liked.send(sender = Post, post_id = post.id, user_id = user.id, liked = True)
+        return Response({"detail": "Like added"})
         
+    # POST   /api/posts/bulk/ [{"title": ..., "content": ...}, ...]   -> create posts
+    # PATCH  /api/posts/bulk/ [{"id": ..., "title": ...}, ...]        -> edit own posts
+    # DELETE /api/posts/bulk/ {"ids": [...]}                          -> delete own posts
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                results, _ = bulk.delete(Post.objects.all(), bulk.get_ids(request.data), request.user)
+            return Response({"results": results})
+        
+        items = bulk.get_items(request.data)
+        with transaction.atomic():
+            if request.method == 'POST':
+                posts = bulk.create(Post, items, PostSerializer, author = as_author(request.user))
+                queue_fan_out(posts)
+                code = status.HTTP_201_CREATED
+            else:
+                posts = bulk.update(Post.objects.select_related('author'), items, PostSerializer, request.user)
+                code = status.HTTP_200_OK
+        
+        # Neither bulk_create nor bulk_update send post_save
+        response_cache.invalidate('posts', *[f'post:{post.id}' for post in posts])
+        return Response({"results": PostSerializer(posts, many = True).data}, status = code)
+        
+    # GET /api/posts/export/ -> every post matching the filters, streamed as a JSON array (or NDJSON with ?format=ndjson)
+    @action(detail=False, methods=['get'], renderer_classes=export.renderer_classes)
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        return export.streaming_response(request, queryset, PostSerializer, prepare = apply_pending_likes)
+        
+    # GET /api/posts/trending/?limit=20 -> the posts with the highest time-decayed likes and comments (see trending.py)
+    # Decay doesn't change the order, so the cached response only goes stale when a like or comment invalidates 'posts'
+    @action(detail=False, methods=['get'])
+    @cache_anonymous_reads(lambda kwargs: 'posts')
+    def trending(self, request):
+        try:
+            limit = positive_int(request.query_params.get('limit', PostPagination.page_size), strict = True, cutoff = settings.TRENDING_MAX_RESULTS)
+        except ValueError:
+            return Response({"detail": "limit must be a positive integer"}, status = status.HTTP_400_BAD_REQUEST)
+        
+        posts = apply_liked_by(request.user, apply_pending_likes(list(trending.top(limit, self.get_queryset()))))
+        return Response({"results": PostSerializer(posts, many = True).data})
+        
+    # GET /api/posts/{pk}/likes/ -> number of likes and the usernames of the likers, newest first (paginated)
     @action(detail=True, methods=['get'])
+    @cache_anonymous_reads(lambda kwargs: f"post:{kwargs['pk']}")
     def likes(self, request, pk = None):
-        post = get_object_or_404(Post, id = pk)
-        users = post.likes.all()
-        usernames = [u.username for u in users]
-        
+        post = apply_pending_likes([get_object_or_404(Post.objects.only('like_count'), id = pk)])[0]
+        paginator = LikePagination()
+        rows = paginator.paginate_queryset(likes_queryset(post.id), request)
         return Response({
-            "count": len(usernames),
-            "users": usernames
+            "count": post.like_count,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "users": likers_page(post.id, rows, first_page = not paginator.has_previous),
         })
-        
-    # def get_queryset(self):
-    #     return Post.objects.filter(author=self.request.user)
     
 class CommentView(APIView):
+    pagination_class = CommentPagination
+    filter_backends = [filters.OrderingFilter, FullTextSearchFilter]
+    search_fields = ['content']
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
+    
     # Comments can be only added when authenticated, but they are visible for everyone
     def get_permissions(self):
         if self.request.method in ["POST","PUT","PATCH","DELETE"]:
@@ -134,40 +271,39 @@ class CommentView(APIView):
         return [permissions.AllowAny()]
     
     # Paramenters post_id=None, comment_id=None are passed in order not to get the URL failed if they are not present
+    @conditional_post_reads(lambda kwargs: kwargs['post_id'])
+    @cache_anonymous_reads(lambda kwargs: f"post:{kwargs['post_id']}")
     def get(self, request, post_id = None, comment_id = None):
         if comment_id:
-            comment = get_object_or_404(Comment, id = comment_id, post = post_id)
+            comment = get_object_or_404(Comment.objects.select_related('author').only(*CommentSerializer.read_columns), id = comment_id, post = post_id)
             serializer = CommentSerializer(comment)
             return Response(serializer.data)
         
-        post = get_object_or_404(Post, id = post_id)
-        comments = Comment.objects.filter(post = post)
-        
-        search = request.query_params.get('search')
-        ordering = request.query_params.get('ordering')
+        post = get_object_or_404(Post.objects.only('id'), id = post_id)
+        comments = Comment.objects.filter(post = post).select_related('author').only(*CommentSerializer.read_columns)
         
-        if search:
-            comments = comments.filter(content__icontains = search)
-        elif ordering:
-            comments = comments.order_by(ordering)
-        else:
-            comments = comments.order_by('-created_at')
+        # ?search= and ?ordering= are handled by the same backends PostViewSet uses
+        for backend in self.filter_backends:
+            comments = backend().filter_queryset(request, comments, self)
         
-        serializer = CommentSerializer(comments, many = True) # Con 'many=True' se le dice al serializer que 'comments' es un queryset o una lista de objetos
-        return Response(serializer.data)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(comments, request, view = self)
+        serializer = CommentSerializer(page, many = True) # Con 'many=True' se le dice al serializer que 'comments' es un queryset o una lista de objetos
+        return paginator.get_paginated_response(serializer.data)
     
     def post(self, request, post_id):
         post = get_object_or_404(Post, id = post_id)
         serializer = CommentSerializer(data = request.data)
         if serializer.is_valid():
-            serializer.save(author = request.user, post = post)
+            with transaction.atomic(): # El comentario y comment_count (signals.count_comment) se guardan juntos
+                serializer.save(author = as_author(request.user), post = post)
             return Response(serializer.data, status = status.HTTP_201_CREATED)
         return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
     
     def put(self, request, post_id, comment_id):
         comment = get_object_or_404(Comment, id = comment_id, post = post_id)
         
-        if comment.author != request.user:
+        if comment.author_id != request.user.id:
             return Response({
                 "detail": "You can't edit another user's comment"
             }, status = status.HTTP_403_FORBIDDEN)
@@ -182,10 +318,131 @@ class CommentView(APIView):
     def delete(self, request, post_id, comment_id):
         comment = get_object_or_404(Comment, id = comment_id, post_id = post_id)
         
-        if comment.author != request.user:
+        if comment.author_id != request.user.id:
             return Response({
                 "detail": "You can't delete another user's comment"
             }, status = status.HTTP_403_FORBIDDEN)
             
-        comment.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        comment.delete() # Its replies go with it, each one uncounted from the post by signals.uncount_comment
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class CommentRepliesView(APIView):
+    pagination_class = ReplyPagination
+    
+    def get_permissions(self):
+        if self.request.method == "POST":
+            return [permissions.IsAuthenticated()]
+        return [permissions.AllowAny()]
+    
+    # GET /api/posts/{post_id}/comments/{comment_id}/replies/ -> direct replies of the comment, oldest first
+    @conditional_post_reads(lambda kwargs: kwargs['post_id'])
+    @cache_anonymous_reads(lambda kwargs: f"post:{kwargs['post_id']}")
+    def get(self, request, post_id, comment_id):
+        comment = get_object_or_404(Comment.objects.only('id', 'path'), id = comment_id, post = post_id)
+        replies = (
+            Comment.objects.filter(post = post_id, path = threads.child_path(comment)) # Served by comment_thread_idx
+            .select_related('author').only(*CommentSerializer.read_columns)
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(replies, request, view = self)
+        return paginator.get_paginated_response(CommentSerializer(page, many = True).data)
+    
+    # POST /api/posts/{post_id}/comments/{comment_id}/replies/ {"content": ...} -> reply to the comment
+    def post(self, request, post_id, comment_id):
+        parent = get_object_or_404(Comment.objects.only('id', 'post', 'path', 'depth'), id = comment_id, post = post_id)
+        if parent.depth >= threads.get_max_depth():
+            return Response({
+                "detail": "This thread can't have deeper replies"
+            }, status = status.HTTP_400_BAD_REQUEST)
+        
+        serializer = CommentSerializer(data = request.data)
+        if serializer.is_valid():
+            with transaction.atomic(): # Same for the reply and the counters of the post and its ancestors
+                serializer.save(author = as_author(request.user), post_id = parent.post_id, parent = parent)
+            return Response(serializer.data, status = status.HTTP_201_CREATED)
+        return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+
+class CommentThreadView(APIView):
+    permission_classes = [permissions.AllowAny]
+    
+    # GET /api/posts/{post_id}/comments/{comment_id}/thread/?depth=N -> the comment and its replies nested under
+    # it, down to N levels (every level by default). The subtree is read in one query, at most THREAD_MAX_COMMENTS
+    # replies, the shallowest first: a node with fewer "replies" than its reply_count continues in /replies/
+    @conditional_post_reads(lambda kwargs: kwargs['post_id'])
+    @cache_anonymous_reads(lambda kwargs: f"post:{kwargs['post_id']}")
+    def get(self, request, post_id, comment_id):
+        try:
+            depth = positive_int(request.query_params['depth']) if 'depth' in request.query_params else None
+        except ValueError:
+            return Response({"detail": "depth must be a positive integer"}, status = status.HTTP_400_BAD_REQUEST)
+        
+        columns = (*CommentSerializer.read_columns, 'path')
+        comment = get_object_or_404(Comment.objects.select_related('author').only(*columns), id = comment_id, post = post_id)
+        replies = (
+            Comment.objects.filter(threads.subtree_filter(comment, depth)).select_related('author').only(*columns)
+            .order_by('depth', 'created_at', 'id')[:threads.get_max_thread_size()]
+        )
+        serializer = CommentSerializer()
+        with timed('serialize'):
+            tree = threads.build_tree(comment, replies, serializer.to_representation)
+        return Response(tree)
+
+class CommentExportView(APIView):
+    renderer_classes = export.renderer_classes
+    filter_backends = CommentView.filter_backends
+    search_fields = CommentView.search_fields
+    ordering_fields = CommentView.ordering_fields
+    ordering = CommentView.ordering
+    
+    # GET /api/posts/{post_id}/comments/export/ -> every comment of the post, streamed like /api/posts/export/
+    def get(self, request, post_id):
+        post = get_object_or_404(Post.objects.only('id'), id = post_id)
+        comments = Comment.objects.filter(post = post).select_related('author').only(*CommentSerializer.read_columns)
+        for backend in self.filter_backends:
+            comments = backend().filter_queryset(request, comments, self)
+        return export.streaming_response(request, comments, CommentSerializer)
+
+class CommentBulkView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    # POST /api/posts/{post_id}/comments/bulk/ [{"content": ...}, ...] -> create comments
+    def post(self, request, post_id):
+        post = get_object_or_404(Post, id = post_id)
+        items = bulk.get_items(request.data)
+        with transaction.atomic():
+            comments = bulk.create(Comment, items, CommentSerializer, author = as_author(request.user), post = post)
+            adjust_counters(Post, post.id, comment_count = len(comments))  # bulk_create doesn't send post_save
+        response_cache.invalidate_post(post.id)
+        return Response({"results": CommentSerializer(comments, many = True).data}, status = status.HTTP_201_CREATED)
+    
+    # PATCH /api/posts/{post_id}/comments/bulk/ [{"id": ..., "content": ...}, ...] -> edit own comments
+    def patch(self, request, post_id):
+        items = bulk.get_items(request.data)
+        with transaction.atomic():
+            comments = bulk.update(Comment.objects.filter(post_id = post_id).select_related('author'), items, CommentSerializer, request.user)
+            touch_post(post_id)
+        response_cache.invalidate_post(post_id)
+        return Response({"results": CommentSerializer(comments, many = True).data})
+    
+    # DELETE /api/posts/{post_id}/comments/bulk/ {"ids": [...]} -> delete own comments
+    def delete(self, request, post_id):
+        with transaction.atomic():
+            results, _ = bulk.delete(Comment.objects.filter(post_id = post_id), bulk.get_ids(request.data), request.user)
+        return Response({"results": results})
+
+class FeedView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    # Posts of the accounts the user follows (and their own), newest first
+    def get(self, request):
+        paginator = FeedPagination()
+        page = apply_liked_by(request.user, apply_pending_likes(paginator.paginate_feed(request.user.id, request)))
+        serializer = PostSerializer(page, many = True)
+        return paginator.get_paginated_response(serializer.data)
+
+class CacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    
+    # Hit/miss counters of the response cache of this worker process
+    def get(self, request):
+        return Response(response_cache.stats())
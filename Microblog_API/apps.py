@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class Microblog_APIConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Microblog_API'
+
+    def ready(self):
+        from . import instrumentation, signals  # noqa: F401 (connects the receivers)
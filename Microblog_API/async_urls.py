@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.urls import include, path
+from .async_views import post_list, post_detail, post_likes, comment_list
+
+# URLconf of the ASGI workers (settings.ASYNC_URLCONF): the async read views first, then every route of the project.
+# Named like the views they replace, which is the route label of their metrics (Microblog_API/instrumentation.py).
+urlpatterns = [
+    path('api/posts/', post_list, name = 'posts-list'),
+    path('api/posts/<int:pk>/', post_detail, name = 'posts-detail'),
+    path('api/posts/<int:pk>/likes/', post_likes, name = 'posts-likes'),
+    path('api/posts/<int:post_id>/comments/', comment_list, name = 'comments'),
+    path('', include(settings.ROOT_URLCONF)),
+]
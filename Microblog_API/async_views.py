@@ -0,0 +1,173 @@
+"""
+Async versions of the hot read endpoints, served under ASGI (Microblog/asgi.py) instead of the DRF views.
+
+Django runs every sync view of an ASGI worker on one shared thread, so a request waiting on the database
+holds up all the others. These views run on the event loop instead: the ORM is used through its async API,
+and the response cache and like buffer, which may wait on Redis, run in the executor's thread pool.
+
+They reuse the DRF pieces of the sync views (filter backends, paginators, serializers, renderer and
+response cache entries), so both answer with the same bytes. Anything they don't handle is passed on to
+the sync view: other methods, query parameters they don't know (?author=...), browsers asking for the
+browsable API, invalid tokens and errors such as 404s. Under WSGI, AsyncReadsMiddleware doesn't switch to
+their URLconf (async_urls.py) and only the sync views are used.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import resolve
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .api import CommentView, PostViewSet
+from .cache import response_cache
+from . import conditional, likes
+from .likes import get_like_buffer
+from .models import Post, Comment
+from .pagination import LikePagination
+from .serializers import CommentSerializer, PostSerializer
+
+
+def in_thread(func):
+    """For blocking calls that don't use the database (cache, Redis), which don't need Django's shared thread."""
+    return sync_to_async(func, thread_sensitive = False)
+
+
+async def delegate(request, *args, **kwargs):
+    match = resolve(request.path_info, urlconf = settings.ROOT_URLCONF)
+    return await sync_to_async(match.func)(request, *match.args, **match.kwargs)
+
+
+def render(data, cache_status = None, validators = None, vary = ()):
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    response = HttpResponse(renderer.render(data), content_type = renderer.media_type)
+    response['Vary'] = ', '.join(('Accept', *vary))
+    if cache_status:
+        response['X-Cache'] = cache_status
+    if validators:
+        conditional.add_validators(response, *validators)
+    return response
+
+
+def async_read(scope, name, params = (), post_id = None, vary = ()):
+    """
+    Decorator for the async GET handlers. The handler receives the DRF request and returns the response data,
+    or None to let the sync view answer. Anonymous responses go through the same cache entries the sync view
+    uses (scope and name as in cache_anonymous_reads), only `params` are accepted in the query string.
+    With `post_id` (as in conditional_post_reads), conditional requests are answered before the cache.
+    `vary` lists the request headers added to Vary besides Accept.
+    """
+    def decorator(handler):
+        @csrf_exempt  # Like DRF's views, the sync view enforces CSRF itself when it applies
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            if (
+                request.method != 'GET'
+                or 'text/html' in request.headers.get('Accept', '')
+                or set(request.GET) - set(params)
+            ):
+                return await delegate(request, *args, **kwargs)
+
+            drf_request = Request(request, authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+            try:
+                drf_request.user  # Tokens are checked without the database (Microblog_API/authentication.py)
+            except APIException:
+                return await delegate(request, *args, **kwargs)
+
+            validators = None
+            if post_id is not None:
+                validators = await conditional.aget_validators(post_id(kwargs), api_settings.DEFAULT_RENDERER_CLASSES[0].format, drf_request.user)
+                if validators is not None and (response := conditional.not_modified(request, *validators)) is not None:
+                    return response
+
+            key = None
+            if not drf_request.user.is_authenticated:
+                key = await in_thread(response_cache.key_for)(scope(kwargs), drf_request, name)
+                data = await in_thread(response_cache.get)(key)
+                if data is not None:
+                    return render(data, 'HIT', validators, vary)
+
+            try:
+                data = await handler(drf_request, *args, **kwargs)
+            except APIException:
+                data = None  # Invalid cursor and the like, the sync view builds the error response
+            if data is None:
+                return await delegate(request, *args, **kwargs)
+
+            if key is None:
+                return render(data, validators = validators, vary = vary)
+            await in_thread(response_cache.set)(key, data)
+            return render(data, 'MISS', validators, vary)
+        return view
+    return decorator
+
+
+async def apply_pending_likes(posts):
+    buffer = get_like_buffer()
+    if buffer is not None:
+        await in_thread(buffer.apply_to)(posts)
+    return posts
+
+
+def filtered(view_class, request, queryset, **initkwargs):
+    """Applies the filter backends (?search=, ?ordering=) of the sync view, which only build the queryset."""
+    view = view_class(request = request, format_kwarg = None, **initkwargs)
+    for backend in view.filter_backends:
+        queryset = backend().filter_queryset(request, queryset, view)
+    return queryset
+
+
+async def paginate(paginator, queryset, request):
+    return paginator.build_page([row async for row in paginator.get_page_queryset(queryset, request)])
+
+
+async def apply_liked_by(user, posts):
+    if user.is_authenticated:
+        await sync_to_async(likes.apply_liked_by)(user, posts)
+    return posts
+
+
+@async_read(lambda kwargs: 'posts', 'list', params = ('cursor', 'page_size', 'ordering', 'search'), vary = ('Authorization',))
+async def post_list(request):
+    queryset = filtered(PostViewSet, request, Post.objects.select_related('author').only(*PostSerializer.read_columns), action = 'list')
+    paginator = PostViewSet.pagination_class()
+    page = await apply_pending_likes(await paginate(paginator, queryset, request))
+    await apply_liked_by(request.user, page)
+    return paginator.get_paginated_response(PostSerializer(page, many = True).data).data
+
+
+@async_read(lambda kwargs: f"post:{kwargs['pk']}", 'retrieve', post_id = lambda kwargs: kwargs['pk'], vary = ('Authorization',))
+async def post_detail(request, pk):
+    try:
+        post = await Post.objects.select_related('author').only(*PostSerializer.read_columns).aget(id = pk)
+    except Post.DoesNotExist:
+        return None
+    await apply_pending_likes([post])
+    await apply_liked_by(request.user, [post])
+    return PostSerializer(post).data
+
+
+@async_read(lambda kwargs: f"post:{kwargs['pk']}", 'likes', params = ('cursor', 'page_size'), vary = ('Authorization',))
+async def post_likes(request, pk):
+    try:
+        post = await Post.objects.only('like_count').aget(id = pk)
+    except Post.DoesNotExist:
+        return None
+    await apply_pending_likes([post])
+    paginator = LikePagination()
+    rows = await paginate(paginator, likes.likes_queryset(post.id), request)
+    usernames = await sync_to_async(likes.likers_page)(post.id, rows, first_page = not paginator.has_previous)
+    return {"count": post.like_count, "next": paginator.get_next_link(), "previous": paginator.get_previous_link(), "users": usernames}
+
+
+@async_read(lambda kwargs: f"post:{kwargs['post_id']}", 'get', params = ('cursor', 'page_size', 'ordering', 'search'), post_id = lambda kwargs: kwargs['post_id'])
+async def comment_list(request, post_id):
+    if not await Post.objects.filter(id = post_id).aexists():
+        return None
+    queryset = filtered(CommentView, request, Comment.objects.filter(post = post_id).select_related('author').only(*CommentSerializer.read_columns))
+    paginator = CommentView.pagination_class()
+    page = await paginate(paginator, queryset, request)
+    return paginator.get_paginated_response(CommentSerializer(page, many = True).data).data
+
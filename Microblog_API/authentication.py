@@ -0,0 +1,148 @@
+"""
+Stateless JWT authentication (ClaimsJWTAuthentication with SIMPLE_JWT['TOKEN_USER_CLASS'] = ClaimsUser):
+request.user is built from the access token claims instead of loading the User row on every request.
+
+Tokens issued by LoginView and RegisterSerializer (ClaimsRefreshToken) carry the username next to the user
+id, which is all the posts, comments and likes views need. Anything else, e.g. is_staff for IsAdminUser,
+loads the User the first time it's read, through a short-lived cache (AUTH_USER_CACHE_TIMEOUT seconds,
+0 disables it). A username changed in the meantime shows up once the access token is renewed.
+
+Reads trust the token until it expires. Writes (unsafe methods) also check through that cached User that
+the account still exists and is active, so a deleted or deactivated user gets a 401 instead of writing.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth.base_user import AbstractBaseUser
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import permissions
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from . import revocation
+
+logger = logging.getLogger(__name__)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    RefreshToken whose access tokens also carry the username. Issuing it writes nothing to the database,
+    revoking and checking it goes through Microblog_API/revocation.py.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        # Skips BlacklistMixin.for_user, which stores an OutstandingToken row for every token issued
+        token = super(BlacklistMixin, cls).for_user(user)
+        token['username'] = user.username
+        return token
+
+    def check_blacklist(self):
+        if revocation.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        return revocation.revoke(
+            self.payload[api_settings.JTI_CLAIM],
+            self.payload['exp'],
+            user_id = self.payload.get(api_settings.USER_ID_CLAIM),
+            token = str(self),
+        )
+
+    def outstand(self):
+        return None  # Only revoked tokens are stored
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Used by /api/token/refresh/ (SIMPLE_JWT['TOKEN_REFRESH_SERIALIZER'])."""
+    token_class = ClaimsRefreshToken
+
+
+def user_cache_key(user_id):
+    return f'microblog:auth:user:{user_id}'
+
+
+class ClaimsUser(TokenUser):
+    """request.user of token-authenticated requests (see the module docstring)."""
+
+    # simplejwt stores the id as a string, it's converted back so it compares equal to author_id and friends
+    @cached_property
+    def id(self):
+        return User._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def username(self):
+        return self.token.get('username') or getattr(self.user, 'username', '')  # Tokens issued before the claim existed
+
+    @cached_property
+    def user(self):
+        """The User row, or None if it was deleted after the token was issued."""
+        def load():
+            return User.objects.filter(id = self.id).first()
+
+        timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 30)
+        if not timeout:
+            return load()
+        try:
+            return cache.get_or_set(user_cache_key(self.id), load, timeout)
+        except Exception as exc:
+            logger.warning("Could not read the user from the cache: %s", exc)
+            return load()
+
+    @cached_property
+    def is_staff(self):
+        return bool(self.user and self.user.is_active and self.user.is_staff)
+
+    @cached_property
+    def is_superuser(self):
+        return bool(self.user and self.user.is_active and self.user.is_superuser)
+
+    # Lets views compare it with the User of a loaded object (post.author == request.user)
+    def __eq__(self, other):
+        if isinstance(other, AbstractBaseUser):
+            return self.id == other.pk
+        return super().__eq__(other)
+
+    __hash__ = TokenUser.__hash__
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        if attr in self.token:
+            return self.token[attr]
+        return getattr(self.user, attr)  # Unknown attributes (or a deleted user) raise AttributeError
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """Used by DEFAULT_AUTHENTICATION_CLASSES: the user of a write must still exist and be active."""
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None or request.method in permissions.SAFE_METHODS:
+            return result
+        user = result[0]
+        account = user.user if isinstance(user, ClaimsUser) else user
+        if account is None or not account.is_active:
+            raise AuthenticationFailed(_("User not found or inactive"), code = 'user_inactive')
+        return result
+
+
+def as_author(user):
+    """
+    Value for an author foreign key: the User itself or, for a ClaimsUser, an unsaved User holding only id and
+    username (enough to save the relation and render 'author' without a query). Never call save() on it.
+    """
+    if isinstance(user, User):
+        return user
+    return User(id = user.id, username = user.username)
@@ -0,0 +1,152 @@
+"""
+Helpers of the bulk endpoints (/api/posts/bulk/ and /api/posts/<id>/comments/bulk/).
+
+Creates and updates are all-or-nothing: the items are validated with the regular serializers in many=True
+mode and, if any of them is invalid, nothing is written and the errors are returned in input order (an
+empty dict for the valid items). Otherwise every row is written with bulk_create/bulk_update, a few
+queries per batch instead of one transaction per object.
+
+Deletes report one outcome per id and delete whatever the user is allowed to.
+"""
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+
+def get_max_items():
+    return getattr(settings, 'BULK_MAX_ITEMS', 1000)
+
+
+def get_batch_size():
+    return getattr(settings, 'BULK_BATCH_SIZE', 500)
+
+
+def get_items(data):
+    """The body of a bulk create/update: a non-empty JSON array of objects, up to BULK_MAX_ITEMS."""
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise ValidationError({"detail": "Expected a list of objects."})
+    if not data:
+        raise ValidationError({"detail": "The list is empty."})
+    if len(data) > get_max_items():
+        raise ValidationError({"detail": f"At most {get_max_items()} items can be sent at once."})
+    return data
+
+
+def get_ids(data):
+    """The body of a bulk delete: {"ids": [...]} or the list of ids itself."""
+    ids = data.get('ids') if isinstance(data, dict) else data
+    if not isinstance(ids, list) or not ids:
+        raise ValidationError({"detail": "Expected a non-empty list of ids."})
+    if len(ids) > get_max_items():
+        raise ValidationError({"detail": f"At most {get_max_items()} items can be sent at once."})
+    try:
+        return [int(pk) for pk in ids]
+    except (TypeError, ValueError):
+        raise ValidationError({"detail": "Every id must be an integer."})
+
+
+def can_modify(user, obj):
+    return obj.author_id == user.id or user.is_staff
+
+
+def validate(serializer_class, items, partial = False, item_errors = None):
+    """
+    Validates the items with serializer_class(many=True). Returns the validated data, or raises a
+    ValidationError with one dict of errors per item. `item_errors` adds errors found by the caller.
+    """
+    serializer = serializer_class(data = items, many = True, partial = partial)
+    valid = serializer.is_valid()
+    errors = serializer.errors if not valid else []
+    if isinstance(errors, dict) and 'non_field_errors' in errors:
+        raise ValidationError(errors)
+    # Depending on the DRF version, list errors come as a list or as a dict {index: errors} of the invalid items
+    errors = dict(errors) if isinstance(errors, dict) else dict(enumerate(errors))
+    errors = [{**errors.get(i, {}), **(item_errors or {}).get(i, {})} for i in range(len(items))]
+
+    if not valid or item_errors:
+        raise ValidationError({"errors": errors})
+    return serializer.validated_data
+
+
+def create(model, items, serializer_class, **fields):
+    """Validates and inserts the items, with `fields` (e.g. author, post) set on every object."""
+    validated = validate(serializer_class, items)
+    objs = [model(**data, **fields) for data in validated]
+    return model.objects.bulk_create(objs, batch_size = get_batch_size())
+
+
+def update(queryset, items, serializer_class, user):
+    """
+    Applies partial updates [{"id": ..., <fields>}, ...] to the objects of `queryset` the user can modify.
+    Only the columns present in some item are written.
+    """
+    item_errors = {}
+    ids = []
+    for index, item in enumerate(items):
+        try:
+            ids.append(int(item.get('id')))
+        except (TypeError, ValueError):
+            ids.append(None)
+            item_errors[index] = {"id": ["A valid integer is required."]}
+
+    objs = queryset.in_bulk([pk for pk in ids if pk is not None])
+    seen = set()
+    for index, pk in enumerate(ids):
+        if pk is None:
+            continue
+        if pk in seen:
+            item_errors[index] = {"id": ["Duplicated id."]}
+        elif pk not in objs:
+            item_errors[index] = {"id": ["Not found."]}
+        elif not can_modify(user, objs[pk]):
+            item_errors[index] = {"id": ["You can't edit another user's content."]}
+        seen.add(pk)
+
+    fields_data = [{k: v for k, v in item.items() if k != 'id'} for item in items]
+    validated = validate(serializer_class, fields_data, partial = True, item_errors = item_errors)
+
+    changed = set()
+    updated = []
+    for pk, data in zip(ids, validated):
+        obj = objs[pk]
+        for field, value in data.items():
+            setattr(obj, field, value)
+        changed.update(data)
+        updated.append(obj)
+
+    # bulk_update doesn't run pre_save(), so auto_now columns are set here
+    auto_now = [f.name for f in queryset.model._meta.concrete_fields if getattr(f, 'auto_now', False)]
+    now = timezone.now()
+    for obj in updated:
+        for field in auto_now:
+            setattr(obj, field, now)
+
+    if changed:
+        queryset.model.objects.bulk_update(updated, [*changed, *auto_now], batch_size = get_batch_size())
+    return updated
+
+
+def delete(queryset, ids, user):
+    """
+    Deletes the objects of `queryset` with the given ids that the user can modify.
+    Returns (results, number of deleted rows per model label) where results holds one {"id", "status"} per id.
+    """
+    objs = {row['id']: row for row in queryset.filter(id__in = ids).values('id', 'author_id')}
+    results = []
+    allowed = []
+    for pk in ids:
+        row = objs.get(pk)
+        if row is None:
+            code = status.HTTP_404_NOT_FOUND
+        elif row['author_id'] != user.id and not user.is_staff:
+            code = status.HTTP_403_FORBIDDEN
+        else:
+            code = status.HTTP_204_NO_CONTENT
+            allowed.append(pk)
+        results.append({"id": pk, "status": code})
+
+    deleted = {}
+    if allowed:
+        _, deleted = queryset.filter(id__in = allowed).delete()
+    return results, deleted
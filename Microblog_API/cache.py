@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Small thread-safe in-process cache with per-entry expiry, used while the shared cache is unreachable."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout if timeout else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last = False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ResponseCache:
+    """
+    Caches serialized response data of anonymous reads in the 'default' cache (Redis in docker-compose).
+
+    Keys are namespaced by a generation token per scope ('posts' for the list, 'post:<id>' for everything
+    shown under one post). Invalidating a scope just replaces its token, so every cached variant of it
+    (each page, ordering, search...) becomes unreachable at once and expires on its own.
+
+    If the shared cache raises (Redis down), the in-process LRU is used instead and the shared cache is
+    not retried for `retry_after` seconds, so an outage doesn't add a connection timeout to every request.
+    """
+    prefix = 'microblog'
+    generation_timeout = 24 * 60 * 60  # An expired generation is simply replaced by a new one
+
+    def __init__(self, alias = 'default', timeout = None, fallback_size = None, retry_after = 5):
+        self.alias = alias
+        self.timeout = timeout
+        self.fallback = LRUCache(fallback_size or getattr(settings, 'RESPONSE_CACHE_FALLBACK_SIZE', 1000))
+        self.retry_after = retry_after
+        self._down_until = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0, 'errors': 0, 'fallback_hits': 0}
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60)
+
+    # Storage, falling back to the LRU
+
+    def _backend_available(self):
+        return time.monotonic() >= self._down_until
+
+    def _backend_failed(self, exc):
+        logger.warning("Response cache unavailable, using the in-process fallback: %s", exc)
+        self._down_until = time.monotonic() + self.retry_after
+        self._count('errors')
+
+    def _get(self, key):
+        if self._backend_available():
+            try:
+                return caches[self.alias].get(key), False
+            except Exception as exc:
+                self._backend_failed(exc)
+        return self.fallback.get(key), True
+
+    def _set(self, key, value, timeout):
+        # The fallback is always written, so it is warm if the shared cache goes away
+        self.fallback.set(key, value, timeout)
+        if self._backend_available():
+            try:
+                caches[self.alias].set(key, value, timeout)
+            except Exception as exc:
+                self._backend_failed(exc)
+
+    # Generations
+
+    def generation(self, scope):
+        key = f'{self.prefix}:gen:{scope}'
+        token, _ = self._get(key)
+        if token is None:
+            token = uuid.uuid4().hex
+            self._set(key, token, self.generation_timeout)
+        return token
+
+    def invalidate(self, *scopes):
+        for scope in scopes:
+            self._set(f'{self.prefix}:gen:{scope}', uuid.uuid4().hex, self.generation_timeout)
+            self._count('invalidations')
+
+    def invalidate_post(self, post_id):
+        self.invalidate('posts', f'post:{post_id}')
+
+    # Responses
+
+    def key_for(self, scope, request, name):
+        # Same parameters in any order, or with empty values, map to the same entry
+        params = sorted((k, v) for k, values in request.query_params.lists() for v in values if v != '')
+        digest = hashlib.sha1(f'{request.get_host()}{request.path}?{urlencode(params)}'.encode('utf-8')).hexdigest()
+        return f'{self.prefix}:{scope}:{self.generation(scope)}:{name}:{digest}'
+
+    def get(self, key):
+        value, from_fallback = self._get(key)
+        if value is None:
+            self._count('misses')
+        else:
+            self._count('hits')
+            if from_fallback:
+                self._count('fallback_hits')
+        return value
+
+    def set(self, key, value):
+        self._set(key, value, self.get_timeout())
+        self._count('sets')
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['backend_available'] = self._backend_available()
+        return stats
+
+
+response_cache = ResponseCache()
+
+
+def cache_anonymous_reads(scope):
+    """
+    Decorator for GET handlers of AllowAny views: anonymous requests are answered from the response cache.
+    `scope` receives the view kwargs and returns the invalidation scope, e.g. lambda kw: f"post:{kw['pk']}".
+    Authenticated requests always reach the view.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return method(self, request, *args, **kwargs)
+
+            key = response_cache.key_for(scope(kwargs), request, method.__name__)
+            data = response_cache.get(key)
+            if data is not None:
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response_cache.set(key, response.data)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,143 @@
+"""
+Conditional GETs of a post and of everything shown under it: /api/posts/<id>/ and its comments, replies and threads.
+
+Post.activity_at moves whenever one of those responses may change: the post is edited (auto_now), its counters
+are adjusted (every comment or like added or removed goes through adjust_counters or the like buffer's flush),
+or one of its comments is edited (touch_post). So the ETag and Last-Modified of all of them come from that
+column alone, and a client sending them back in If-None-Match/If-Modified-Since gets a 304 after a primary key
+lookup, before the response cache, the queries of the view and the serializer run. With LIKE_BUFFER, the likes
+not flushed yet are part of the ETag as well (a hash of the buffered toggles: a like and an unlike by different
+users cancel out in the count, not in the body).
+
+Authenticated responses carry liked_by_me, so their ETag adds the user id and whether the user likes the post,
+read in the same query as activity_at. An anonymous ETag never matches an authenticated response or the other
+way around.
+
+Last-Modified has a one second resolution, so clients should prefer the ETag (If-None-Match wins when both
+are sent).
+"""
+import zlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .likes import Like, get_like_buffer
+from .models import Post
+
+
+def touch_post(post_id):
+    """For changes that don't go through the post's counters, like editing a comment."""
+    Post.objects.filter(id = post_id).update(activity_at = timezone.now())
+
+
+def pending_likes(post_id, user = None):
+    """
+    (hash of the buffered toggles of the post, the user's buffered like state or None), ('0', None) when there
+    are none.
+    """
+    buffer = get_like_buffer()
+    if buffer is None:
+        return '0', None
+    entries = sorted(buffer.store.entries_for_posts([post_id]))
+    if not entries:
+        return '0', None
+    liked = None
+    if user is not None and user.is_authenticated:
+        liked = buffer.pending_states(user.id, [post_id]).get(post_id)
+    return f'{zlib.crc32(repr(entries).encode()):x}', liked
+
+
+def make_validators(post_id, activity_at, pending, format, user_id = None, liked = False):
+    """
+    (ETag, Last-Modified timestamp). The format is in the ETag, the browsable API and JSON are different bodies,
+    and so are the user and their like for authenticated requests.
+    """
+    version = int(activity_at.timestamp() * 1_000_000)
+    viewer = f'-u{user_id}-{int(liked)}' if user_id is not None else ''
+    return f'W/"{post_id}-{version}-{pending}-{format}{viewer}"', int(activity_at.timestamp())
+
+
+def validators_query(post_id, user):
+    """(activity_at, liked by the user) of the post, liked is always False for anonymous users."""
+    if user.is_authenticated:
+        liked = Exists(Like.objects.filter(post_id = OuterRef('pk'), user_id = user.id))
+    else:
+        liked = Value(False, output_field = BooleanField())
+    return Post.objects.filter(id = post_id).annotate(liked = liked).values_list('activity_at', 'liked')
+
+
+def parse_post_id(post_id):
+    try:
+        return int(post_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_validators(post_id, row, pending, format, user):
+    activity_at, liked = row
+    pending, pending_liked = pending
+    if not user.is_authenticated:
+        return make_validators(post_id, activity_at, pending, format)
+    return make_validators(post_id, activity_at, pending, format, user.id, liked if pending_liked is None else pending_liked)
+
+
+def get_validators(post_id, format, user):
+    """Validators of the responses about the post, or None when there is no such post (the view answers the 404)."""
+    post_id = parse_post_id(post_id)
+    if post_id is None:
+        return None
+    row = validators_query(post_id, user).first()
+    if row is None:
+        return None
+    return build_validators(post_id, row, pending_likes(post_id, user), format, user)
+
+
+async def aget_validators(post_id, format, user):
+    post_id = parse_post_id(post_id)
+    if post_id is None:
+        return None
+    row = await validators_query(post_id, user).afirst()
+    if row is None:
+        return None
+    pending = await sync_to_async(pending_likes, thread_sensitive = False)(post_id, user)
+    return build_validators(post_id, row, pending, format, user)
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """The 304 (or 412) answer to the conditional headers of the request, None when the full response is needed."""
+    response = get_conditional_response(request, etag = etag, last_modified = last_modified)
+    if response is not None:
+        add_validators(response, etag, last_modified)
+    return response
+
+
+def conditional_post_reads(post_id):
+    """
+    Decorator for GET handlers of responses about one post. `post_id` receives the view kwargs and returns the
+    id of the post. Goes above cache_anonymous_reads, so a 304 doesn't even look up the cache.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            validators = get_validators(post_id(kwargs), request.accepted_renderer.format, request.user)
+            if validators is None:
+                return method(self, request, *args, **kwargs)
+
+            response = not_modified(request, *validators)
+            if response is not None:
+                return response
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                add_validators(response, *validators)
+            return response
+        return wrapper
+    return decorator
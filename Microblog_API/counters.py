@@ -0,0 +1,117 @@
+from django.db.models import CharField, Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat, Greatest, LPad
+from django.utils import timezone
+from .models import Post, Comment
+from .threads import SEGMENT_WIDTH
+from . import trending
+
+
+def adjust_counters(model, pks, **deltas):
+    """
+    Adds each delta to its counter column with a single UPDATE ... SET col = col + delta, so concurrent
+    requests never overwrite each other. Counters are clamped at 0 in case they already drifted.
+    `pks` is either one primary key or an iterable of them.
+    """
+    if not isinstance(pks, (list, tuple, set, frozenset)):
+        pks = [pks]
+    updates = {
+        field: Greatest(F(field) + delta, Value(0)) if delta < 0 else F(field) + delta
+        for field, delta in deltas.items() if delta
+    }
+    if not updates or not pks:
+        return 0
+    if model is Post:
+        updates['activity_at'] = timezone.now()  # The counters are part of the post's responses (see conditional.py)
+        amount = trending.weight(**deltas)
+        if amount:
+            updates['hot_score'] = trending.score_change(amount)
+    return model.objects.filter(pk__in = pks).update(**updates)
+
+
+def _count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(n = Count('*')).values('n')),
+        Value(0)
+    )
+
+
+def _descendant_count_subquery():
+    # Same range as threads.subtree_filter(), built from the outer row
+    segment = lambda expression: LPad(Cast(expression, CharField()), SEGMENT_WIDTH, Value('0'))
+    return Coalesce(
+        Subquery(
+            Comment.objects.filter(
+                post = OuterRef('post'),
+                path__gte = Concat(OuterRef('path'), segment(OuterRef('id'))),
+                path__lt = Concat(OuterRef('path'), segment(OuterRef('id') + 1)),
+            ).order_by().values('post').annotate(n = Count('*')).values('n')
+        ),
+        Value(0)
+    )
+
+
+def _reconcile(model, counters, batch_size, touch = None):
+    """
+    Recomputes `counters` ({column: actual-count expression}) over pk ranges and rewrites only the rows that drifted.
+    `touch` names a timestamp column set to now on those rows.
+    """
+    fixed = 0
+    last_pk = 0
+    while True:
+        pks = list(model.objects.filter(pk__gt = last_pk).order_by('pk').values_list('pk', flat = True)[:batch_size])
+        if not pks:
+            return fixed
+
+        rows = (
+            model.objects.filter(pk__gte = pks[0], pk__lte = pks[-1])
+            .annotate(**{f'actual_{column}': expression for column, expression in counters.items()})
+        )
+        drifted = []
+        for row in rows:
+            changed = False
+            for column in counters:
+                actual = getattr(row, f'actual_{column}')
+                if getattr(row, column) != actual:
+                    setattr(row, column, actual)
+                    changed = True
+            if changed:
+                if touch:
+                    setattr(row, touch, timezone.now())
+                drifted.append(row)
+
+        if drifted:
+            model.objects.bulk_update(drifted, [*counters, *([touch] if touch else [])])
+            fixed += len(drifted)
+        last_pk = pks[-1]
+
+
+def post_counters():
+    """{counter column: expression of its actual value} of Post"""
+    return {
+        'like_count': _count_subquery(Post.likes.through.objects.all(), 'post'),
+        'comment_count': _count_subquery(Comment.objects.all(), 'post'),
+    }
+
+
+def comment_counters():
+    return {
+        'like_count': _count_subquery(Comment.likes.through.objects.all(), 'comment'),
+        'reply_count': _count_subquery(Comment.objects.all(), 'parent'),
+        'descendant_count': _descendant_count_subquery(),
+    }
+
+
+def reconcile_post_counters(batch_size = 1000):
+    return _reconcile(Post, post_counters(), batch_size, touch = 'activity_at')
+
+
+def reconcile_comment_counters(batch_size = 1000):
+    return _reconcile(Comment, comment_counters(), batch_size)
+
+
+def recount(model, counters, first_pk, last_pk):
+    """
+    Sets `counters` on a pk range with one UPDATE, computed by the database and without reading the rows.
+    For rows written in bulk (see Microblog_API/seeding.py), which have no counts at all yet.
+    """
+    return model.objects.filter(pk__gte = first_pk, pk__lte = last_pk).update(**counters)
@@ -7,4 +7,4 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         
-        return obj.author == request.user
\ No newline at end of file
+        return obj.author_id == request.user.id
\ No newline at end of file
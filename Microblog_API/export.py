@@ -0,0 +1,73 @@
+"""
+Streaming exports (/api/posts/export/ and /api/posts/<id>/comments/export/).
+
+The rows are read with QuerySet.iterator() (a server-side cursor on Postgres) and serialized and sent
+EXPORT_CHUNK_SIZE at a time through a StreamingHttpResponse, so memory stays bounded whatever the number
+of rows and the client starts receiving data right away. The body is a JSON array, or one JSON object per
+line with ?format=ndjson (or Accept: application/x-ndjson).
+"""
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from .renderers import ORJSONRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Selects the NDJSON body through content negotiation. Only renders error responses, exports stream themselves."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type = None, renderer_context = None):
+        return ORJSONRenderer().render(data) + b'\n'
+
+
+renderer_classes = [ORJSONRenderer, NDJSONRenderer]
+
+
+def get_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def rendered_chunks(queryset, serializer_class, ndjson = False, prepare = None):
+    """Yields the body of the export, one piece per chunk of rows. `prepare` receives each chunk before it's serialized."""
+    chunk_size = get_chunk_size()
+    renderer = ORJSONRenderer()
+    serializer = serializer_class()
+    rows = queryset.iterator(chunk_size = chunk_size)
+
+    separator = b'\n' if ndjson else b','
+    first = True
+    if not ndjson:
+        yield b'['
+    while chunk := list(islice(rows, chunk_size)):
+        if prepare:
+            prepare(chunk)
+        body = separator.join(renderer.render(serializer.to_representation(row)) for row in chunk)
+        if ndjson:
+            yield body + b'\n'
+        else:
+            yield body if first else b',' + body
+        first = False
+    if not ndjson:
+        yield b']'
+
+
+async def aiterate(iterator):
+    # Under ASGI, Django would read a sync iterator into a list before sending it. Every chunk is produced
+    # on the request's thread, where the database cursor lives.
+    get_next = sync_to_async(lambda: next(iterator, None))
+    while (chunk := await get_next()) is not None:
+        yield chunk
+
+
+def streaming_response(request, queryset, serializer_class, prepare = None):
+    ndjson = request.accepted_renderer.format == NDJSONRenderer.format
+    content = rendered_chunks(queryset, serializer_class, ndjson = ndjson, prepare = prepare)
+    if isinstance(request._request, ASGIRequest):
+        content = aiterate(content)
+    return StreamingHttpResponse(content, content_type = request.accepted_renderer.media_type)
@@ -0,0 +1,147 @@
+import logging
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from .jobs import enqueue, job
+from .models import Post, Follow, FeedEntry
+from .pagination import KeysetPagination
+from .serializers import PostSerializer
+
+logger = logging.getLogger(__name__)
+
+CELEBRITIES_CACHE_KEY = 'microblog:feed:celebrities'
+
+
+def get_fanout_threshold():
+    return getattr(settings, 'FEED_FANOUT_THRESHOLD', 10000)
+
+
+def celebrity_ids():
+    """
+    Ids of the authors with at least FEED_FANOUT_THRESHOLD followers. Their new posts are not copied into every
+    follower's timeline but marked as pulled, and readers pull them at read time instead. Cached, so it's only
+    computed again every FEED_CELEBRITIES_CACHE_TIMEOUT seconds.
+    """
+    def compute():
+        return frozenset(
+            Follow.objects.values('followee').annotate(n = Count('id'))
+            .filter(n__gte = get_fanout_threshold()).values_list('followee', flat = True)
+        )
+
+    timeout = getattr(settings, 'FEED_CELEBRITIES_CACHE_TIMEOUT', 300)
+    try:
+        return cache.get_or_set(CELEBRITIES_CACHE_KEY, compute, timeout)
+    except Exception as exc:
+        logger.warning("Could not read the celebrities set from the cache: %s", exc)
+        return compute()
+
+
+def fan_out(posts):
+    """
+    Copies each post into the timelines of its author and the author's followers (fan-out on write). Posts of
+    celebrities only go to their author's, and are marked as pulled: they stay pulled by the followers even
+    after the author drops under the threshold.
+    """
+    batch_size = getattr(settings, 'FEED_FANOUT_BATCH_SIZE', 1000)
+    celebrities = celebrity_ids()
+
+    posts_by_author = defaultdict(list)
+    for post in posts:
+        posts_by_author[post.author_id].append(post)
+
+    for author_id, author_posts in posts_by_author.items():
+        readers = [author_id]
+        if author_id not in celebrities:
+            readers += list(Follow.objects.filter(followee_id = author_id).values_list('follower_id', flat = True))
+        else:
+            Post.objects.filter(id__in = [post.id for post in author_posts]).update(pulled = True)
+
+        entries = (
+            FeedEntry(user_id = user_id, post_id = post.id, author_id = author_id, created_at = post.created_at)
+            for post in author_posts for user_id in readers
+        )
+        while batch := list(islice(entries, batch_size)):
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts = True)
+
+
+def queue_fan_out(posts):
+    """Queues fan_out() of the new posts as a background job (see jobs.py), so their authors don't wait for it."""
+    post_ids = [post.id for post in posts]
+    if post_ids:
+        enqueue(fan_out_posts, post_ids, key = f'fan_out:{post_ids[0]}:{len(post_ids)}')
+
+
+@job
+def fan_out_posts(post_ids):
+    """Job: fan_out() of the posts that weren't deleted in the meantime."""
+    fan_out(Post.objects.filter(id__in = post_ids).order_by().only('id', 'author_id', 'created_at'))
+
+
+def follow(follower_id, followee_id):
+    """Creates the follow and queues the backfill of the follower's timeline. Returns False if it already existed."""
+    created_follow, created = Follow.objects.get_or_create(follower_id = follower_id, followee_id = followee_id)
+    if not created:
+        return False
+    enqueue(backfill, follower_id, followee_id, key = f'backfill:{created_follow.id}')
+    return True
+
+
+@job
+def backfill(follower_id, followee_id):
+    """Job: copies the followee's latest posts into the follower's timeline, unless they unfollowed in the meantime."""
+    if not Follow.objects.filter(follower_id = follower_id, followee_id = followee_id).exists():
+        return
+    recent = Post.objects.filter(author_id = followee_id).order_by('-created_at', '-id').values_list('id', 'created_at')
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id = follower_id, post_id = post_id, author_id = followee_id, created_at = created_at)
+            for post_id, created_at in recent[:getattr(settings, 'FEED_BACKFILL_SIZE', 50)]
+        ],
+        ignore_conflicts = True
+    )
+
+
+def unfollow(follower_id, followee_id):
+    """Deletes the follow and the followee's posts from the follower's timeline. Returns False if there was nothing to delete."""
+    deleted, _ = Follow.objects.filter(follower_id = follower_id, followee_id = followee_id).delete()
+    FeedEntry.objects.filter(user_id = follower_id, author_id = followee_id).delete()
+    return bool(deleted)
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Pages through a user's timeline, merging two sources that are both read in (created_at, id) order:
+    the materialized FeedEntry rows and the pulled posts (written by celebrities) of the followed authors.
+    Each source is read with LIMIT page_size + 1 from its index, so a page costs O(page size) however many
+    accounts the user follows. Only forward paging is supported.
+    """
+    ordering = ('-created_at', '-id')
+
+    def paginate_feed(self, user_id, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering_fields(Post.objects.order_by(*self.ordering))
+        position, self.reverse = self.decode_cursor(request)
+        self.has_cursor = False  # No 'previous' link
+        self.reverse = False
+
+        limit = self.page_size + 1
+        entries = FeedEntry.objects.filter(user_id = user_id)
+        pulled = Post.objects.filter(
+            pulled = True, author_id__in = Follow.objects.filter(follower_id = user_id).values('followee_id')
+        )
+        if position is not None:
+            created_at, post_id = position
+            entries = entries.filter(Q(created_at__lt = created_at) | Q(created_at = created_at, post_id__lt = post_id), created_at__lte = created_at)
+            pulled = pulled.filter(Q(created_at__lt = created_at) | Q(created_at = created_at, id__lt = post_id), created_at__lte = created_at)
+
+        candidates = set(entries.order_by('-created_at', '-post').values_list('created_at', 'post_id')[:limit])
+        candidates |= set(pulled.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit])
+        ids = [post_id for _, post_id in sorted(candidates, reverse = True)[:limit]]
+
+        posts = Post.objects.select_related('author').only(*PostSerializer.read_columns).in_bulk(ids)
+        return self.build_page([posts[post_id] for post_id in ids if post_id in posts])
@@ -0,0 +1,250 @@
+"""
+Per request instrumentation (InstrumentationMiddleware): latency, SQL queries (count and time), serialization
+and rendering time and response size of every request, by route.
+
+- Server-Timing header (SERVER_TIMING setting): db;dur=..;desc="N queries", serialize, render and total, shown
+  by the network tab of the browser's devtools.
+- Histograms in the Prometheus text format at /metrics. Open with DEBUG, otherwise only with
+  "Authorization: Bearer <METRICS_TOKEN>" (and a 404 when METRICS_TOKEN isn't set).
+- Requests slower than SLOW_REQUEST_THRESHOLD seconds are logged with their SQL statements and their times.
+
+Queries are counted by an execute wrapper (connection.execute_wrapper) added to every database connection
+when it's opened. It adds them to the metrics of the request being served, found in a ContextVar, so it
+follows the request into the sync_to_async threads of the async views. Outside of requests (management
+commands, the like buffer flush loop) it costs a ContextVar lookup.
+
+The histograms live in the worker process: with several gunicorn/uvicorn workers each one exposes its own,
+so Prometheus has to scrape the workers rather than the load balancer.
+"""
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import accumulate
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Prometheus histogram: observation counts per bucket, sum and count, for every combination of labels."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(float(bound) for bound in buckets)
+        self._series = {}  # label values -> [counts per bucket (not cumulative, +Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)  # First bucket with value <= le
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self, label_values):
+        """{le: cumulative count} of one series, for tests and the exposition below."""
+        with self._lock:
+            series = self._series.get(label_values)
+            counts = list(series[0]) if series else [0] * (len(self.buckets) + 1)
+        bounds = [*map(repr, self.buckets), '+Inf']
+        return dict(zip(bounds, accumulate(counts)))
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((values, list(counts), total) for values, (counts, total) in self._series.items())
+        for values, counts, total in series:
+            labels = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labels, values))
+            cumulative = list(accumulate(counts))
+            for bound, count in zip([*map(repr, self.buckets), '+Inf'], cumulative):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total!r}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative[-1]}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'microblog_http_request_duration_seconds', 'Time to produce the response.',
+    ('route', 'method', 'status'), LATENCY_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'microblog_http_request_db_queries', 'SQL queries run by a request.', ('route', 'method'), QUERY_BUCKETS
+)
+DB_DURATION = Histogram(
+    'microblog_http_request_db_duration_seconds', 'Time spent running the SQL queries of a request.',
+    ('route', 'method'), LATENCY_BUCKETS
+)
+SERIALIZE_DURATION = Histogram(
+    'microblog_http_request_serialize_duration_seconds', 'Time spent in the serializers and renderers of a request.',
+    ('route', 'method'), LATENCY_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    'microblog_http_response_size_bytes', 'Size of the response body (streaming responses are left out).',
+    ('route', 'method'), SIZE_BUCKETS
+)
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZE_DURATION, RESPONSE_SIZE)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'db_time', 'statements', 'keep_statements', 'phases')
+
+    def __init__(self, keep_statements = 0):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = []  # (sql, seconds), only for the slow request log
+        self.keep_statements = keep_statements
+        self.phases = {'serialize': 0.0, 'render': 0.0}
+
+
+_current = ContextVar('request_metrics', default = None)
+
+
+def start_request():
+    """Starts collecting the metrics of a request: (metrics, token for end_request)."""
+    threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD', None)
+    keep = getattr(settings, 'SLOW_REQUEST_MAX_STATEMENTS', 100) if threshold is not None else 0
+    metrics = RequestMetrics(keep)
+    return metrics, _current.set(metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.db_time += elapsed
+        if len(metrics.statements) < metrics.keep_statements:
+            metrics.statements.append((sql, elapsed))
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Sent again every time the connection reconnects, the wrapper list outlives it
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(phase):
+    """Adds the time spent in the block to a phase of the current request ('serialize' or 'render')."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[phase] += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    """Times .data, where a serializer builds its representation."""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """list_serializer_class of the timed serializers, for many = True."""
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def finish_request(request, response, metrics):
+    """Observes the histograms, adds Server-Timing and logs the request when it was slow."""
+    total = time.perf_counter() - metrics.started
+    serialize = metrics.phases['serialize'] + metrics.phases['render']
+    route = route_of(request)
+    method = request.method
+
+    REQUEST_DURATION.observe(total, route, method, str(response.status_code))
+    DB_QUERIES.observe(metrics.queries, route, method)
+    DB_DURATION.observe(metrics.db_time, route, method)
+    SERIALIZE_DURATION.observe(serialize, route, method)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(len(response.content), route, method)
+
+    if getattr(settings, 'SERVER_TIMING', True):
+        response['Server-Timing'] = server_timing(metrics, total)
+
+    threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD', None)
+    if threshold is not None and total >= threshold:
+        log_slow_request(request, response, metrics, total)
+    return response
+
+
+def server_timing(metrics, total):
+    return ', '.join([
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'serialize;dur={metrics.phases["serialize"] * 1000:.1f}',
+        f'render;dur={metrics.phases["render"] * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+
+def log_slow_request(request, response, metrics, total):
+    lines = [f'{elapsed * 1000:8.1f} ms  {sql}' for sql, elapsed in metrics.statements]
+    if metrics.queries > len(metrics.statements):
+        lines.append(f'... and {metrics.queries - len(metrics.statements)} more')
+    logger.warning(
+        "Slow request: %s %s -> %s in %.1f ms, %d queries in %.1f ms%s",
+        request.method, request.get_full_path(), response.status_code, total * 1000,
+        metrics.queries, metrics.db_time * 1000, ''.join(f'\n{line}' for line in lines)
+    )
+
+
+def expose():
+    return '\n'.join(line for histogram in HISTOGRAMS for line in histogram.expose()) + '\n'
+
+
+def metrics_view(request):
+    """GET /metrics, the histograms of this worker process in the Prometheus text format."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+            return HttpResponse(status = 401, headers = {'WWW-Authenticate': 'Bearer'})
+    elif not settings.DEBUG:
+        raise Http404()
+    return HttpResponse(expose(), content_type = 'text/plain; version=0.0.4; charset=utf-8')
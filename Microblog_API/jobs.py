@@ -0,0 +1,160 @@
+"""
+Background jobs: side effects that don't have to happen before the response (fan-out, timeline backfills...)
+are queued and run by 'manage.py run_worker', so their cost stays out of the request's latency.
+
+- Jobs are rows of the Job table. Enqueuing is an INSERT in the caller's transaction: the job exists if and
+  only if the write that queued it was committed, and the worker can't see it before.
+- Functions are marked with @job and enqueued by import path, with JSON arguments, e.g.
+  `enqueue(backfill, follower_id, followee_id, key = f'backfill:{follow.id}')`. A job with the `key` of an
+  existing one (pending or finished within JOBS_RETENTION) isn't queued again.
+- Workers claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can run side by side.
+  A failed job is retried after JOBS_RETRY_BACKOFF seconds, doubled on every attempt (with jitter), until it
+  fails max_attempts times. Jobs left running by a worker that died are retried after JOBS_LOCK_TIMEOUT.
+- A worker renews a job's lock (locked_at) right before running it, and records the outcome only while it still
+  holds that lock. A job released in the meantime is left to whoever claimed it next.
+- Jobs run at least once, so they must be safe to run again (they mostly write with ignore_conflicts).
+- With JOBS_EAGER (development and tests) enqueue() runs the function right away instead, and its errors
+  propagate to the caller.
+"""
+import json
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def job(function = None, *, max_attempts = None):
+    """Marks a module-level function as runnable by the workers (@job or @job(max_attempts = 3))."""
+    def mark(function):
+        function.is_job = True
+        function.max_attempts = max_attempts
+        return function
+    return mark(function) if function is not None else mark
+
+
+def name_of(function):
+    return f'{function.__module__}.{function.__qualname__}'
+
+
+def enqueue(function, *args, key = None, delay = 0, **kwargs):
+    """Queues function(*args, **kwargs) to run in `delay` seconds. Returns the Job (None in eager mode)."""
+    if not getattr(function, 'is_job', False):
+        raise ValueError(f"{name_of(function)} isn't marked with @job")
+
+    if getattr(settings, 'JOBS_EAGER', False):
+        args, kwargs = json.loads(json.dumps([args, kwargs]))  # What the worker would receive
+        function(*args, **kwargs)
+        return None
+
+    fields = {
+        'name': name_of(function),
+        'args': list(args),
+        'kwargs': kwargs,
+        'max_attempts': function.max_attempts or getattr(settings, 'JOBS_MAX_ATTEMPTS', 5),
+        'run_at': timezone.now() + timedelta(seconds = delay),
+    }
+    if key is None:
+        return Job.objects.create(**fields)
+    queued, _ = Job.objects.get_or_create(key = key, defaults = fields)
+    return queued
+
+
+def get_backoff(attempts):
+    """Seconds before retrying a job that failed `attempts` times."""
+    base = getattr(settings, 'JOBS_RETRY_BACKOFF', 10)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOBS_RETRY_BACKOFF_MAX', 3600))
+    return delay * random.uniform(0.5, 1.0)  # Jitter, so jobs that failed together don't all retry together
+
+
+def release_stale():
+    """Puts back the jobs whose worker died while running them (failing those that used all their attempts)."""
+    stale = Job.objects.filter(status = Job.RUNNING, locked_at__lt = timezone.now() - timedelta(seconds = getattr(settings, 'JOBS_LOCK_TIMEOUT', 600)))
+    failed = stale.filter(attempts__gte = F('max_attempts')).update(status = Job.FAILED, finished_at = timezone.now(), last_error = "Worker lost")
+    return failed + stale.update(status = Job.PENDING)
+
+
+def claim(batch_size):
+    """Marks up to `batch_size` due jobs as running and returns them."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.filter(status = Job.PENDING, run_at__lte = now).order_by('run_at', 'id')
+            .select_for_update(skip_locked = True)[:batch_size]
+        )
+        Job.objects.filter(pk__in = [queued.pk for queued in jobs]).update(status = Job.RUNNING, locked_at = now, attempts = F('attempts') + 1)
+    for queued in jobs:
+        queued.status, queued.locked_at = Job.RUNNING, now
+        queued.attempts += 1
+    return jobs
+
+
+class LockLost(Exception):
+    pass
+
+
+def owned(queued):
+    """The job, as long as it's still running under the lock this worker holds."""
+    return Job.objects.filter(pk = queued.pk, status = Job.RUNNING, locked_at = queued.locked_at)
+
+
+def renew(queued):
+    """Moves the job's lock to now, so the JOBS_LOCK_TIMEOUT counts from here. Returns False if it was lost."""
+    now = timezone.now()
+    if not owned(queued).update(locked_at = now):
+        return False
+    queued.locked_at = now
+    return True
+
+
+def run(queued):
+    """Runs a claimed job and records the outcome. Returns True if it succeeded."""
+    # Later jobs of a batch wait for the earlier ones, meanwhile release_stale() may have handed them to another worker
+    if not renew(queued):
+        logger.warning("Job %s #%s was released before it ran, skipping it", queued.name, queued.pk)
+        return False
+    try:
+        function = import_string(queued.name)
+        if not getattr(function, 'is_job', False):
+            raise ValueError(f"{queued.name} isn't marked with @job")
+        with transaction.atomic():
+            function(*queued.args, **queued.kwargs)
+            # In the same transaction, so the work of a job that was released while running is undone
+            if not owned(queued).update(status = Job.DONE, finished_at = timezone.now(), locked_at = None):
+                raise LockLost
+    except LockLost:
+        logger.warning("Job %s #%s was released while running, discarding its result", queued.name, queued.pk)
+        return False
+    except Exception:
+        logger.exception("Job %s #%s failed (attempt %s of %s)", queued.name, queued.pk, queued.attempts, queued.max_attempts)
+        outcome = {'last_error': traceback.format_exc()[-4000:], 'locked_at': None}
+        if queued.attempts >= queued.max_attempts:
+            outcome.update(status = Job.FAILED, finished_at = timezone.now())
+        else:
+            outcome.update(status = Job.PENDING, run_at = timezone.now() + timedelta(seconds = get_backoff(queued.attempts)))
+        owned(queued).update(**outcome)
+        return False
+    return True
+
+
+def run_pending(batch_size = 100):
+    """Claims and runs one batch of due jobs. Returns how many were run."""
+    jobs = claim(batch_size)
+    for queued in jobs:
+        run(queued)
+    return len(jobs)
+
+
+def purge():
+    """Deletes the jobs that finished more than JOBS_RETENTION seconds ago (failed ones included). Returns how many."""
+    before = timezone.now() - timedelta(seconds = getattr(settings, 'JOBS_RETENTION', 7 * 24 * 3600))
+    deleted, _ = Job.objects.filter(status__in = [Job.DONE, Job.FAILED], finished_at__lt = before).delete()
+    return deleted
@@ -0,0 +1,436 @@
+"""
+Write-behind buffering of like toggles (enabled with the LIKE_BUFFER setting).
+
+PostViewSet.like normally writes the likes table in its own transaction for every click. With a buffer,
+a toggle only records the wanted state of the (user, post) pair, and repeated toggles of the same pair
+collapse into one entry (or none, if the user ends where the database already is). Entries are flushed
+in bulk: one bulk_create(ignore_conflicts=True) for the added likes, batched deletes for the removed
+ones, and a single recount of like_count for the affected posts.
+
+Every entry is stored as (base, desired): `base` is the state the toggle was computed from and `desired`
+the state the user asked for. Reads add the pending deltas (desired - base) to what the database says,
+so clients see their like immediately.
+
+While a flush runs, its entries move to an "in flight" area that reads still take into account, so a
+like never disappears between the moment it leaves the buffer and the moment it is committed. If the
+flush fails, the in-flight entries are retried by the next one.
+
+LIKE_BUFFER = 'memory' keeps the entries in the process, so it's only for single-process deployments (runserver,
+one worker): with several workers, toggles of the same pair on different workers would conflict. Its buffer is
+flushed by a background thread every LIKE_BUFFER_FLUSH_INTERVAL seconds and when the process exits, so the
+last toggles are written even if no other request comes. Use 'redis' with more than one worker.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Post
+from . import trending
+
+logger = logging.getLogger(__name__)
+
+Like = Post.likes.through
+
+
+class InProcessLikeStore:
+    """Buffer local to the process (single process only). Pending likes are lost if it's killed before a flush."""
+
+    def __init__(self):
+        self._pending = {}  # (user_id, post_id) -> (base, desired)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def toggle(self, user_id, post_id, load_state):
+        key = (user_id, post_id)
+        db_state = None
+        while True:
+            with self._lock:
+                if key in self._pending:
+                    base, current = self._pending[key]
+                elif key in self._inflight:
+                    base = current = self._inflight[key][1]
+                elif db_state is not None:
+                    base = current = db_state
+                else:
+                    base = None
+
+                if base is not None:
+                    desired = not current
+                    if desired == base:
+                        del self._pending[key]
+                    else:
+                        self._pending[key] = (base, desired)
+                    return desired
+
+            db_state = load_state()  # Outside the lock, it queries the database
+
+    def lock(self):
+        return self._flush_lock
+
+    def begin_flush(self):
+        with self._lock:
+            for key, (base, desired) in self._pending.items():
+                if key in self._inflight:
+                    base = self._inflight[key][0]
+                self._inflight[key] = (base, desired)
+            self._pending = {}
+            return dict(self._inflight)
+
+    def end_flush(self):
+        with self._lock:
+            self._inflight = {}
+
+    def entries_for_posts(self, post_ids):
+        post_ids = set(post_ids)
+        with self._lock:
+            return [
+                (user_id, post_id, base, desired)
+                for area in (self._inflight, self._pending)
+                for (user_id, post_id), (base, desired) in area.items()
+                if post_id in post_ids
+            ]
+
+    def size(self):
+        with self._lock:
+            return len({post_id for _, post_id in self._pending})
+
+
+class RedisLikeStore:
+    """
+    Buffer shared by every worker, kept in one Redis hash per post ({user_id: "<base><desired>"}).
+    Toggles and flush hand-offs run as Lua scripts, so concurrent workers can't interleave them.
+    """
+    prefix = 'microblog:likes'
+
+    # KEYS: pending hash, in-flight hash, dirty set. ARGV: user id, post id, base state ('' if unknown).
+    # Returns the new state, or -1 when the caller has to read the base state from the database first.
+    TOGGLE = """
+        local entry = redis.call('HGET', KEYS[1], ARGV[1])
+        local base, current
+        if entry then
+            base = string.sub(entry, 1, 1)
+            current = string.sub(entry, 2, 2)
+        else
+            local inflight = redis.call('HGET', KEYS[2], ARGV[1])
+            if inflight then
+                base = string.sub(inflight, 2, 2)
+            elseif ARGV[3] ~= '' then
+                base = ARGV[3]
+            else
+                return -1
+            end
+            current = base
+        end
+        local desired = current == '1' and '0' or '1'
+        if desired == base then
+            redis.call('HDEL', KEYS[1], ARGV[1])
+        else
+            redis.call('HSET', KEYS[1], ARGV[1], base .. desired)
+            redis.call('SADD', KEYS[3], ARGV[2])
+        end
+        return tonumber(desired)
+    """
+
+    # KEYS: pending hash, in-flight hash, dirty set, in-flight set. ARGV: post id.
+    # Merges the pending entries into the in-flight ones, keeping the older base.
+    BEGIN_FLUSH = """
+        local entries = redis.call('HGETALL', KEYS[1])
+        for i = 1, #entries, 2 do
+            local inflight = redis.call('HGET', KEYS[2], entries[i])
+            local base = inflight and string.sub(inflight, 1, 1) or string.sub(entries[i + 1], 1, 1)
+            redis.call('HSET', KEYS[2], entries[i], base .. string.sub(entries[i + 1], 2, 2))
+        end
+        redis.call('DEL', KEYS[1])
+        redis.call('SREM', KEYS[3], ARGV[1])
+        redis.call('SADD', KEYS[4], ARGV[1])
+    """
+
+    def __init__(self, url):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self._toggle = self.redis.register_script(self.TOGGLE)
+        self._begin_flush = self.redis.register_script(self.BEGIN_FLUSH)
+
+    def lock(self):
+        # Only one worker may move entries in and out of the in-flight area at a time
+        return self.redis.lock(f'{self.prefix}:flush', timeout = 60)
+
+    def _keys(self, post_id):
+        return f'{self.prefix}:pending:{post_id}', f'{self.prefix}:inflight:{post_id}'
+
+    def toggle(self, user_id, post_id, load_state):
+        pending, inflight = self._keys(post_id)
+        keys = [pending, inflight, f'{self.prefix}:dirty']
+        desired = self._toggle(keys = keys, args = [user_id, post_id, ''])
+        if desired == -1:
+            desired = self._toggle(keys = keys, args = [user_id, post_id, '1' if load_state() else '0'])
+        return bool(desired)
+
+    def begin_flush(self):
+        for post_id in self.redis.smembers(f'{self.prefix}:dirty'):
+            post_id = int(post_id)
+            self._begin_flush(
+                keys = [*self._keys(post_id), f'{self.prefix}:dirty', f'{self.prefix}:inflight'],
+                args = [post_id]
+            )
+        post_ids = [int(post_id) for post_id in self.redis.smembers(f'{self.prefix}:inflight')]
+        return {
+            (user_id, post_id): (base, desired)
+            for user_id, post_id, base, desired in self._read(post_ids, inflight_only = True)
+        }
+
+    def end_flush(self):
+        post_ids = [int(post_id) for post_id in self.redis.smembers(f'{self.prefix}:inflight')]
+        pipe = self.redis.pipeline()
+        for post_id in post_ids:
+            pipe.delete(self._keys(post_id)[1])
+        pipe.delete(f'{self.prefix}:inflight')
+        pipe.execute()
+
+    def _read(self, post_ids, inflight_only = False):
+        post_ids = list(post_ids)
+        pipe = self.redis.pipeline()
+        for post_id in post_ids:
+            pending, inflight = self._keys(post_id)
+            pipe.hgetall(inflight)
+            if not inflight_only:
+                pipe.hgetall(pending)
+        results = iter(pipe.execute())
+
+        entries = []
+        for post_id in post_ids:
+            for area in [next(results)] if inflight_only else [next(results), next(results)]:
+                for user_id, value in area.items():
+                    value = value.decode()
+                    entries.append((int(user_id), post_id, value[0] == '1', value[1] == '1'))
+        return entries
+
+    def entries_for_posts(self, post_ids):
+        return self._read(post_ids)
+
+    def size(self):
+        return self.redis.scard(f'{self.prefix}:dirty')
+
+
+class LikeBuffer:
+    def __init__(self, store, mode):
+        self.store = store
+        self.mode = mode
+        self._last_flush = time.monotonic()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def toggle(self, user_id, post_id):
+        """Records a like toggle and returns True if the post is now liked by the user."""
+        liked = self.store.toggle(
+            user_id, post_id,
+            lambda: Like.objects.filter(post_id = post_id, user_id = user_id).exists()
+        )
+        self.flush_if_due()
+        return liked
+
+    def flush_if_due(self):
+        interval = getattr(settings, 'LIKE_BUFFER_FLUSH_INTERVAL', 1.0)
+        max_pending = getattr(settings, 'LIKE_BUFFER_MAX_PENDING', 1000)
+        if time.monotonic() - self._last_flush >= interval or self.store.size() >= max_pending:
+            self.try_flush()
+
+    def try_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            # The entries stay in flight and are retried by the next flush, the toggle itself was recorded
+            logger.exception("Could not flush the like buffer")
+
+    def is_configured(self):
+        return getattr(settings, 'LIKE_BUFFER', None) == self.mode
+
+    def start_flusher(self):
+        """
+        Flushes every LIKE_BUFFER_FLUSH_INTERVAL seconds in a daemon thread, and once more when the process exits,
+        for stores whose entries live in the process. Neither flushes while LIKE_BUFFER names another store.
+        """
+        def loop():
+            while not self._stopped.wait(getattr(settings, 'LIKE_BUFFER_FLUSH_INTERVAL', 1.0)):
+                if self.is_configured():
+                    close_old_connections()  # The thread keeps its connection between flushes, as a request would
+                    self.try_flush()
+
+        self._flusher = threading.Thread(target = loop, name = 'like-buffer-flusher', daemon = True)
+        self._flusher.start()
+        atexit.register(self.flush_at_exit)
+
+    def flush_at_exit(self):
+        if self.is_configured():
+            self.try_flush()
+
+    def stop(self):
+        self._stopped.set()
+        atexit.unregister(self.flush_at_exit)
+
+    def flush(self):
+        """Writes the buffered toggles to the database. Returns the number of (user, post) pairs written."""
+        lock = self.store.lock()
+        if not lock.acquire(blocking = False):
+            return 0  # Someone else is already flushing
+        try:
+            self._last_flush = time.monotonic()
+            entries = self.store.begin_flush()
+            changes = [(user_id, post_id, desired) for (user_id, post_id), (base, desired) in entries.items() if base != desired]
+            if changes:
+                write_likes(changes)
+            self.store.end_flush()
+            return len(changes)
+        finally:
+            lock.release()
+
+    # Reads
+
+    def pending_deltas(self, post_ids):
+        """{post_id: likes to add to the stored like_count}"""
+        deltas = defaultdict(int)
+        for user_id, post_id, base, desired in self.store.entries_for_posts(post_ids):
+            deltas[post_id] += int(desired) - int(base)
+        return deltas
+
+    def pending_users(self, post_id):
+        """(user ids whose like is pending, user ids whose unlike is pending) for one post"""
+        states = {}
+        for user_id, _, base, desired in self.store.entries_for_posts([post_id]):
+            states[user_id] = desired  # The pending entry comes after the in-flight one
+        added = {user_id for user_id, liked in states.items() if liked}
+        return added, set(states) - added
+
+    def pending_states(self, user_id, post_ids):
+        """{post_id: liked} for the posts among post_ids whose like by user_id is pending"""
+        return {
+            post_id: desired
+            for entry_user_id, post_id, _, desired in self.store.entries_for_posts(post_ids)
+            if entry_user_id == user_id
+        }
+
+    def apply_to(self, posts):
+        """Adds the pending likes to the like_count of already loaded posts."""
+        posts = [post for post in posts if post is not None]
+        if not posts:
+            return posts
+        deltas = self.pending_deltas([post.id for post in posts])
+        for post in posts:
+            post.like_count = max(post.like_count + deltas.get(post.id, 0), 0)
+        return posts
+
+
+def write_likes(changes, batch_size = 1000):
+    """
+    Applies [(user_id, post_id, liked), ...] to the likes table in bulk and recounts like_count
+    (and moves hot_score) of the touched posts in one UPDATE.
+    """
+    adds = [Like(user_id = user_id, post_id = post_id) for user_id, post_id, liked in changes if liked]
+    removes = [Q(user_id = user_id, post_id = post_id) for user_id, post_id, liked in changes if not liked]
+    post_ids = {post_id for _, post_id, _ in changes}
+
+    with transaction.atomic():
+        Like.objects.bulk_create(adds, batch_size = batch_size, ignore_conflicts = True)
+        for start in range(0, len(removes), batch_size):
+            Like.objects.filter(reduce(or_, removes[start:start + batch_size])).delete()
+
+        # The trending scores move by the net toggles of each post (they are all real toggles, see flush())
+        amounts = defaultdict(int)
+        for _, post_id, liked in changes:
+            amounts[post_id] += trending.weight(like_count = 1 if liked else -1)
+        change = trending.score_changes(amounts)
+        scores = {'hot_score': change} if change is not None else {}
+
+        likes = Like.objects.filter(post_id = OuterRef('pk')).values('post_id').annotate(n = Count('*')).values('n')
+        Post.objects.filter(pk__in = post_ids).update(
+            like_count = Coalesce(Subquery(likes), Value(0)), activity_at = timezone.now(), **scores
+        )
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_like_buffer():
+    """Returns the configured LikeBuffer, or None when likes are written synchronously (LIKE_BUFFER = None)."""
+    global _buffer
+    mode = getattr(settings, 'LIKE_BUFFER', None)
+    if not mode:
+        return None
+
+    with _buffer_lock:
+        if _buffer is None or _buffer.mode != mode:
+            if _buffer is not None:
+                _buffer.stop()
+            if mode == 'memory':
+                store = InProcessLikeStore()
+            elif mode == 'redis':
+                if not settings.REDIS_URL:
+                    raise ImproperlyConfigured("LIKE_BUFFER = 'redis' requires REDIS_URL.")
+                store = RedisLikeStore(settings.REDIS_URL)
+            else:
+                raise ImproperlyConfigured(f"Unknown LIKE_BUFFER {mode!r}, use None, 'memory' or 'redis'.")
+            _buffer = LikeBuffer(store, mode)
+            if mode == 'memory':
+                _buffer.start_flusher()  # Nothing else would flush it (see the module docstring)
+        return _buffer
+
+
+def apply_pending_likes(posts):
+    """Adds the buffered likes to the like_count of loaded posts (no-op when likes are not buffered)."""
+    buffer = get_like_buffer()
+    if buffer is not None:
+        buffer.apply_to(posts)
+    return posts
+
+
+def apply_liked_by(user, posts):
+    """
+    Sets liked_by_me on loaded posts for an authenticated user, with one query for all of them (plus the
+    user's buffered toggles). Anonymous users get no flag.
+    """
+    posts = [post for post in posts if post is not None]
+    if not user.is_authenticated or not posts:
+        return posts
+    post_ids = [post.id for post in posts]
+    liked = set(Like.objects.filter(user_id = user.id, post_id__in = post_ids).values_list('post_id', flat = True))
+    buffer = get_like_buffer()
+    if buffer is not None:
+        for post_id, desired in buffer.pending_states(user.id, post_ids).items():
+            (liked.add if desired else liked.discard)(post_id)
+    for post in posts:
+        post.liked_by_me = post.id in liked
+    return posts
+
+
+def likes_queryset(post_id):
+    """Likes of a post as rows for LikePagination and likers_page(), newest first."""
+    return Like.objects.filter(post_id = post_id).values('id', 'user_id', 'user__username')
+
+
+def likers_page(post_id, rows, first_page):
+    """Usernames of a page of likes_queryset() rows, with the buffered toggles (new likes go on the first page)."""
+    buffer = get_like_buffer()
+    if buffer is None:
+        return [row['user__username'] for row in rows]
+
+    added, removed = buffer.pending_users(post_id)
+    usernames = [row['user__username'] for row in rows if row['user_id'] not in removed]
+    if first_page and added:
+        usernames = [
+            *User.objects.filter(id__in = added).exclude(liked_posts = post_id).values_list('username', flat = True),
+            *usernames
+        ]
+    return usernames
@@ -0,0 +1,30 @@
+import time
+
+import schedule
+from django.core.management.base import BaseCommand, CommandError
+from Microblog_API.likes import get_like_buffer
+
+
+class Command(BaseCommand):
+    help = "Writes the likes buffered by LIKE_BUFFER to the database, once or periodically with --loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action = 'store_true', help = "Keep flushing every --interval seconds.")
+        parser.add_argument('--interval', type = float, default = 1.0, help = "Seconds between flushes with --loop.")
+
+    def handle(self, *args, **options):
+        buffer = get_like_buffer()
+        if buffer is None:
+            raise CommandError("Likes are not buffered, set LIKE_BUFFER to 'redis' first.")
+        if buffer.mode == 'memory':
+            # This process would only see its own, empty buffer, the web process flushes its own
+            raise CommandError("LIKE_BUFFER = 'memory' is flushed by the process that holds it, this command needs 'redis'.")
+
+        if not options['loop']:
+            self.stdout.write(f"Flushed {buffer.flush()} like(s).")
+            return
+
+        schedule.every(options['interval']).seconds.do(buffer.flush)
+        while True:
+            schedule.run_pending()
+            time.sleep(min(options['interval'], 1.0))
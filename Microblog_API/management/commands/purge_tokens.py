@@ -0,0 +1,27 @@
+import time
+
+import schedule
+from django.core.management.base import BaseCommand
+from Microblog_API.revocation import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Deletes the expired outstanding/blacklisted refresh tokens, once or periodically with --loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action = 'store_true', help = "Keep purging every --interval seconds.")
+        parser.add_argument('--interval', type = float, default = 3600, help = "Seconds between purges with --loop.")
+        parser.add_argument('--batch-size', type = int, default = 1000)
+
+    def purge(self, batch_size):
+        self.stdout.write(f"Deleted {purge_expired(batch_size)} expired token(s).")
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            self.purge(options['batch_size'])
+            return
+
+        schedule.every(options['interval']).seconds.do(self.purge, options['batch_size'])
+        while True:
+            schedule.run_pending()
+            time.sleep(min(options['interval'], 1.0))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from Microblog_API.counters import reconcile_post_counters, reconcile_comment_counters
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized like/comment/reply counters of posts and comments and fixes the ones that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 1000, help = "Rows checked per query.")
+
+    def handle(self, *args, **options):
+        posts = reconcile_post_counters(batch_size = options['batch_size'])
+        comments = reconcile_comment_counters(batch_size = options['batch_size'])
+        self.stdout.write(f"Fixed counters of {posts} post(s) and {comments} comment(s).")
@@ -0,0 +1,31 @@
+import time
+
+import schedule
+from django.core.management.base import BaseCommand
+from Microblog_API import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs the background jobs queued in the Job table, until there are none left with --once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action = 'store_true', help = "Run the due jobs and exit.")
+        parser.add_argument('--batch-size', type = int, default = 100, help = "Jobs claimed at a time.")
+        parser.add_argument('--interval', type = float, default = 1.0, help = "Seconds to wait when no job is due.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            jobs.release_stale()
+            ran = 0
+            while count := jobs.run_pending(options['batch_size']):
+                ran += count
+            self.stdout.write(f"Ran {ran} job(s).")
+            return
+
+        schedule.every(60).seconds.do(jobs.release_stale)
+        schedule.every(1).hours.do(jobs.purge)
+        jobs.release_stale()
+        while True:
+            schedule.run_pending()
+            if not jobs.run_pending(options['batch_size']):
+                time.sleep(options['interval'])
@@ -0,0 +1,49 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from Microblog_API.seeding import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates users, posts, comments, likes, follows and timelines in bulk for scale testing, "
+        "e.g. --users 200000 --posts 2000000 --comments 4000000 --likes 3000000 --follows 1000000 for about 10M rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type = int, default = 1000)
+        parser.add_argument('--posts', type = int, default = 10000)
+        parser.add_argument('--comments', type = int, default = 30000)
+        parser.add_argument('--likes', type = int, default = 50000, help = "Target, the most liked posts are capped at one like per user.")
+        parser.add_argument('--follows', type = int, default = 20000, help = "Target, capped the same way.")
+        parser.add_argument('--reply-ratio', type = float, default = 0.3, help = "Share of the comments that are replies.")
+        parser.add_argument('--skew', type = float, default = 1.1, help = "Exponent of the power law of authors, likes, comments and followers.")
+        parser.add_argument('--days', type = int, default = 365, help = "The posts are spread over this many days.")
+        parser.add_argument('--no-feed', action = 'store_true', help = "Don't fill the home timelines.")
+        parser.add_argument('--seed', type = int, default = 0, help = "Same seed and sizes, same data.")
+        parser.add_argument('--workers', type = int, default = min(os.cpu_count() or 1, 8), help = "Processes (always 1 on SQLite).")
+        parser.add_argument('--batch-size', type = int, default = 10000, help = "Rows per chunk (COPY or INSERT).")
+        parser.add_argument('--prefix', default = 'seed', help = "Usernames are <prefix><id>.")
+        parser.add_argument('--password', default = 'password', help = "Password of every generated user.")
+
+    def handle(self, *args, **options):
+        for option in ('users', 'posts', 'comments', 'likes', 'follows', 'days', 'batch_size'):
+            if options[option] < 0 or (option == 'batch_size' and not options[option]):
+                raise CommandError(f"--{option.replace('_', '-')} must be a positive number.")
+        if not 0 <= options['reply_ratio'] <= 1:
+            raise CommandError("--reply-ratio must be between 0 and 1.")
+        if options['skew'] <= 0:
+            raise CommandError("--skew must be positive.")
+
+        def progress(phase, rows, seconds):
+            self.stdout.write(f"{phase}: {rows} row(s) in {seconds:.1f} s")
+
+        written = seed(
+            options['users'], options['posts'], options['comments'], options['likes'], options['follows'],
+            reply_ratio = options['reply_ratio'], skew = options['skew'], days = options['days'],
+            feed = not options['no_feed'], seed = options['seed'], workers = options['workers'],
+            batch_size = options['batch_size'], prefix = options['prefix'], password = options['password'],
+            progress = progress,
+        )
+        inserted = sum(rows for phase, rows in written.items() if phase != 'counters')
+        self.stdout.write(f"Inserted {inserted} row(s).")
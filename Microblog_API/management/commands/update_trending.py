@@ -0,0 +1,28 @@
+import time
+
+import schedule
+from django.core.management.base import BaseCommand
+from Microblog_API import trending
+
+
+class Command(BaseCommand):
+    help = "Drops the trending scores that decayed under TRENDING_MIN_SCORE, once or periodically with --loop, or recomputes them all with --rebuild."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action = 'store_true', help = "Keep trimming every --interval seconds.")
+        parser.add_argument('--interval', type = float, default = 300.0, help = "Seconds between trims with --loop.")
+        parser.add_argument('--rebuild', action = 'store_true', help = "Score every post from its like and comment counters instead.")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f"Scored {trending.rebuild()} post(s).")
+            return
+
+        if not options['loop']:
+            self.stdout.write(f"Dropped {trending.trim()} decayed score(s).")
+            return
+
+        schedule.every(options['interval']).seconds.do(trending.trim)
+        while True:
+            schedule.run_pending()
+            time.sleep(min(options['interval'], 1.0))
@@ -0,0 +1,84 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from . import instrumentation
+
+
+class AsyncReadsMiddleware:
+    """Under ASGI, resolves URLs with ASYNC_URLCONF so the hot reads are served by Microblog_API/async_views.py."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.get_response(request)  # WSGI, nothing to do
+
+    async def __acall__(self, request):
+        request.urlconf = settings.ASYNC_URLCONF
+        return await self.get_response(request)
+
+
+class RateLimitHeadersMiddleware:
+    """Adds the X-RateLimit-* headers of the throttle that limited the request (Microblog_API/throttling.py)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    @staticmethod
+    def add_headers(request, response):
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response['X-RateLimit-Limit'] = limit
+            response['X-RateLimit-Remaining'] = remaining
+            response['X-RateLimit-Reset'] = reset
+        return response
+
+
+class InstrumentationMiddleware:
+    """Latency, queries, serialization time and size of every request (Microblog_API/instrumentation.py). Goes first."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics, token = instrumentation.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.end_request(token)
+        return instrumentation.finish_request(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = instrumentation.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.end_request(token)
+        return instrumentation.finish_request(request, response, metrics)
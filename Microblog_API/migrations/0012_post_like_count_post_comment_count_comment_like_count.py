@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, field):
+    return Coalesce(
+        Subquery(queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(n=Count('*')).values('n')),
+        Value(0),
+    )
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('Microblog_API', 'Post')
+    Comment = apps.get_model('Microblog_API', 'Comment')
+    Post.objects.update(
+        like_count=count_of(Post.likes.through.objects.all(), 'post'),
+        comment_count=count_of(Comment.objects.all(), 'post'),
+    )
+    Comment.objects.update(like_count=count_of(Comment.likes.through.objects.all(), 'comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0011_alter_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:09
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The vectors are computed by triggers, so every write path (views, admin, bulk_create, COPY) keeps them current.
+# Only Postgres has tsvector/GIN; on other databases the columns stay NULL and search falls back to icontains.
+POST_VECTOR = (
+    "setweight(to_tsvector('pg_catalog.english', coalesce({row}title, '')), 'A') || "
+    "setweight(to_tsvector('pg_catalog.english', coalesce({row}content, '')), 'B')"
+)
+COMMENT_VECTOR = "to_tsvector('pg_catalog.english', coalesce({row}content, ''))"
+
+TRIGGERS = [
+    # (table, function/trigger prefix, vector expression, watched columns)
+    ('Post', 'post', POST_VECTOR, 'title, content'),
+    ('Comment', 'comment', COMMENT_VECTOR, 'content'),
+]
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, prefix, vector, columns in TRIGGERS:
+        schema_editor.execute(f'''
+            CREATE FUNCTION {prefix}_search_vector_trigger() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {vector.format(row='NEW.')};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        ''')
+        schema_editor.execute(f'''
+            CREATE TRIGGER {prefix}_search_vector_update
+            BEFORE INSERT OR UPDATE OF {columns} ON "{table}"
+            FOR EACH ROW EXECUTE FUNCTION {prefix}_search_vector_trigger()
+        ''')
+        schema_editor.execute(f'UPDATE "{table}" SET search_vector = {vector.format(row="")}')
+        schema_editor.execute(f'CREATE INDEX {prefix}_search_vector_gin ON "{table}" USING gin (search_vector)')
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, prefix, vector, columns in TRIGGERS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {prefix}_search_vector_gin')
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {prefix}_search_vector_update ON "{table}"')
+        schema_editor.execute(f'DROP FUNCTION IF EXISTS {prefix}_search_vector_trigger()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0012_post_like_count_post_comment_count_comment_like_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
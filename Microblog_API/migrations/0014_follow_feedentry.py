@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0013_post_comment_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Microblog_API.post')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Feed entry',
+                'verbose_name_plural': 'Feed entries',
+                'db_table': 'FeedEntry',
+                'indexes': [models.Index(fields=['user', '-created_at', '-post'], name='feed_user_created_idx'), models.Index(fields=['user', 'author'], name='feed_user_author_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'post'), name='unique_feed_entry')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Follow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('followee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='followers', to=settings.AUTH_USER_MODEL)),
+                ('follower', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='following', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Follow',
+                'verbose_name_plural': 'Follows',
+                'db_table': 'Follow',
+                'constraints': [models.UniqueConstraint(fields=('follower', 'followee'), name='unique_follow')],
+            },
+        ),
+    ]
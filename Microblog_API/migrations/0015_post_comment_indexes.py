@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0014_follow_feedentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Comment', 'verbose_name_plural': 'Comments'},
+        ),
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Post', 'verbose_name_plural': 'Posts'},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+        ),
+        # The composite indexes above start with these columns, so their own indexes are dropped once those exist
+        migrations.AlterField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='Microblog_API.post'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0015_post_comment_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='descendant_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='Microblog_API.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path', 'created_at', 'id'], name='comment_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+def copy_updated_at(apps, schema_editor):
+    # Existing posts start from their last edit rather than from the time of the migration
+    Post = apps.get_model('Microblog_API', 'Post')
+    Post.objects.update(activity_at = models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0016_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='activity_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+    ]
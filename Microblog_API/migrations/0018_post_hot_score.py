@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0017_post_activity_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('hot_score__isnull', False)), fields=['-hot_score', '-id'], name='post_hot_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0018_post_hot_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('args', models.JSONField(default=list)),
+                ('kwargs', models.JSONField(default=dict)),
+                ('key', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'db_table': 'Job',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['run_at', 'id'], name='job_pending_idx'), models.Index(condition=models.Q(('status', 'running')), fields=['locked_at'], name='job_running_idx')],
+            },
+        ),
+    ]
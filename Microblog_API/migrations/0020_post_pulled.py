@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_celebrity_posts(apps, schema_editor):
+    # The posts of the current celebrities were pulled by checking the author, they keep being pulled
+    Follow = apps.get_model('Microblog_API', 'Follow')
+    Post = apps.get_model('Microblog_API', 'Post')
+    celebrities = (
+        Follow.objects.values('followee').annotate(n = models.Count('id'))
+        .filter(n__gte = getattr(settings, 'FEED_FANOUT_THRESHOLD', 10000)).values('followee')
+    )
+    Post.objects.filter(author__in = celebrities).update(pulled = True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Microblog_API', '0019_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='pulled',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('pulled', True)), fields=['author', '-created_at', '-id'], name='post_pulled_idx'),
+        ),
+        migrations.RunPython(mark_celebrity_posts, migrations.RunPython.noop),
+    ]
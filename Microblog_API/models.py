@@ -1,35 +1,136 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Post(models.Model):
-    author = models.ForeignKey(User, on_delete = models.CASCADE)
+    author = models.ForeignKey(User, on_delete = models.CASCADE, db_index = False) # Covered by post_author_created_idx
     title = models.CharField(max_length=100, null = True)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name = "liked_posts", blank=True)
+    # Denormalized counters, kept in sync by the views and Microblog_API/signals.py (see 'manage.py reconcile_counters')
+    like_count = models.PositiveIntegerField(default = 0)
+    comment_count = models.PositiveIntegerField(default = 0)
+    # Filled by a Postgres trigger from title and content, and GIN-indexed (see migration 0013). Always NULL on SQLite.
+    search_vector = SearchVectorField(null = True, editable = False)
+    # Last change of anything shown under the post (itself, its counters, its comments), see Microblog_API/conditional.py
+    activity_at = models.DateTimeField(auto_now = True)
+    # Time-decayed score of the likes and comments, NULL when it's negligible (see Microblog_API/trending.py)
+    hot_score = models.FloatField(null = True, editable = False)
+    # Written by a celebrity: not fanned out, followers read it at read time (see Microblog_API/feed.py)
+    pulled = models.BooleanField(default = False, editable = False)
     
     class Meta:
         db_table = 'Post'
         verbose_name = 'Post'
         verbose_name_plural = 'Posts'
-        ordering = ['author']
+        ordering = ['-created_at', '-id']
+        # Latest posts overall (/api/posts/) and latest posts of one author (?author=, feed backfill)
+        indexes = [
+            models.Index(fields = ['-created_at', '-id'], name = 'post_created_idx'),
+            models.Index(fields = ['author', '-created_at', '-id'], name = 'post_author_created_idx'),
+            models.Index(fields = ['-hot_score', '-id'], name = 'post_hot_idx', condition = models.Q(hot_score__isnull = False)),
+            models.Index(fields = ['author', '-created_at', '-id'], name = 'post_pulled_idx', condition = models.Q(pulled = True)),
+        ]
         
     def __str__(self):
         return self.title
     
 class Comment(models.Model):
-    post = models.ForeignKey(Post, on_delete = models.CASCADE, related_name = "comments")
+    post = models.ForeignKey(Post, on_delete = models.CASCADE, related_name = "comments", db_index = False) # Covered by comment_post_created_idx
     author = models.ForeignKey(User, on_delete = models.CASCADE, related_name = "authors")
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     likes = models.ManyToManyField(User, related_name = "liked_comments", blank=True)
+    like_count = models.PositiveIntegerField(default = 0)
+    # Reply threads: the ids of the ancestors are kept in path, so a whole subtree is one index range (see Microblog_API/threads.py)
+    parent = models.ForeignKey('self', on_delete = models.CASCADE, related_name = "replies", null = True, blank = True)
+    path = models.CharField(max_length = 255, default = '', blank = True, editable = False)
+    depth = models.PositiveSmallIntegerField(default = 0, editable = False)
+    reply_count = models.PositiveIntegerField(default = 0)
+    descendant_count = models.PositiveIntegerField(default = 0)
+    search_vector = SearchVectorField(null = True, editable = False)
     
     class Meta:
         db_table = 'Comment'
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
-        ordering = ['author']
+        ordering = ['-created_at', '-id']
+        # Comments are always read per post, newest first. Replies are read per thread, oldest first
+        indexes = [
+            models.Index(fields = ['post', '-created_at', '-id'], name = 'comment_post_created_idx'),
+            models.Index(fields = ['post', 'path', 'created_at', 'id'], name = 'comment_thread_idx'),
+        ]
         
     def __str__(self):
-        return self.content
\ No newline at end of file
+        return self.content
+
+class Follow(models.Model):
+    follower = models.ForeignKey(User, on_delete = models.CASCADE, related_name = "following", db_index = False) # Covered by unique_follow
+    followee = models.ForeignKey(User, on_delete = models.CASCADE, related_name = "followers")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'Follow'
+        verbose_name = 'Follow'
+        verbose_name_plural = 'Follows'
+        constraints = [
+            models.UniqueConstraint(fields = ['follower', 'followee'], name = 'unique_follow'),
+        ]
+        
+    def __str__(self):
+        return f"{self.follower_id} -> {self.followee_id}"
+
+
+# Materialized home timeline: one row per (reader, post), written when the post is created (see Microblog_API/feed.py)
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete = models.CASCADE, related_name = "+", db_index = False)
+    post = models.ForeignKey(Post, on_delete = models.CASCADE, related_name = "+")
+    author = models.ForeignKey(User, on_delete = models.CASCADE, related_name = "+", db_index = False)
+    created_at = models.DateTimeField() # Copy of post.created_at, so a page of the feed is read from this table alone
+    
+    class Meta:
+        db_table = 'FeedEntry'
+        verbose_name = 'Feed entry'
+        verbose_name_plural = 'Feed entries'
+        constraints = [
+            models.UniqueConstraint(fields = ['user', 'post'], name = 'unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields = ['user', '-created_at', '-post'], name = 'feed_user_created_idx'),
+            models.Index(fields = ['user', 'author'], name = 'feed_user_author_idx'),
+        ]
+
+
+# Background job, run by 'manage.py run_worker' (see Microblog_API/jobs.py)
+class Job(models.Model):
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+    
+    name = models.CharField(max_length = 255) # Import path of the function
+    args = models.JSONField(default = list)
+    kwargs = models.JSONField(default = dict)
+    key = models.CharField(max_length = 255, null = True, blank = True, unique = True) # Idempotency key
+    status = models.CharField(max_length = 10, choices = STATUSES, default = PENDING)
+    attempts = models.PositiveIntegerField(default = 0)
+    max_attempts = models.PositiveIntegerField(default = 5)
+    run_at = models.DateTimeField(default = timezone.now)
+    locked_at = models.DateTimeField(null = True, blank = True)
+    last_error = models.TextField(blank = True)
+    created_at = models.DateTimeField(auto_now_add = True)
+    finished_at = models.DateTimeField(null = True, blank = True)
+    
+    class Meta:
+        db_table = 'Job'
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        # Workers only look at the due jobs and at the running ones, never at the finished history
+        indexes = [
+            models.Index(fields = ['run_at', 'id'], name = 'job_pending_idx', condition = models.Q(status = 'pending')),
+            models.Index(fields = ['locked_at'], name = 'job_running_idx', condition = models.Q(status = 'running')),
+        ]
+        
+    def __str__(self):
+        return f"{self.name} ({self.status})"
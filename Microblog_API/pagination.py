@@ -0,0 +1,259 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def positive_int(value, strict = False, cutoff = None):
+    """Parses a query parameter as an int >= 0 (> 0 with strict), capped at cutoff. Raises ValueError otherwise."""
+    number = int(value)
+    if number < 0 or (strict and number == 0):
+        raise ValueError(value)
+    return min(number, cutoff) if cutoff is not None else number
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the values of the ordering fields plus the primary key.
+
+    Unlike LIMIT/OFFSET, fetching page 1000 costs the same as fetching page 1: the cursor holds the
+    (ordering values..., id) of the last row sent, and the next page is read with a WHERE clause on
+    that tuple, which the (created_at, id) indexes can serve directly.
+
+    The ordering is taken from the queryset (so OrderingFilter and any filter that orders results
+    keep working), falling back to `ordering` when the queryset is unordered.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view = None):
+        return self.build_page(list(self.get_page_queryset(queryset, request)))
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Returns the sliced queryset for the requested page, without evaluating it.
+        Split from paginate_queryset() so callers can evaluate it however they need (e.g. asynchronously).
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering_fields(queryset)
+
+        position, self.reverse = self.decode_cursor(request)
+        self.has_cursor = position is not None
+
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position, self.reverse))
+
+        return queryset.order_by(*self.order_by_expressions(self.reverse))[:self.page_size + 1]
+
+    def build_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.has_cursor
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict = True,
+                    cutoff = self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.position_of(self.page[-1]), reverse = False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.position_of(self.page[0]), reverse = True)
+
+    # Ordering
+
+    def get_ordering_fields(self, queryset):
+        """
+        Returns a list of (name, descending, model_field) ending with the primary key, which makes the ordering total.
+        model_field is None for annotations.
+        """
+        ordering = [o for o in queryset.query.order_by if isinstance(o, str) and o != '?']
+        if not ordering:
+            ordering = list(self.ordering)
+
+        pk_name = queryset.model._meta.pk.name
+        fields = []
+        for term in ordering:
+            descending = term.startswith('-')
+            name = term.lstrip('-')
+            if name == 'pk':
+                name = pk_name
+            if any(f[0] == name for f in fields):
+                continue
+            try:
+                model_field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                model_field = None
+            fields.append((name, descending, model_field))
+            if name == pk_name:
+                break
+        else:
+            fields.append((pk_name, fields[0][1], queryset.model._meta.pk))
+        return fields
+
+    def order_by_expressions(self, reverse):
+        expressions = []
+        for name, descending, model_field in self.fields:
+            descending = descending != reverse
+            # NULLs always sort after every value when paging forward, so paging backward must put them first
+            nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+            if not self.is_nullable(model_field):
+                nulls = {}
+            expressions.append(F(name).desc(**nulls) if descending else F(name).asc(**nulls))
+        return expressions
+
+    def seek_filter(self, position, reverse):
+        """
+        Builds the WHERE clause selecting the rows strictly after `position` in the paging direction:
+        (f1 beyond v1) OR (f1 = v1 AND f2 beyond v2) OR ...
+        """
+        alternatives = []
+        equal_so_far = []
+        for (name, descending, model_field), value in zip(self.fields, position):
+            beyond, equal = self.compare(name, descending != reverse, value, reverse, self.is_nullable(model_field))
+            if beyond is not None:
+                alternatives.append(reduce(and_, equal_so_far + [beyond]))
+            equal_so_far.append(equal)
+
+        condition = reduce(or_, alternatives) if alternatives else Q(pk__in = [])
+
+        # Redundant bound on the leading column, it lets the database turn the OR above into an index range scan
+        name, descending, model_field = self.fields[0]
+        if position[0] is not None and not self.is_nullable(model_field):
+            lookup = 'lte' if descending != reverse else 'gte'
+            condition &= Q(**{f'{name}__{lookup}': position[0]})
+        return condition
+
+    @staticmethod
+    def compare(name, descending, value, reverse, nullable):
+        """Returns the (beyond, equal) conditions for one column. `beyond` is None when no row can sort after the value."""
+        if value is None:
+            # NULLs come last going forward, so nothing is beyond them. Going backward every non-NULL value is.
+            beyond = Q(**{f'{name}__isnull': False}) if reverse else None
+            return beyond, Q(**{f'{name}__isnull': True})
+
+        beyond = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+        if nullable and not reverse:
+            beyond |= Q(**{f'{name}__isnull': True})
+        return beyond, Q(**{name: value})
+
+    @staticmethod
+    def is_nullable(model_field):
+        return model_field is not None and model_field.null
+
+    # Cursor encoding
+
+    def position_of(self, row):
+        if isinstance(row, dict):
+            return [row[name] for name, _, _ in self.fields]
+        return [getattr(row, name) for name, _, _ in self.fields]
+
+    def encode_cursor(self, position, reverse):
+        payload = {'p': [self.encode_value(v) for v in position]}
+        if reverse:
+            payload['r'] = 1
+        cursor = b64encode(json.dumps(payload, separators = (',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [
+                self.decode_value(model_field, value)
+                for (name, descending, model_field), value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, bool(payload.get('r'))
+
+    @staticmethod
+    def encode_value(value):
+        if isinstance(value, (datetime, date, time)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    @staticmethod
+    def decode_value(model_field, value):
+        if value is None or model_field is None:
+            return value
+        return model_field.to_python(value)
+
+
+class PostPagination(KeysetPagination):
+    ordering = ('-created_at',)
+
+
+class CommentPagination(KeysetPagination):
+    ordering = ('-created_at',)
+
+
+class ReplyPagination(KeysetPagination):
+    ordering = ('created_at',)
+
+
+class LikePagination(KeysetPagination):
+    ordering = ('-id',)  # Newest likes first
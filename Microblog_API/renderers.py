@@ -0,0 +1,79 @@
+"""
+JSON renderer and parser backed by orjson, used by default (REST_FRAMEWORK in settings.py).
+
+The output is byte for byte the one of DRF's JSONRenderer: compact separators, UTF-8 without escapes
+except for U+2028/U+2029, and the types orjson doesn't handle the same way (datetimes, Decimal, lazy
+strings...) are encoded by DRF's JSONEncoder. Anything orjson can't do (indented output, integers over
+64 bits, another charset) goes through the stock classes, which are also used when orjson isn't installed.
+That includes NaN and infinities, which orjson writes as null: when the output has a null, the data is checked
+for them and JSONRenderer renders it (raising ValueError with STRICT_JSON, as DRF does).
+"""
+import codecs
+import io
+import math
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from .instrumentation import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def has_non_finite(data):
+    """True if a float in the dicts and lists of `data` is NaN or infinite."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(has_non_finite(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(has_non_finite(value) for value in data)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type = None, renderer_context = None):
+        with timed('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default = self.encoder_class().default, option = DUMPS_OPTIONS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b'null' in ret and has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, so the output is a strict JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+
+    def parse(self, stream, media_type = None, parser_context = None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Let JSONParser decide: integers over 64 bits, NaN/Infinity, and its error messages
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,104 @@
+"""
+Revoked refresh tokens (logout, and rotation when ROTATE_REFRESH_TOKENS is on).
+
+simplejwt's blacklist app writes an OutstandingToken row for every token it issues and checks every refresh
+against BlacklistedToken. Here only revoked tokens are written to those tables, which stay the durable
+record, and their jti is also kept in the cache until the token expires, so checking a token is one cache
+read however many tokens were ever issued.
+
+A cache miss only means "not revoked" while the `loaded` marker exists. If the cache was flushed or
+restarted, the first check reloads the revoked jtis of unexpired tokens from the database. The marker expires
+after TOKEN_REVOCATION_RELOAD_INTERVAL seconds (never after the jtis it loaded), so a jti evicted under memory
+pressure is only missed until the next reload (Redis' maxmemory-policy noeviction rules it out). If the cache is
+unreachable, checks go to the database. With TOKEN_REVOCATION_CACHE = False (the default without REDIS_URL:
+a per-process memory cache isn't shared by the workers) the database is always used.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'microblog:auth:revoked'
+LOADED_KEY = f'{PREFIX}:loaded'
+
+
+def use_cache():
+    return getattr(settings, 'TOKEN_REVOCATION_CACHE', False)
+
+
+def key_for(jti):
+    return f'{PREFIX}:{jti}'
+
+
+def revoke(jti, exp, user_id = None, token = ''):
+    """Records the token as revoked until `exp` (epoch seconds). Returns the BlacklistedToken row."""
+    outstanding, _ = OutstandingToken.objects.get_or_create(
+        jti = jti,
+        defaults = {
+            'user_id': user_id,
+            'created_at': timezone.now(),
+            'token': token,
+            'expires_at': datetime_from_epoch(exp),
+        }
+    )
+    blacklisted, _ = BlacklistedToken.objects.get_or_create(token = outstanding)
+
+    if use_cache():
+        try:
+            cache.set(key_for(jti), 1, max(int(exp - time.time()), 1))
+        except Exception as exc:
+            # Checks that find the cache without this key while it's marked as loaded would miss the revocation
+            logger.warning("Could not cache the revoked token %s, dropping the loaded marker: %s", jti, exc)
+            try:
+                cache.delete(LOADED_KEY)
+            except Exception:
+                pass  # The cache is down, checks are going to the database anyway
+    return blacklisted
+
+
+def is_revoked(jti):
+    if use_cache():
+        try:
+            return _is_revoked_cached(jti)
+        except Exception as exc:
+            logger.warning("Revoked tokens cache unavailable, checking the database: %s", exc)
+    return BlacklistedToken.objects.filter(token__jti = jti).exists()
+
+
+def _is_revoked_cached(jti):
+    found = cache.get_many([LOADED_KEY, key_for(jti)])
+    if key_for(jti) in found:
+        return True
+    if LOADED_KEY in found:
+        return False
+    return jti in load()
+
+
+def load():
+    """Copies the revoked jtis of unexpired tokens into the cache and marks it as loaded. Returns those jtis."""
+    jtis = set(
+        BlacklistedToken.objects.filter(token__expires_at__gt = timezone.now())
+        .values_list('token__jti', flat = True)
+    )
+    # One timeout for all of them: none of those tokens lives longer than a refresh token
+    timeout = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+    cache.set_many({key_for(jti): 1 for jti in jtis}, timeout)
+    cache.set(LOADED_KEY, 1, min(getattr(settings, 'TOKEN_REVOCATION_RELOAD_INTERVAL', 300), timeout))
+    return jtis
+
+
+def purge_expired(batch_size = 1000):
+    """Deletes the expired outstanding tokens (and their blacklist rows) in batches. Returns how many were deleted."""
+    total = 0
+    expired = OutstandingToken.objects.filter(expires_at__lte = timezone.now())
+    while ids := list(expired.values_list('id', flat = True)[:batch_size]):
+        OutstandingToken.objects.filter(id__in = ids).delete()
+        total += len(ids)
+    return total
@@ -0,0 +1,37 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+# Text search configuration of the search_vector columns. It is also hard-coded in the triggers of migration 0013.
+SEARCH_CONFIG = 'english'
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for SearchFilter backed by the GIN-indexed `search_vector` column that the Postgres
+    triggers keep up to date on every insert/update of the post or comment.
+
+    Matches are ranked with SearchRank and, unless the client picked an ?ordering=, returned best match first.
+    On other databases (SQLite in local runs) it falls back to SearchFilter's icontains over `search_fields`.
+    """
+    vector_field = 'search_vector'
+    rank_annotation = 'search_rank'
+
+    def filter_queryset(self, request, queryset, view):
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        terms = request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        if not terms:
+            return queryset
+
+        # websearch syntax: plain words are ANDed, "quoted phrases", OR, and -excluded words
+        query = SearchQuery(terms, search_type = 'websearch', config = SEARCH_CONFIG)
+        queryset = queryset.filter(**{self.vector_field: query}).annotate(
+            **{self.rank_annotation: SearchRank(F(self.vector_field), query)}
+        )
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by(f'-{self.rank_annotation}')
+        return queryset
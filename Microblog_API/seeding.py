@@ -0,0 +1,325 @@
+"""
+Synthetic data for scale testing ('manage.py seed_microblog'): users, posts, comments and reply threads,
+likes, follows and the home timelines, written in bulk straight to the tables.
+
+- Rows are written with COPY on Postgres, and with multi-row INSERTs (executemany) on other databases.
+  Neither the models nor the signals are involved. The Postgres triggers still fill search_vector.
+- The work is split in chunks of --batch-size rows, run by a pool of forked worker processes, each with its
+  own connection. SQLite takes one writer at a time, so there it all runs in the calling process.
+- Users, posts and comments get explicit ids after the largest existing ones, so the chunks can reference
+  each other without reading anything back. The sequences are reset at the end.
+- Every chunk draws from its own random generator, seeded with --seed and the chunk's position. The same
+  arguments give the same data whatever the number of workers.
+- Popularity follows a power law with exponent --skew: a few authors write most posts, a few posts get most
+  likes and comments, a few users have most followers. Which ones is scattered over the ids.
+- The counters are then computed by the database, one UPDATE per chunk, and the timelines are filled with
+  INSERT ... SELECT the way fan-out would have written them. Celebrities are left out, as fan_out() does.
+  The trending scores are rebuilt from the counters of each chunk, and the ones that already decayed are
+  dropped as update_trending would.
+"""
+import io
+import math
+import multiprocessing
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from . import threads, trending
+from .counters import comment_counters, post_counters, recount
+from .feed import CELEBRITIES_CACHE_KEY, celebrity_ids
+from .models import Comment, FeedEntry, Follow, Post
+
+Like = Post.likes.through
+
+WORDS = (
+    'river', 'mountain', 'coffee', 'python', 'django', 'music', 'travel', 'morning', 'city', 'garden', 'book',
+    'football', 'weekend', 'cloud', 'winter', 'summer', 'release', 'database', 'friends', 'sunset', 'code', 'train',
+    'dinner', 'photo', 'movie', 'rain', 'beach', 'office', 'tea', 'game', 'news', 'idea', 'street', 'night',
+)
+
+# Multipliers of the permutations from popularity ranks to rows (primes, so coprime with any realistic count)
+AUTHOR_SCATTER = 2654435761
+FOLLOWED_SCATTER = 2246822519
+POST_SCATTER = 3266489917
+
+
+# Power law
+
+def zipf_rank(u, n, skew):
+    """Rank in 1..n for a uniform u in [0, 1), drawn from a power law of exponent `skew` (inverse CDF, O(1))."""
+    if abs(skew - 1) < 1e-9:
+        rank = (n + 1) ** u
+    else:
+        a = 1 - skew
+        rank = (((n + 1) ** a - 1) * u + 1) ** (1 / a)
+    return min(int(rank), n)
+
+
+def zipf_share(rank, n, skew):
+    """Expected share of the draws that fall on `rank`, consistent with zipf_rank."""
+    if abs(skew - 1) < 1e-9:
+        return math.log((rank + 1) / rank) / math.log(n + 1)
+    a = 1 - skew
+    return ((rank + 1) ** a - rank ** a) / ((n + 1) ** a - 1)
+
+
+def scatter(rank, n, multiplier):
+    """Index in 0..n-1 of the row with popularity `rank` (a permutation of the ranks)."""
+    if math.gcd(multiplier, n) != 1:
+        multiplier = 1
+    return (rank - 1) * multiplier % n
+
+
+def stochastic_round(value, rng):
+    whole = int(value)
+    return whole + (rng.random() < value - whole)
+
+
+# Writing
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def write_rows(model, fields, rows):
+    """Inserts `rows` (tuples in the order of `fields`) into the table of `model`."""
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            data = ''.join('\t'.join(map(copy_value, row)) + '\n' for row in rows)
+            sql = f'COPY {table} ({columns}) FROM STDIN'
+            raw = cursor.cursor
+            if hasattr(raw, 'copy'):  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(data)
+            else:
+                raw.copy_expert(sql, io.StringIO(data))
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+
+
+# Chunks, run by the workers. `plan` holds the sizes, first ids and options of the whole run.
+
+def text(rng, words):
+    return ' '.join(rng.choices(WORDS, k = words)).capitalize()
+
+
+def chunk_rng(plan, kind, start):
+    return random.Random(f"{plan['seed']}:{kind}:{start}")
+
+
+def post_time(plan, index):
+    """Posts are spread over the --days before the run, in id order."""
+    return plan['since'] + (plan['now'] - plan['since']) * (index / max(plan['posts'], 1))
+
+
+def seed_users(plan, start, stop):
+    joined = plan['since'] - timedelta(days = 30)
+    write_rows(User, (
+        'id', 'password', 'last_login', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+        'is_staff', 'is_active', 'date_joined',
+    ), [
+        (
+            plan['first_user'] + i, plan['password'], None, False, f"{plan['prefix']}{plan['first_user'] + i}", '', '',
+            f"{plan['prefix']}{plan['first_user'] + i}@example.com", False, True, joined,
+        )
+        for i in range(start, stop)
+    ])
+    return stop - start
+
+
+def author_of(plan, u):
+    return plan['first_user'] + scatter(zipf_rank(u, plan['users'], plan['skew']), plan['users'], AUTHOR_SCATTER)
+
+
+def popular_post(plan, u):
+    return plan['first_post'] + scatter(zipf_rank(u, plan['posts'], plan['skew']), plan['posts'], POST_SCATTER)
+
+
+def seed_posts(plan, start, stop):
+    rng = chunk_rng(plan, 'posts', start)
+    rows = []
+    for i in range(start, stop):
+        created_at = post_time(plan, i)
+        rows.append((plan['first_post'] + i, author_of(plan, rng.random()), text(rng, 4), text(rng, 30), created_at, created_at, created_at, 0, 0, False))
+    # The counters are set by the 'counters' phase and pulled by 'timelines', Django's defaults aren't in the table definitions
+    write_rows(Post, ('id', 'author', 'title', 'content', 'created_at', 'updated_at', 'activity_at', 'like_count', 'comment_count', 'pulled'), rows)
+    return len(rows)
+
+
+def seed_likes(plan, start, stop):
+    """Likes of the posts with popularity ranks start+1..stop, so no two chunks like the same post."""
+    rng = chunk_rng(plan, 'likes', start)
+    users, posts = plan['users'], plan['posts']
+    rows = []
+    for rank in range(start + 1, stop + 1):
+        count = min(stochastic_round(plan['likes'] * zipf_share(rank, posts, plan['skew']), rng), users)
+        if count:
+            post_id = plan['first_post'] + scatter(rank, posts, POST_SCATTER)
+            rows.extend((post_id, plan['first_user'] + u) for u in rng.sample(range(users), count))
+    write_rows(Like, ('post', 'user'), rows)
+    return len(rows)
+
+
+def seed_follows(plan, start, stop):
+    """Followers of the users with popularity ranks start+1..stop."""
+    rng = chunk_rng(plan, 'follows', start)
+    users = plan['users']
+    rows = []
+    for rank in range(start + 1, stop + 1):
+        count = min(stochastic_round(plan['follows'] * zipf_share(rank, users, plan['skew']), rng), users - 1)
+        if count:
+            followee = scatter(rank, users, FOLLOWED_SCATTER)
+            followers = [u for u in rng.sample(range(users), count + 1) if u != followee][:count]
+            since = plan['since'] - timedelta(days = 30)
+            rows.extend(
+                (plan['first_user'] + u, plan['first_user'] + followee, since + (plan['now'] - since) * rng.random())
+                for u in followers
+            )
+    write_rows(Follow, ('follower', 'followee', 'created_at'), rows)
+    return len(rows)
+
+
+def seed_comments(plan, start, stop):
+    """Comments on popular posts. Some reply to an earlier comment of the chunk, and join its post and thread."""
+    rng = chunk_rng(plan, 'comments', start)
+    max_depth = threads.get_max_depth()
+    now = plan['now']
+    rows = []  # (id, post, author, content, created_at, parent, path, depth)
+    for i in range(start, stop):
+        parent = rng.choice(rows) if rows and rng.random() < plan['reply_ratio'] else None
+        if parent is not None and parent[7] < max_depth:
+            post_id, parent_id, path, depth = parent[1], parent[0], parent[6] + threads.segment(parent[0]), parent[7] + 1
+            created_at = parent[4] + (now - parent[4]) * rng.random()
+        else:
+            post_id = popular_post(plan, rng.random())
+            parent_id, path, depth = None, '', 0
+            created_at = post_time(plan, post_id - plan['first_post'])
+            created_at += (now - created_at) * rng.random()
+        author_id = plan['first_user'] + rng.randrange(plan['users'])
+        rows.append((plan['first_comment'] + i, post_id, author_id, text(rng, 12), created_at, parent_id, path, depth, 0, 0, 0))
+    write_rows(Comment, (
+        'id', 'post', 'author', 'content', 'created_at', 'parent', 'path', 'depth', 'like_count', 'reply_count', 'descendant_count',
+    ), rows)
+    return len(rows)
+
+
+def seed_feed(plan, start, stop):
+    """Timeline entries of the posts in an id range: their author and, unless a celebrity, the followers. Celebrities' posts are marked as pulled."""
+    quote = connection.ops.quote_name
+    post, follow, feed = (quote(model._meta.db_table) for model in (Post, Follow, FeedEntry))
+    first, last = plan['first_post'] + start, plan['first_post'] + stop - 1
+    celebrities = plan['celebrities'] or [0]
+    exclude = ', '.join(['%s'] * len(celebrities))
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {feed} (user_id, post_id, author_id, created_at)
+            SELECT p.author_id, p.id, p.author_id, p.created_at FROM {post} p WHERE p.id BETWEEN %s AND %s
+            UNION ALL
+            SELECT f.follower_id, p.id, p.author_id, p.created_at
+            FROM {post} p JOIN {follow} f ON f.followee_id = p.author_id
+            WHERE p.id BETWEEN %s AND %s AND p.author_id NOT IN ({exclude})
+        ''', [first, last, first, last, *celebrities])
+        entries = cursor.rowcount
+    Post.objects.filter(id__range = (first, last), author_id__in = celebrities).update(pulled = True)
+    return entries
+
+
+def seed_post_counters(plan, start, stop):
+    first_pk, last_pk = plan['first_post'] + start, plan['first_post'] + stop - 1
+    updated = recount(Post, post_counters(), first_pk, last_pk)
+    trending.rebuild(Post.objects.filter(pk__range = (first_pk, last_pk)))
+    trending.trim()  # Posts from months ago would otherwise rank with scores no live post can reach
+    return updated
+
+
+def seed_comment_counters(plan, start, stop):
+    return recount(Comment, comment_counters(), plan['first_comment'] + start, plan['first_comment'] + stop - 1)
+
+
+def run_chunk(task):
+    function, plan, start, stop = task
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL synchronous_commit TO OFF')  # Nothing is lost that can't be seeded again
+        return function(plan, start, stop)
+
+
+# Orchestration
+
+def next_id(model):
+    return (model.objects.aggregate(last = Max('pk'))['last'] or 0) + 1
+
+
+def seed(users, posts, comments, likes, follows, reply_ratio = 0.3, skew = 1.1, days = 365, feed = True,
+         seed = 0, workers = None, batch_size = 10000, prefix = 'seed', password = 'password', progress = None):
+    """
+    Writes the rows and returns {phase: rows written}. `progress(phase, rows, seconds)` is called after each phase.
+    Likes and follows are targets: with a strong skew the most popular rows are capped at one per user.
+    """
+    if connection.vendor == 'sqlite' or not workers or workers < 1:
+        workers = 1
+    now = timezone.now()
+    plan = {
+        'users': users, 'posts': posts, 'comments': comments, 'likes': likes, 'follows': follows,
+        'reply_ratio': reply_ratio, 'skew': skew, 'seed': seed, 'prefix': prefix, 'now': now,
+        'since': now - timedelta(days = days), 'password': make_password(password),  # Hashed once for every user
+        'first_user': next_id(User), 'first_post': next_id(Post), 'first_comment': next_id(Comment),
+        'celebrities': None,
+    }
+
+    phases = [
+        ('users', [(seed_users, users)]),
+        ('posts', [(seed_posts, posts)]),
+        ('likes and follows', [(seed_likes, posts if users else 0), (seed_follows, users if users > 1 else 0)]),
+        ('comments', [(seed_comments, comments if posts and users else 0)]),
+        ('timelines', [(seed_feed, posts if feed else 0)]),
+        ('counters', [(seed_post_counters, posts), (seed_comment_counters, comments)]),
+    ]
+    written = {}
+    connections.close_all()  # Not shared with the forked workers, each one opens its own
+    pool = multiprocessing.get_context('fork').Pool(workers) if workers > 1 else None
+    try:
+        for phase, steps in phases:
+            started = time.perf_counter()
+            if phase == 'timelines':
+                cache.delete(CELEBRITIES_CACHE_KEY)  # Computed again with the new follows
+                plan['celebrities'] = sorted(celebrity_ids())
+            tasks = [
+                (function, plan, start, min(start + batch_size, total))
+                for function, total in steps for start in range(0, total, batch_size)
+            ]
+            counts = pool.map(run_chunk, tasks, chunksize = 1) if pool else [run_chunk(task) for task in tasks]
+            written[phase] = sum(counts)
+            if progress:
+                progress(phase, written[phase], time.perf_counter() - started)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [User, Post, Comment]):
+            cursor.execute(sql)
+    return written
@@ -1,5 +1,11 @@
+import re
+from functools import cached_property, lru_cache
+from operator import attrgetter
+
 from rest_framework import serializers
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.settings import api_settings
+from .authentication import ClaimsRefreshToken
+from .instrumentation import TimedListSerializer, TimedSerializerMixin
 from .models import Post, Comment
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
@@ -25,7 +31,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             password = validated_data['password']
         )
         
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         
         return {
             'user': user,
@@ -59,38 +65,136 @@ class LoginSerializer(serializers.ModelSerializer):
 
         return data
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id','username','email')
+        list_serializer_class = TimedListSerializer
+
+# strftime directives that are a number attribute of the datetime, and how they're padded
+NUMERIC_DIRECTIVES = {
+    'd': ('%02d', 'day'), 'm': ('%02d', 'month'), 'Y': ('%d', 'year'),
+    'H': ('%02d', 'hour'), 'M': ('%02d', 'minute'), 'S': ('%02d', 'second'), 'f': ('%06d', 'microsecond'),
+}
+
+@lru_cache
+def compile_datetime_format(output_format):
+    """
+    Turns a strftime format into a %-format string and the getter of its values, about twice as fast as strftime.
+    Returns None when the format uses other directives (month names, week days...), which are left to strftime.
+    """
+    pattern = []
+    attributes = []
+    for text, directive in re.findall(r'([^%]*)(?:%(.)|$)', output_format, flags = re.DOTALL):
+        pattern.append(text.replace('%', '%%'))
+        if directive == '%':
+            pattern.append('%%')
+        elif directive in NUMERIC_DIRECTIVES:
+            pattern.append(NUMERIC_DIRECTIVES[directive][0])
+            attributes.append(NUMERIC_DIRECTIVES[directive][1])
+        elif directive:
+            return None
+    if not attributes:
+        return None
+    return ''.join(pattern), attrgetter(*attributes) if len(attributes) > 1 else (lambda value: (getattr(value, attributes[0]),))
+
+
+class DateTimeField(serializers.DateTimeField):
+    """DateTimeField with the same output, formatted without strftime when DATETIME_FORMAT allows it."""
+
+    def to_representation(self, value):
+        output_format = getattr(self, 'format', api_settings.DATETIME_FORMAT)
+        compiled = compile_datetime_format(output_format) if isinstance(output_format, str) else None
+        if compiled is None or not value or isinstance(value, str):
+            return super().to_representation(value)
+        pattern, values = compiled
+        if value.tzinfo is None or self.output_timezone is None:
+            return pattern % values(self.enforce_timezone(value))
+        try:
+            return pattern % values(value.astimezone(self.output_timezone))  # As enforce_timezone does
+        except OverflowError:
+            return super().to_representation(value)
 
-class PostSerializer(serializers.ModelSerializer):
+    # Looked up once per serializer: get_current_timezone() costs more than formatting the date
+    @cached_property
+    def output_timezone(self):
+        return getattr(self, 'timezone', None) or self.default_timezone()
+
+
+class PostSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = serializers.CharField(source = "author.username", read_only = True)
-    number_of_comments = serializers.SerializerMethodField()
-    number_of_likes = serializers.SerializerMethodField()
+    # Both counters are stored on the post, so reading them never touches the Comment or likes tables
+    number_of_comments = serializers.IntegerField(source = "comment_count", read_only = True)
+    number_of_likes = serializers.IntegerField(source = "like_count", read_only = True)
+    created_at = DateTimeField(read_only = True)
+    updated_at = DateTimeField(read_only = True)
+    # Only for authenticated users, set on the posts of a page by likes.apply_liked_by (left out when missing)
+    liked_by_me = serializers.BooleanField(read_only = True)
     
     class Meta:
         model = Post
-        fields = ('id', 'author', 'title', 'content', 'created_at', 'updated_at', 'number_of_comments', 'number_of_likes') # Qué atributos se incluirán en el JSON
+        fields = ('id', 'author', 'title', 'content', 'created_at', 'updated_at', 'number_of_comments', 'number_of_likes', 'liked_by_me') # Qué atributos se incluirán en el JSON
+        list_serializer_class = TimedListSerializer  # Serialization time of the requests (Microblog_API/instrumentation.py)
         read_only_fields = ('created_at',) # There is no need to pass these fields in the Body, only content is specified because author, post and created_at are automatically generated
-        
-    def get_number_of_comments(self, obj):
-        # Since related_name="comments" was defined in the Comment model, 'comments' can be used here.
-        return obj.comments.count()
-    
-    def get_number_of_likes(self, obj):
-        return obj.likes.count()
 
-class CommentSerializer(serializers.ModelSerializer):
+    # Columns read by to_representation, for the querysets of the read views (along with select_related('author'))
+    read_columns = ('author__username', 'title', 'content', 'created_at', 'updated_at', 'comment_count', 'like_count')
+
+    # The dict is built directly: going through every field (get_attribute, to_representation) is most of the time
+    # spent on a page of posts. Same keys, order and values as the fields above, see SerializerParityTests.
+    def to_representation(self, instance):
+        date = self.fields['created_at'].to_representation
+        data = {
+            'id': instance.id,
+            'author': instance.author.username,
+            'title': instance.title,
+            'content': instance.content,
+            'created_at': date(instance.created_at),
+            'updated_at': date(instance.updated_at),
+            'number_of_comments': instance.comment_count,
+            'number_of_likes': instance.like_count,
+        }
+        if hasattr(instance, 'liked_by_me'):
+            data['liked_by_me'] = instance.liked_by_me
+        return data
+
+    # Only the edited columns are written, a full save() would overwrite the counters with the values loaded before the request
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields = [*validated_data, 'updated_at', 'activity_at'])
+        return instance
+
+
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = serializers.CharField(source = "author.username", read_only = True)
-    post_id = serializers.IntegerField(source = "post.id", read_only = True)
+    post_id = serializers.IntegerField(read_only = True)
+    created_at = DateTimeField(read_only = True)
+    parent_id = serializers.IntegerField(read_only = True)
     
     class Meta:
         model = Comment
-        fields = ('id','author','post_id','content','created_at')
-        read_only_fields = ('created_at',)
-        
+        fields = ('id','author','post_id','content','created_at','parent_id','depth','reply_count','descendant_count')
+        read_only_fields = ('created_at','reply_count','descendant_count')
+        list_serializer_class = TimedListSerializer
+
+    read_columns = ('post', 'author__username', 'content', 'created_at', 'parent', 'depth', 'reply_count', 'descendant_count')
+
+    # Built directly, like PostSerializer.to_representation
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'author': instance.author.username,
+            'post_id': instance.post_id,
+            'content': instance.content,
+            'created_at': self.fields['created_at'].to_representation(instance.created_at),
+            'parent_id': instance.parent_id,
+            'depth': instance.depth,
+            'reply_count': instance.reply_count,
+            'descendant_count': instance.descendant_count,
+        }
+
     def update(self, instance, validated_data):
         instance.content = validated_data.get('content', instance.content)
-        instance.save()
+        instance.save(update_fields = ['content'])
         return instance
\ No newline at end of file
@@ -0,0 +1,147 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from .authentication import user_cache_key
+from .cache import response_cache
+from .conditional import touch_post
+from .counters import adjust_counters
+from .models import Post, Comment
+from . import threads
+
+# Sent by PostViewSet.like, which writes the likes table directly. Arguments: post_id, user_id, liked
+post_liked = Signal()
+
+
+# PostViewSet.like writes the join table directly and updates like_count itself. These receivers keep the
+# counters right for every other path: the admin, the shell, post.likes.add(), user.liked_posts.remove()...
+def update_like_count(sender, instance, action, reverse, model, pk_set, **kwargs):
+    liked_model = model if reverse else type(instance)
+    target_field = sender._meta.get_field(liked_model._meta.model_name).attname  # 'post_id' or 'comment_id'
+
+    if reverse:
+        # instance is the User, pk_set holds the ids of the liked posts/comments
+        if action == 'post_add':
+            adjust_counters(liked_model, pk_set, like_count = 1)
+        elif action in ('pre_remove', 'pre_clear'):
+            rows = sender.objects.filter(user_id = instance.pk)
+            if action == 'pre_remove':
+                rows = rows.filter(**{f'{target_field}__in': pk_set})
+            adjust_counters(liked_model, list(rows.values_list(target_field, flat = True)), like_count = -1)
+        return
+
+    # instance is the Post/Comment, pk_set holds user ids
+    if action == 'post_add':
+        adjust_counters(liked_model, instance.pk, like_count = len(pk_set))
+    elif action in ('pre_remove', 'pre_clear'):
+        rows = sender.objects.filter(**{target_field: instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(user_id__in = pk_set)
+        adjust_counters(liked_model, instance.pk, like_count = -rows.count())
+
+
+m2m_changed.connect(update_like_count, sender = Post.likes.through)
+m2m_changed.connect(update_like_count, sender = Comment.likes.through)
+
+
+# Deleting a user cascades to their likes on other people's posts without going through the views (their
+# comments are uncounted one by one by uncount_comment)
+@receiver(pre_delete, sender = User)
+def release_user_counters(sender, instance, **kwargs):
+    adjust_counters(Post, list(Post.likes.through.objects.filter(user = instance).values_list('post_id', flat = True)), like_count = -1)
+    adjust_counters(Comment, list(Comment.likes.through.objects.filter(user = instance).values_list('comment_id', flat = True)), like_count = -1)
+    response_cache.invalidate('posts')
+
+
+# Post.comment_count follows every comment created or deleted, whatever creates or deletes it: the views, the
+# admin, the shell, or a cascade from a deleted parent or user (each cascaded reply is uncounted by its own
+# receiver). Only bulk_create() skips the signals, CommentBulkView adjusts the counter itself.
+
+@receiver(post_save, sender = Comment)
+def count_comment(sender, instance, created, raw = False, **kwargs):
+    if created and not raw:
+        adjust_counters(Post, instance.post_id, comment_count = 1)
+
+
+@receiver(post_delete, sender = Comment)
+def uncount_comment(sender, instance, **kwargs):
+    adjust_counters(Post, instance.post_id, comment_count = -1)  # Nothing to update if the post is being deleted too
+
+
+# Reply threads (Microblog_API/threads.py). A reply takes its position from its parent, and the counters of its
+# ancestors follow every reply created or deleted, whatever deletes it: the views, the admin, or a cascade from
+# a deleted parent, post or user (each cascaded reply is counted once by its own receiver).
+
+@receiver(pre_save, sender = Comment)
+def set_thread_position(sender, instance, raw = False, **kwargs):
+    if raw or not instance._state.adding or instance.parent_id is None:
+        return
+    instance.path = threads.child_path(instance.parent)
+    instance.depth = instance.parent.depth + 1
+
+
+@receiver(post_save, sender = Comment)
+def count_reply(sender, instance, created, raw = False, **kwargs):
+    if created and not raw and instance.parent_id is not None:
+        adjust_counters(Comment, instance.parent_id, reply_count = 1)
+        adjust_counters(Comment, threads.ancestor_ids(instance.path), descendant_count = 1)
+
+
+@receiver(pre_delete, sender = Comment)
+def uncount_reply(sender, instance, **kwargs):
+    if instance.parent_id is not None:
+        adjust_counters(Comment, instance.parent_id, reply_count = -1)
+        adjust_counters(Comment, threads.ancestor_ids(instance.path), descendant_count = -1)
+
+
+# The other changes of comments are counted on the post (adjust_counters), edits only move its activity_at
+@receiver(post_save, sender = Comment)
+def touch_commented_post(sender, instance, created, raw = False, **kwargs):
+    if not created and not raw:
+        touch_post(instance.post_id)
+
+
+# Response cache invalidation. Everything shown under a post (detail, comments, likes) shares the post's scope.
+
+@receiver(post_save, sender = Post)
+@receiver(post_delete, sender = Post)
+def invalidate_post(sender, instance, **kwargs):
+    response_cache.invalidate_post(instance.pk)
+
+
+@receiver(post_save, sender = Comment)
+@receiver(post_delete, sender = Comment)
+def invalidate_comment_post(sender, instance, **kwargs):
+    response_cache.invalidate_post(instance.post_id)
+
+
+@receiver(post_liked)
+def invalidate_liked_post(sender, post_id, **kwargs):
+    response_cache.invalidate_post(post_id)
+
+
+@receiver(m2m_changed, sender = Post.likes.through)
+def invalidate_post_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        response_cache.invalidate_post(instance.pk)
+    elif pk_set:
+        response_cache.invalidate('posts', *[f'post:{pk}' for pk in pk_set])
+    else:
+        response_cache.invalidate('posts')  # user.liked_posts.clear(), entries of those posts expire on their own
+
+
+# Token users read is_staff and friends from a cached copy of the User (see authentication.py)
+@receiver(post_save, sender = User)
+@receiver(post_delete, sender = User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    try:
+        cache.delete(user_cache_key(instance.pk))
+    except Exception:
+        pass  # The entry expires after AUTH_USER_CACHE_TIMEOUT seconds anyway
@@ -1,9 +1,30 @@
-from .models import Post,Comment
+import json
+import threading
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from .models import Post,Comment,Follow,FeedEntry
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Max
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from .authentication import ClaimsRefreshToken
+from .cache import response_cache
+from .jobs import job as background_job
+from .likes import apply_liked_by, get_like_buffer
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
 
 class PostTests(APITestCase):   
     def setUp(self):
@@ -35,7 +56,7 @@ class PostTests(APITestCase):
         response = self.client.get('/api/posts/', format = 'json')
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
         
     def test_logout(self):
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
@@ -47,4 +68,1405 @@ class PostTests(APITestCase):
         response = self.client.post('/api/posts/', data, format='json')
 
         # Verify if it was created successfully
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+class PostQueryCountTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.reader = User.objects.create_user(username = "reader", password = "1234")
+
+    def create_posts(self, amount):
+        for i in range(amount):
+            post = Post.objects.create(author = self.author, title = f"Post {i}", content = "Content")
+            post.likes.add(self.reader)
+            Comment.objects.create(post = post, author = self.reader, content = "Comment")
+        call_command('reconcile_counters', stdout = StringIO())
+
+    # Listing posts must cost the same number of queries no matter how many posts there are
+    def test_list_posts_query_count_is_constant(self):
+        self.create_posts(3)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/posts/', format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.create_posts(20)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/posts/', format = 'json')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['number_of_likes'], 1)
+        self.assertEqual(response.data['results'][0]['number_of_comments'], 1)
+        self.assertEqual(response.data['results'][0]['author'], "author")
+
+    def test_retrieve_post_single_query(self):
+        self.create_posts(1)
+        post = Post.objects.get()
+        with self.assertNumQueries(2):  # The ETag (Post.activity_at, see conditional.py), then the post
+            response = self.client.get(f'/api/posts/{post.id}/', format = 'json')
+        self.assertEqual(response.data['number_of_likes'], 1)
+        self.assertEqual(response.data['number_of_comments'], 1)
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.post = Post.objects.create(author = self.author, title = "Thread", content = "Content")
+
+    def walk(self, url, link = 'next'):
+        ids = []
+        while url:
+            response = self.client.get(url, format = 'json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data[link]
+        return ids
+
+    def test_posts_are_paginated_by_created_at(self):
+        for i in range(24):
+            Post.objects.create(author = self.author, title = f"Post {i}", content = "Content")
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat = True))
+
+        self.assertEqual(self.walk('/api/posts/?page_size=7'), expected)
+
+    def test_posts_pagination_with_ordering_and_null_titles(self):
+        for i in range(6):
+            Post.objects.create(author = self.author, title = "Same" if i % 2 else None, content = "Content")
+        expected = [p.id for p in sorted(Post.objects.all(), key = lambda p: (p.title is None, p.title or "", p.id))]
+
+        self.assertEqual(self.walk('/api/posts/?ordering=title&page_size=2'), expected)
+
+    def test_previous_link_returns_to_previous_page(self):
+        for i in range(9):
+            Post.objects.create(author = self.author, title = f"Post {i}", content = "Content")
+        first = self.client.get('/api/posts/?page_size=4', format = 'json')
+        second = self.client.get(first.data['next'], format = 'json')
+        back = self.client.get(second.data['previous'], format = 'json')
+
+        self.assertIsNone(first.data['previous'])
+        self.assertEqual([p['id'] for p in back.data['results']], [p['id'] for p in first.data['results']])
+
+    def test_page_size_is_capped(self):
+        for i in range(110):
+            Post.objects.create(author = self.author, title = f"Post {i}", content = "Content")
+        response = self.client.get('/api/posts/?page_size=1000', format = 'json')
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/posts/?cursor=garbage', format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_comments_are_paginated(self):
+        for i in range(12):
+            Comment.objects.create(post = self.post, author = self.author, content = f"Comment {i}")
+        expected = list(Comment.objects.order_by('created_at', 'id').values_list('id', flat = True))
+
+        self.assertEqual(self.walk(f'/api/posts/{self.post.id}/comments/?ordering=created_at&page_size=5'), expected)
+
+
+class CounterTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.reader = User.objects.create_user(username = "reader", password = "1234")
+        self.post = Post.objects.create(author = self.author, title = "Post", content = "Content")
+
+    def counters(self):
+        self.post.refresh_from_db()
+        return self.post.like_count, self.post.comment_count
+
+    def test_like_toggle_updates_like_count(self):
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(self.counters(), (1, 0))
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_comments_update_comment_count(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.post(f'/api/posts/{self.post.id}/comments/', {'content': 'Hi'}, format = 'json')
+        self.assertEqual(self.counters(), (0, 1))
+        self.client.delete(f'/api/posts/{self.post.id}/comments/{response.data["id"]}/')
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_editing_a_post_keeps_counters(self):
+        self.client.force_authenticate(self.author)
+        self.post.likes.add(self.reader)
+        response = self.client.patch(f'/api/posts/{self.post.id}/', {'title': 'Edited'}, format = 'json')
+        self.assertEqual(response.data['number_of_likes'], 1)
+        self.assertEqual(self.counters(), (1, 0))
+
+    def test_m2m_changes_and_user_deletion(self):
+        comment = Comment.objects.create(post = self.post, author = self.reader, content = "Hi")
+        self.reader.liked_posts.add(self.post)
+        comment.likes.add(self.author)
+        self.assertEqual(self.counters(), (1, 1))
+
+        self.reader.delete()
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_comments_outside_the_views_are_counted(self):
+        comment = Comment.objects.create(post = self.post, author = self.reader, content = "Hi")
+        reply = Comment.objects.create(post = self.post, author = self.author, content = "Reply", parent = comment)
+        Comment.objects.create(post = self.post, author = self.author, content = "Nested", parent = reply)
+        self.assertEqual(self.counters(), (0, 3))
+        comment.delete()  # The replies go with it
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_reconcile_counters_fixes_drift(self):
+        Comment.objects.create(post = self.post, author = self.reader, content = "Hi")
+        Post.objects.filter(id = self.post.id).update(like_count = 7)
+        call_command('reconcile_counters', stdout = StringIO())
+        self.assertEqual(self.counters(), (0, 1))
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.fallback.clear()
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.post = Post.objects.create(author = self.author, title = "Post", content = "Content")
+
+    def test_anonymous_reads_are_cached(self):
+        first = self.client.get('/api/posts/?ordering=title&search=')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/posts/?ordering=title')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+
+    def test_authenticated_reads_are_not_cached(self):
+        self.client.force_authenticate(self.author)
+        self.client.get(f'/api/posts/{self.post.id}/')
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertFalse(response.has_header('X-Cache'))
+
+    def test_comment_invalidates_post_and_list(self):
+        self.client.get(f'/api/posts/{self.post.id}/comments/')
+        self.client.get('/api/posts/')
+        Comment.objects.create(post = self.post, author = self.author, content = "New")
+
+        comments = self.client.get(f'/api/posts/{self.post.id}/comments/')
+        self.assertEqual(comments['X-Cache'], 'MISS')
+        self.assertEqual(len(comments.data['results']), 1)
+        self.assertEqual(self.client.get('/api/posts/')['X-Cache'], 'MISS')
+
+    def test_like_invalidates_post(self):
+        self.client.get(f'/api/posts/{self.post.id}/')
+        self.client.force_authenticate(self.author)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client.force_authenticate(None)
+
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['number_of_likes'], 1)
+
+    def test_other_posts_stay_cached(self):
+        other = Post.objects.create(author = self.author, title = "Other", content = "Content")
+        self.client.get(f'/api/posts/{other.id}/')
+        self.post.title = "Edited"
+        self.post.save()
+        self.assertEqual(self.client.get(f'/api/posts/{other.id}/')['X-Cache'], 'HIT')
+
+    def test_falls_back_to_memory_when_backend_fails(self):
+        with mock.patch.object(cache, 'get', side_effect = ConnectionError), mock.patch.object(cache, 'set', side_effect = ConnectionError):
+            self.client.get(f'/api/posts/{self.post.id}/')
+            response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertGreater(response_cache.stats()['fallback_hits'], 0)
+        response_cache._down_until = 0
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.running = Post.objects.create(author = self.author, title = "Running shoes", content = "I ran a marathon")
+        self.cooking = Post.objects.create(author = self.author, title = "Cooking", content = "Pasta with shoes on")
+        self.other = Post.objects.create(author = self.author, title = "Other", content = "Nothing here")
+        Comment.objects.create(post = self.other, author = self.author, content = "Great marathon")
+        Comment.objects.create(post = self.other, author = self.author, content = "Boring")
+
+    def search(self, url):
+        return [item['id'] for item in self.client.get(url).data['results']]
+
+    def test_search_posts(self):
+        self.assertCountEqual(self.search('/api/posts/?search=shoes'), [self.running.id, self.cooking.id])
+
+    def test_search_comments(self):
+        self.assertEqual(len(self.search(f'/api/posts/{self.other.id}/comments/?search=marathon')), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', "Full-text search requires Postgres")
+    def test_search_is_ranked_and_stemmed(self):
+        # The title weighs more than the content, and 'run' matches 'Running' through stemming
+        self.assertEqual(self.search('/api/posts/?search=shoes'), [self.running.id, self.cooking.id])
+        self.assertEqual(self.search('/api/posts/?search=run'), [self.running.id])
+
+
+class FeedTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username = "reader", password = "1234")
+        self.followed = User.objects.create_user(username = "followed", password = "1234")
+        self.stranger = User.objects.create_user(username = "stranger", password = "1234")
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/users/{self.followed.id}/follow/')
+
+    def publish(self, user, title):
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/posts/', {'title': title, 'content': 'Content'}, format = 'json')
+        self.client.force_authenticate(self.reader)
+        return response.data['id']
+
+    def feed(self, url = '/api/feed/'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_feed_shows_followed_and_own_posts(self):
+        first = self.publish(self.followed, "First")
+        self.publish(self.stranger, "Not followed")
+        mine = self.publish(self.reader, "Mine")
+        second = self.publish(self.followed, "Second")
+
+        self.assertEqual(self.feed('/api/feed/?page_size=2'), [second, mine, first])
+        self.assertEqual(FeedEntry.objects.filter(user = self.reader).count(), 3)
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        old = self.publish(self.stranger, "Old post")
+        self.client.post(f'/api/users/{self.stranger.id}/follow/')
+        self.assertEqual(self.feed(), [old])
+
+        response = self.client.post(f'/api/users/{self.stranger.id}/follow/')
+        self.assertEqual(response.data['detail'], "Unfollowed")
+        self.assertEqual(self.feed(), [])
+
+    def test_cannot_follow_yourself(self):
+        response = self.client.post(f'/api/users/{self.reader.id}/follow/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(FEED_FANOUT_THRESHOLD = 1)
+    def test_celebrity_posts_are_pulled_on_read(self):
+        cache.clear()
+        Follow.objects.create(follower = self.stranger, followee = self.reader)
+        popular = [self.publish(self.followed, f"Popular {i}") for i in range(3)]
+        mine = self.publish(self.reader, "Mine")
+
+        self.assertFalse(FeedEntry.objects.filter(user = self.reader, author = self.followed).exists())
+        self.assertEqual(self.feed('/api/feed/?page_size=3'), [mine] + popular[::-1])
+
+    def test_pulled_posts_stay_after_the_author_drops_under_the_threshold(self):
+        with override_settings(FEED_FANOUT_THRESHOLD = 1):
+            cache.clear()
+            popular = self.publish(self.followed, "Popular")
+        cache.clear()
+        later = self.publish(self.followed, "Later")
+        self.assertEqual(self.feed(), [later, popular])
+
+        # New followers of a celebrity get their latest posts copied like anyone else's
+        with override_settings(FEED_FANOUT_THRESHOLD = 1):
+            cache.clear()
+            self.client.force_authenticate(self.stranger)
+            self.client.post(f'/api/users/{self.followed.id}/follow/')
+            self.assertEqual(self.feed(), [later, popular])
+
+    def test_feed_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/feed/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(LIKE_BUFFER = 'memory', LIKE_BUFFER_FLUSH_INTERVAL = 3600, LIKE_BUFFER_MAX_PENDING = 1000)
+class LikeBufferTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.fans = [User.objects.create_user(username = f"fan{i}", password = "1234") for i in range(3)]
+        self.post = Post.objects.create(author = self.author, title = "Viral", content = "Content")
+        self.buffer = get_like_buffer()
+        self.buffer.flush()
+
+    def toggle(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(f'/api/posts/{self.post.id}/like/').data['detail']
+
+    def test_toggles_are_buffered_and_merged_on_read(self):
+        for fan in self.fans:
+            self.assertEqual(self.toggle(fan), "Like added")
+        self.assertEqual(self.toggle(self.fans[0]), "Like removed")
+
+        self.assertEqual(Post.likes.through.objects.count(), 0)
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/').data['number_of_likes'], 2)
+        self.assertCountEqual(self.client.get(f'/api/posts/{self.post.id}/likes/').data['users'], ["fan1", "fan2"])
+
+    def test_flush_writes_collapsed_toggles_in_bulk(self):
+        self.post.likes.add(self.fans[2])
+        for fan in self.fans:
+            self.toggle(fan)
+        self.toggle(self.fans[1])
+        self.toggle(self.fans[1])  # Back to liked, collapses into a single pending like
+
+        # One INSERT, one DELETE and one recount, plus the savepoint of the transaction
+        with self.assertNumQueries(5):
+            self.assertEqual(self.buffer.flush(), 3)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+        self.assertCountEqual(self.post.likes.values_list('username', flat = True), ["fan0", "fan1"])
+
+    def test_failed_flush_is_retried(self):
+        self.toggle(self.fans[0])
+        with mock.patch('Microblog_API.likes.write_likes', side_effect = RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/').data['number_of_likes'], 1)
+        self.toggle(self.fans[1])
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(Post.likes.through.objects.count(), 2)
+
+    def test_memory_buffer_is_flushed_without_further_toggles(self):
+        from .likes import InProcessLikeStore, LikeBuffer
+        self.assertTrue(self.buffer._flusher.is_alive())
+        self.toggle(self.fans[0])
+        with override_settings(LIKE_BUFFER = None):
+            self.buffer.flush_at_exit()  # No longer the configured buffer
+        self.assertEqual(Post.likes.through.objects.count(), 0)
+        self.buffer.flush_at_exit()
+        self.assertEqual(Post.likes.through.objects.count(), 1)
+
+        buffer = LikeBuffer(InProcessLikeStore(), 'memory')
+        flushed = threading.Event()
+        with override_settings(LIKE_BUFFER_FLUSH_INTERVAL = 0.01), mock.patch.object(buffer, 'try_flush', side_effect = flushed.set):
+            buffer.start_flusher()
+            self.assertTrue(flushed.wait(5))
+            buffer.stop()
+        buffer._flusher.join(5)
+        self.assertFalse(buffer._flusher.is_alive())
+
+    def test_flush_likes_command_needs_redis(self):
+        with self.assertRaisesMessage(CommandError, "'redis'"):
+            call_command('flush_likes')
+
+
+class BulkTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.other = User.objects.create_user(username = "other", password = "1234")
+        self.client.force_authenticate(self.author)
+
+    def test_bulk_create_posts(self):
+        items = [{'title': f'Post {i}', 'content': 'Imported'} for i in range(50)]
+        # insert, fan-out (posts re-read by the eager job, followers + entries), celebrities, savepoint
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/posts/bulk/', items, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([p['title'] for p in response.data['results']], [i['title'] for i in items])
+        self.assertEqual(Post.objects.filter(author = self.author).count(), 50)
+
+    def test_bulk_create_is_all_or_nothing(self):
+        items = [{'title': 'Valid', 'content': 'Content'}, {'title': 'No content'}]
+        response = self.client.post('/api/posts/bulk/', items, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors'][0], {})
+        self.assertIn('content', response.data['errors'][1])
+        self.assertEqual(Post.objects.count(), 0)
+
+    @override_settings(BULK_MAX_ITEMS = 3)
+    def test_bulk_limit(self):
+        items = [{'title': 'Post', 'content': 'Content'}] * 4
+        response = self.client.post('/api/posts/bulk/', items, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_posts(self):
+        mine = Post.objects.create(author = self.author, title = "Mine", content = "Content")
+        theirs = Post.objects.create(author = self.other, title = "Theirs", content = "Content")
+
+        response = self.client.patch('/api/posts/bulk/', [{'id': mine.id, 'title': 'Edited'}, {'id': theirs.id, 'title': 'Hacked'}], format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors'][0], {})
+
+        response = self.client.patch('/api/posts/bulk/', [{'id': mine.id, 'title': 'Edited'}], format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mine.refresh_from_db()
+        self.assertEqual(mine.title, "Edited")
+        self.assertGreater(mine.updated_at, mine.created_at)
+
+    def test_bulk_delete_posts(self):
+        mine = Post.objects.create(author = self.author, title = "Mine", content = "Content")
+        theirs = Post.objects.create(author = self.other, title = "Theirs", content = "Content")
+
+        response = self.client.delete('/api/posts/bulk/', {'ids': [mine.id, theirs.id, 999]}, format = 'json')
+        self.assertEqual([r['status'] for r in response.data['results']], [204, 403, 404])
+        self.assertEqual(list(Post.objects.values_list('id', flat = True)), [theirs.id])
+
+    def test_bulk_comments(self):
+        post = Post.objects.create(author = self.other, title = "Post", content = "Content")
+        url = f'/api/posts/{post.id}/comments/bulk/'
+        response = self.client.post(url, [{'content': f'Comment {i}'} for i in range(5)], format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ids = [c['id'] for c in response.data['results']]
+
+        self.client.patch(url, [{'id': ids[0], 'content': 'Edited'}], format = 'json')
+        self.client.delete(url, {'ids': ids[1:3]}, format = 'json')
+
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 3)
+        self.assertEqual(Comment.objects.get(id = ids[0]).content, "Edited")
+
+
+@skipUnless(connection.vendor == 'postgresql', "EXPLAIN output is checked on Postgres only")
+class IndexTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.post = Post.objects.create(author = self.author, title = "Post", content = "Content")
+        Comment.objects.create(post = self.post, author = self.author, content = "Comment")
+        with connection.cursor() as cursor:
+            # The tables are tiny here, a sequential scan would always win
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotIn('Sort', plan)  # Rows come out of the index already ordered
+
+    def test_post_list(self):
+        self.assertUsesIndex(Post.objects.order_by('-created_at', '-id')[:20], 'post_created_idx')
+
+    def test_posts_of_author(self):
+        self.assertUsesIndex(Post.objects.filter(author = self.author).order_by('-created_at', '-id')[:20], 'post_author_created_idx')
+
+    def test_comments_of_post(self):
+        self.assertUsesIndex(Comment.objects.filter(post = self.post).order_by('-created_at', '-id')[:20], 'comment_post_created_idx')
+
+    def test_default_ordering_uses_index(self):
+        self.assertUsesIndex(Post.objects.all()[:20], 'post_created_idx')
+
+
+class AuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username = "martin", password = "1234")
+        self.other = User.objects.create_user(username = "other", password = "1234")
+        self.post = Post.objects.create(author = self.user, title = "Post", content = "Content")
+
+    def login(self, user):
+        self.client.credentials()
+        response = self.client.post('/api/login/', {'username': user.username, 'password': '1234'}, format = 'json')
+        self.client.credentials(HTTP_AUTHORIZATION = f"Bearer {response.data['access']}")
+
+    def test_token_requests_skip_user_query(self):
+        self.login(self.user)
+        self.client.get('/api/feed/')
+        self.client.post(f'/api/posts/{self.post.id}/like/')  # Writes check the account, loaded once into the cache
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/feed/')
+            response = self.client.post(f'/api/posts/{self.post.id}/like/')
+            response = self.client.post('/api/posts/', {'title': 'New', 'content': 'Content'}, format = 'json')
+        self.assertEqual(response.data['author'], "martin")
+        self.assertFalse([q for q in ctx.captured_queries if 'auth_user' in q['sql']])
+
+    def test_deleted_or_inactive_users_cannot_write(self):
+        self.login(self.other)
+        self.other.is_active = False
+        self.other.save()
+        response = self.client.post('/api/posts/', {'title': 'New', 'content': 'Content'}, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get('/api/posts/').status_code, status.HTTP_200_OK)  # Reads still trust the token
+
+        self.login(self.user)
+        self.user.delete()
+        for response in (
+            self.client.post('/api/posts/', {'title': 'New', 'content': 'Content'}, format = 'json'),
+            self.client.post(f'/api/posts/{self.post.id}/like/'),
+        ):
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(Post.objects.exists())
+
+    def test_author_checks_compare_ids(self):
+        self.login(self.other)
+        response = self.client.put(f'/api/posts/{self.post.id}/', {'title': 'Hacked', 'content': 'Content'}, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.login(self.user)
+        response = self.client.put(f'/api/posts/{self.post.id}/', {'title': 'Edited', 'content': 'Content'}, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_admin_checks_load_the_user(self):
+        self.login(self.user)
+        self.assertEqual(self.client.get('/api/cache/stats/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()  # Drops the cached copy
+        self.assertEqual(self.client.get('/api/cache/stats/').status_code, status.HTTP_200_OK)
+
+    def test_unknown_attributes_raise(self):
+        from .authentication import ClaimsUser
+        user = ClaimsUser(ClaimsRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(user.email, self.user.email)  # Read from the User row
+        with self.assertRaises(AttributeError):
+            user.is_superusr
+        self.user.delete()
+        cache.clear()
+        with self.assertRaises(AttributeError):
+            ClaimsUser(user.token).email
+
+    def test_token_without_username_claim(self):
+        access = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION = f"Bearer {access}")
+        response = self.client.post(f'/api/posts/{self.post.id}/comments/', {'content': 'Comment'}, format = 'json')
+        self.assertEqual(response.data['author'], "martin")
+
+
+@override_settings(TOKEN_REVOCATION_CACHE = True)
+class TokenRevocationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username = "martin", password = "1234")
+        response = self.client.post('/api/login/', {'username': "martin", 'password': "1234"}, format = 'json')
+        self.access = response.data['access']
+        self.refresh = response.data['refresh']
+
+    def logout(self):
+        self.client.credentials(HTTP_AUTHORIZATION = f"Bearer {self.access}")
+        response = self.client.post('/api/logout/', {'refresh': self.refresh}, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+
+    def refresh_token(self):
+        return self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format = 'json')
+
+    def test_issued_tokens_are_not_stored(self):
+        self.assertFalse(OutstandingToken.objects.exists())
+        self.assertEqual(self.refresh_token().status_code, status.HTTP_200_OK)
+
+    def test_revoked_token_is_checked_in_the_cache(self):
+        self.logout()
+        with self.assertNumQueries(0):
+            response = self.refresh_token()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocations_survive_a_cache_flush(self):
+        self.logout()
+        cache.clear()
+        self.assertEqual(self.refresh_token().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_REVOCATION_RELOAD_INTERVAL = 60)
+    def test_evicted_revocations_are_reloaded(self):
+        from . import revocation
+        self.logout()
+        cache.clear()
+        with mock.patch.object(cache, 'set', wraps = cache.set) as cache_set:
+            self.assertEqual(self.refresh_token().status_code, status.HTTP_401_UNAUTHORIZED)  # Loads the cache
+        cache_set.assert_any_call(revocation.LOADED_KEY, 1, 60)
+
+        # The jti is evicted, once the marker expires the next check finds it in the database again
+        jti = RefreshToken(self.refresh, verify = False)['jti']
+        cache.delete_many([revocation.key_for(jti), revocation.LOADED_KEY])
+        self.assertEqual(self.refresh_token().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_REVOCATION_CACHE = False)
+    def test_database_checks_without_cache(self):
+        self.logout()
+        self.assertEqual(self.refresh_token().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_purge_tokens(self):
+        self.logout()
+        OutstandingToken.objects.create(jti = "expired", token = "", expires_at = timezone.now() - timedelta(days = 1))
+        out = StringIO()
+        call_command('purge_tokens', stdout = out)
+        self.assertIn("Deleted 1", out.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+
+
+class AsyncReadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.reader = User.objects.create_user(username = "reader", password = "1234")
+        self.post = Post.objects.create(author = self.author, title = "Post", content = "Content")
+        Post.objects.bulk_create([Post(author = self.reader, title = f"Post {i}", content = "Content") for i in range(25)])
+        self.post.likes.add(self.reader)
+        Comment.objects.create(post = self.post, author = self.reader, content = "Comment")
+        self.access = str(ClaimsRefreshToken.for_user(self.reader).access_token)
+
+    async def assertSameResponse(self, url, **headers):
+        await sync_to_async(cache.clear)()
+        expected = await sync_to_async(self.client.get)(url, headers = headers)
+        await sync_to_async(cache.clear)()
+        with mock.patch('Microblog_API.async_views.delegate') as delegate:
+            response = await self.async_client.get(url, headers = headers)
+        delegate.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    async def test_reads_match_the_sync_views(self):
+        response = await self.assertSameResponse('/api/posts/?page_size=10&ordering=title')
+        await self.assertSameResponse(response.json()['next'].replace('http://testserver', ''))
+        await self.assertSameResponse(f'/api/posts/{self.post.id}/')
+        await self.assertSameResponse(f'/api/posts/{self.post.id}/likes/')
+        await self.assertSameResponse(f'/api/posts/{self.post.id}/likes/?page_size=1', Authorization = f'Bearer {self.access}')
+        await self.assertSameResponse(f'/api/posts/{self.post.id}/comments/?search=comment')
+        response = await self.assertSameResponse('/api/posts/', Authorization = f'Bearer {self.access}')
+        self.assertFalse(response.has_header('X-Cache'))  # Authenticated, the cache is skipped
+
+    async def test_anonymous_reads_share_the_response_cache(self):
+        await sync_to_async(self.client.get)('/api/posts/')
+        response = await self.async_client.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    async def test_other_requests_go_to_the_sync_views(self):
+        headers = {'Authorization': f'Bearer {self.access}'}
+        response = await self.async_client.post('/api/posts/', {'title': 'New', 'content': 'Content'}, content_type = 'application/json', headers = headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = await self.async_client.get(f'/api/posts/?author={self.author.id}')
+        self.assertEqual([post['id'] for post in response.json()['results']], [self.post.id])
+
+        self.assertEqual((await self.async_client.get('/api/posts/999999/')).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual((await self.async_client.get('/api/posts/?cursor=nope')).status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.get('/api/posts/', headers = {'Authorization': 'Bearer nope'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(EXPORT_CHUNK_SIZE = 3)
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.other = User.objects.create_user(username = "other", password = "1234")
+        Post.objects.bulk_create([Post(author = self.author, title = f"Post {i}", content = "Content") for i in range(10)])
+        self.post = Post.objects.create(author = self.other, title = "Other", content = "Content")
+        Comment.objects.bulk_create([Comment(post = self.post, author = self.author, content = f"Comment {i}") for i in range(4)])
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content)
+
+    def test_export_posts_as_json_array(self):
+        with self.assertNumQueries(1):  # One cursor, read a chunk at a time
+            body = self.read(self.client.get('/api/posts/export/'))
+        listed = self.client.get('/api/posts/?page_size=100').json()['results']
+        self.assertEqual(json.loads(body), listed)
+
+    def test_export_as_ndjson(self):
+        response = self.client.get(f'/api/posts/export/?format=ndjson&author={self.author.id}')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = self.read(response).splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(json.loads(lines[0])['title'], "Post 9")
+
+        response = self.client.get(f'/api/posts/{self.post.id}/comments/export/', HTTP_ACCEPT = 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['content'] for line in self.read(response).splitlines()], [f"Comment {i}" for i in range(3, -1, -1)])
+
+    async def test_export_under_asgi(self):
+        response = await self.async_client.get(f'/api/posts/{self.post.id}/comments/export/')
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(json.loads(body)), 4)
+
+
+class RendererTests(APITestCase):
+    def test_same_bytes_as_drf_renderer(self):
+        from decimal import Decimal
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.utils.serializer_helpers import ReturnDict
+        from .renderers import ORJSONRenderer
+        data = {
+            "text": "ñandú \u2028 \u2029 \"quoted\" </script>",
+            "nested": [ReturnDict({"id": 1}, serializer = None), None, True, 1.5],
+            "decimal": Decimal("1.10"),
+            "date": timezone.now(),
+            1: "integer key",
+            "big": 2 ** 70,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_non_finite_floats_are_rejected_like_drf(self):
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import ORJSONRenderer
+        for value in (float('nan'), float('inf'), -float('inf')):
+            data = {"title": None, "scores": [1.5, value]}
+            with self.subTest(value = value), self.assertRaises(ValueError):
+                ORJSONRenderer().render(data)
+        loose = type('LooseRenderer', (ORJSONRenderer,), {'strict': False})()  # STRICT_JSON = False
+        self.assertEqual(loose.render({"score": float('nan')}), b'{"score":NaN}')
+        self.assertEqual(ORJSONRenderer().render({"title": None}), JSONRenderer().render({"title": None}))
+
+    def test_parser_matches_drf_parser(self):
+        from io import BytesIO
+        from rest_framework.exceptions import ParseError
+        from rest_framework.parsers import JSONParser
+        from .renderers import ORJSONParser
+        body = json.dumps({"title": "ñ", "values": [1, 2.5, None, 2 ** 70]}).encode()
+        self.assertEqual(ORJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"title": NaN}'))
+
+    def test_datetime_field_matches_strftime(self):
+        from datetime import datetime, timezone as dt_timezone
+        from .serializers import DateTimeField, compile_datetime_format
+        value = datetime(2024, 3, 7, 5, 4, 9, 12, tzinfo = dt_timezone(timedelta(hours = -3)))
+        for output_format in ("%d/%m/%Y - %H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f 100%%", "%d %B %Y", "iso-8601"):
+            with self.subTest(output_format = output_format):
+                self.assertEqual(
+                    DateTimeField(format = output_format).to_representation(value),
+                    super(DateTimeField, DateTimeField(format = output_format)).to_representation(value),
+                )
+        self.assertIsNone(compile_datetime_format("%d %B %Y"))
+
+        post = Post.objects.create(author = User.objects.create_user(username = "martin", password = "1234"), title = "Title", content = "Content")
+        response = self.client.get(f'/api/posts/{post.id}/')
+        self.assertEqual(response.data['created_at'], timezone.localtime(post.created_at).strftime("%d/%m/%Y - %H:%M:%S"))
+
+
+class SerializerParityTests(APITestCase):
+    def setUp(self):
+        from .serializers import CommentSerializer, PostSerializer
+        self.author = User.objects.create_user(username = "martín", password = "1234")
+        self.posts = [
+            Post.objects.create(author = self.author, title = "Título   \"quoted\"", content = "Contenido ñ"),
+            Post.objects.create(author = self.author, title = None, content = ""),
+        ]
+        Post.objects.filter(id = self.posts[0].id).update(like_count = 3, comment_count = 2)
+        Comment.objects.create(post = self.posts[0], author = self.author, content = "Comentario")
+        self.serializers = (PostSerializer, CommentSerializer)
+
+    def stock(self, serializer_class, instances):
+        from rest_framework import serializers
+        from rest_framework.renderers import JSONRenderer
+
+        class StockSerializer(serializer_class):
+            def to_representation(self, instance):
+                return serializers.ModelSerializer.to_representation(self, instance)
+        return JSONRenderer().render(StockSerializer(instances, many = True).data)
+
+    def test_same_json_as_model_serializer(self):
+        from rest_framework.renderers import JSONRenderer
+        for tz in ("UTC", "America/Argentina/Buenos_Aires"):
+            for serializer_class in self.serializers:
+                model = serializer_class.Meta.model
+                instances = list(model.objects.select_related('author').only(*serializer_class.read_columns))
+                if model is Post:
+                    apply_liked_by(self.author, instances[:1])  # With and without the flag
+                with self.subTest(serializer = serializer_class.__name__, tz = tz), timezone.override(tz):
+                    self.assertEqual(JSONRenderer().render(serializer_class(instances, many = True).data), self.stock(serializer_class, instances))
+                    self.assertEqual(list(serializer_class(instances[0]).data), list(serializer_class.Meta.fields))
+
+    def test_read_views_load_only_the_serialized_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/posts/')
+            self.client.get(f'/api/posts/{self.posts[0].id}/comments/')
+        self.assertEqual(len(response.data['results']), 2)
+        for query in queries.captured_queries:
+            self.assertNotIn('password', query['sql'])
+            self.assertNotIn('search_vector', query['sql'])
+
+
+class ThreadTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username = "martin", password = "1234")
+        self.other = User.objects.create_user(username = "other", password = "1234")
+        self.post = Post.objects.create(author = self.author, title = "Title", content = "Content")
+        self.client.force_authenticate(self.author)
+        self.root = self.comment(f'/api/posts/{self.post.id}/comments/', "Root")
+        self.first = self.reply(self.root, "First reply")
+        self.nested = self.reply(self.first, "Nested reply")
+        self.second = self.reply(self.root, "Second reply")
+        self.client.force_authenticate(None)
+
+    def comment(self, url, content):
+        response = self.client.post(url, {"content": content}, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def reply(self, comment_id, content):
+        return self.comment(f'/api/posts/{self.post.id}/comments/{comment_id}/replies/', content)
+
+    def counts(self, comment_id):
+        return Comment.objects.values_list('reply_count', 'descendant_count').get(id = comment_id)
+
+    def test_replies_keep_the_counters_of_their_ancestors(self):
+        self.assertEqual(self.counts(self.root), (2, 3))
+        self.assertEqual(self.counts(self.first), (1, 1))
+        nested = Comment.objects.get(id = self.nested)
+        self.assertEqual((nested.parent_id, nested.depth), (self.first, 2))
+        self.assertEqual(Post.objects.get(id = self.post.id).comment_count, 4)
+
+    def test_thread_in_one_query(self):
+        url = f'/api/posts/{self.post.id}/comments/{self.root}/thread/'
+        with self.assertNumQueries(3):  # The ETag, the comment, then its whole subtree
+            thread = self.client.get(url).data
+        self.assertEqual(thread['content'], "Root")
+        self.assertEqual([reply['content'] for reply in thread['replies']], ["First reply", "Second reply"])
+        self.assertEqual(thread['replies'][0]['replies'][0]['content'], "Nested reply")
+
+        shallow = self.client.get(url, {'depth': 1}).data
+        self.assertEqual(shallow['replies'][0]['replies'], [])
+        self.assertEqual(shallow['replies'][0]['reply_count'], 1)
+
+    def test_replies_are_paginated_oldest_first(self):
+        url = f'/api/posts/{self.post.id}/comments/{self.root}/replies/'
+        page = self.client.get(url, {'page_size': 1}).data
+        self.assertEqual([reply['content'] for reply in page['results']], ["First reply"])
+        page = self.client.get(page['next']).data
+        self.assertEqual([reply['content'] for reply in page['results']], ["Second reply"])
+        self.assertIsNone(page['next'])
+
+    def test_deleting_a_reply_removes_its_subtree(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'/api/posts/{self.post.id}/comments/{self.first}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Comment.objects.filter(id = self.nested).exists())
+        self.assertEqual(self.counts(self.root), (1, 1))
+        self.assertEqual(Post.objects.get(id = self.post.id).comment_count, 2)
+
+    def test_deleting_a_user_releases_the_replies_to_their_comments(self):
+        post = Post.objects.create(author = self.other, title = "Other", content = "Content")
+        self.client.force_authenticate(self.author)
+        top = self.comment(f'/api/posts/{post.id}/comments/', "By martin")
+        self.client.force_authenticate(self.other)
+        kept = self.comment(f'/api/posts/{post.id}/comments/', "Kept")
+        self.comment(f'/api/posts/{post.id}/comments/{top}/replies/', "Reply by other")
+        self.comment(f'/api/posts/{post.id}/comments/{kept}/replies/', "Kept reply")
+
+        self.author.delete()
+        self.assertEqual(Post.objects.get(id = post.id).comment_count, 2)
+        self.assertEqual(self.counts(kept), (1, 1))
+
+    def test_max_depth(self):
+        self.client.force_authenticate(self.author)
+        with override_settings(COMMENT_MAX_DEPTH = 2):
+            response = self.client.post(f'/api/posts/{self.post.id}/comments/{self.nested}/replies/', {"content": "Too deep"}, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reconcile_fixes_thread_counters(self):
+        Comment.objects.update(reply_count = 0, descendant_count = 7)
+        call_command('reconcile_counters', stdout = StringIO())
+        self.assertEqual(self.counts(self.root), (2, 3))
+        self.assertEqual(self.counts(self.first), (1, 1))
+        self.assertEqual(self.counts(self.nested), (0, 0))
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username = "martin", password = "1234")
+        self.post = Post.objects.create(author = self.author, title = "Title", content = "Content")
+        self.comment = Comment.objects.create(post = self.post, author = self.author, content = "Comment")
+        self.urls = [f'/api/posts/{self.post.id}/', f'/api/posts/{self.post.id}/comments/']
+
+    def assertNotModified(self, url, **headers):
+        with mock.patch('Microblog_API.serializers.PostSerializer.to_representation') as serialize:
+            with self.assertNumQueries(1):  # activity_at of the post
+                response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        serialize.assert_not_called()
+        return response
+
+    def test_matching_etag_returns_304(self):
+        for url in self.urls:
+            with self.subTest(url = url):
+                response = self.client.get(url)
+                self.assertIn('ETag', response)
+                self.assertIn('Last-Modified', response)
+                self.assertEqual(self.assertNotModified(url, HTTP_IF_NONE_MATCH = response['ETag'])['ETag'], response['ETag'])
+                self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE = response['Last-Modified'])
+
+    def test_changes_under_the_post_change_the_etag(self):
+        self.client.force_authenticate(self.author)
+        changes = [
+            lambda: self.client.patch(f'/api/posts/{self.post.id}/', {"content": "Edited"}, format = 'json'),
+            lambda: self.client.post(f'/api/posts/{self.post.id}/like/'),
+            lambda: self.client.post(f'/api/posts/{self.post.id}/comments/', {"content": "New"}, format = 'json'),
+            lambda: self.client.put(f'/api/posts/{self.post.id}/comments/{self.comment.id}/', {"content": "Edited"}, format = 'json'),
+            lambda: self.client.delete(f'/api/posts/{self.post.id}/comments/{self.comment.id}/'),
+        ]
+        etag = self.client.get(self.urls[0])['ETag']
+        for change in changes:
+            self.assertLess(change().status_code, 300)
+            response = self.client.get(self.urls[1], HTTP_IF_NONE_MATCH = etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+
+    @override_settings(LIKE_BUFFER = 'memory', LIKE_BUFFER_FLUSH_INTERVAL = 3600)
+    def test_etags_follow_the_user_and_the_buffered_toggles(self):
+        from .likes import InProcessLikeStore
+        reader = User.objects.create_user(username = "reader", password = "1234")
+        self.post.likes.add(reader)
+        url = self.urls[0]
+        anonymous = self.client.get(url)['ETag']
+        self.client.force_authenticate(self.author)
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(etag, anonymous)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH = anonymous).status_code, status.HTTP_200_OK)
+
+        with mock.patch.object(get_like_buffer(), 'store', InProcessLikeStore()):  # Without the toggles of other tests
+            # A like and an unlike by different users leave like_count where it was
+            self.client.post(f'/api/posts/{self.post.id}/like/')
+            self.client.force_authenticate(reader)
+            self.client.post(f'/api/posts/{self.post.id}/like/')
+
+            self.client.force_authenticate(self.author)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.data['liked_by_me'])
+            self.assertEqual(response.data['number_of_likes'], 1)
+            self.client.force_authenticate(None)
+            self.assertNotEqual(self.client.get(url)['ETag'], anonymous)
+
+    async def test_async_views_answer_conditional_requests(self):
+        response = await self.async_client.get(self.urls[0])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.get(self.urls[0], headers = {'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        from .throttling import get_store
+        get_store().clear()
+        self.user = User.objects.create_user(username = "martin", password = "1234")
+        self.post = Post.objects.create(author = self.user, title = "Title", content = "Content")
+
+    def rates(self, **rates):
+        from .throttling import SlidingWindowRateThrottle
+        return mock.patch.dict(SlidingWindowRateThrottle.THROTTLE_RATES, rates)
+
+    def login(self):
+        return self.client.post('/api/login/', {"username": "martin", "password": "1234"}, format = 'json')
+
+    def test_login_is_limited_per_ip(self):
+        with self.rates(login = '3/min'):
+            responses = [self.login() for _ in range(4)]
+        self.assertEqual([response.status_code for response in responses[:3]], [status.HTTP_200_OK] * 3)
+        self.assertEqual([response['X-RateLimit-Remaining'] for response in responses], ['2', '1', '0', '0'])
+        self.assertEqual(responses[0]['X-RateLimit-Limit'], '3')
+        self.assertEqual(responses[3].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(responses[3]['Retry-After']), 0)
+        self.assertNotIn('X-RateLimit-Limit', self.client.get('/api/posts/'))
+
+    def test_likes_are_limited_per_user(self):
+        other = User.objects.create_user(username = "other", password = "1234")
+        with self.rates(like = '2/min'):
+            self.client.force_authenticate(self.user)
+            codes = [self.client.post(f'/api/posts/{self.post.id}/like/').status_code for _ in range(3)]
+            self.client.force_authenticate(other)
+            self.assertEqual(self.client.post(f'/api/posts/{self.post.id}/like/').status_code, status.HTTP_200_OK)
+        self.assertEqual(codes, [status.HTTP_200_OK, status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS])
+
+    def test_window_slides(self):
+        from .throttling import SlidingWindowRateThrottle
+        start = 600.0  # Start of a window
+        with self.rates(login = '4/min'):
+            with mock.patch.object(SlidingWindowRateThrottle, 'timer', return_value = start + 30):
+                self.assertEqual([self.login().status_code for _ in range(5)][-1], status.HTTP_429_TOO_MANY_REQUESTS)
+            # A quarter into the next window, 3/4 of the previous one still count: 4 * 0.75 = 3, one request left
+            with mock.patch.object(SlidingWindowRateThrottle, 'timer', return_value = start + 75):
+                codes = [self.login().status_code for _ in range(2)]
+        self.assertEqual(codes, [status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS])
+
+    @skipUnless(settings.REDIS_URL, "Needs Redis")
+    def test_redis_store_matches_memory_store(self):
+        from .throttling import InProcessWindowStore, RedisWindowStore
+        redis_store = RedisWindowStore(settings.REDIS_URL)
+        key = f'microblog:ratelimit:test:{uuid.uuid4().hex}'
+        for store in (InProcessWindowStore(), redis_store):
+            results = [store.hit(f'{key}:{id(store)}:1', f'{key}:{id(store)}:0', 2, 0.5, 60, 0)[0] for _ in range(3)]
+            self.assertEqual(results, [True, True, False])
+
+
+class InstrumentationTests(APITestCase):
+    def setUp(self):
+        from .instrumentation import HISTOGRAMS
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username = "martin", password = "1234")
+        Post.objects.create(author = self.user, title = "Title", content = "Content")
+
+    def test_server_timing_counts_the_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/posts/')
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        for metric in ('db;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    def test_histograms(self):
+        from .instrumentation import DB_QUERIES, REQUEST_DURATION, RESPONSE_SIZE, Histogram
+        for _ in range(2):
+            response = self.client.get('/api/posts/')
+        self.assertEqual(REQUEST_DURATION.samples(('posts-list', 'GET', '200'))['+Inf'], 2)
+        self.assertEqual(RESPONSE_SIZE.samples(('posts-list', 'GET'))['+Inf'], 2)
+        self.assertEqual(RESPONSE_SIZE.samples(('posts-list', 'GET'))['256.0'], int(len(response.content) <= 256) * 2)
+        self.assertEqual(DB_QUERIES.samples(('posts-list', 'GET'))['0.0'], 1)  # The second one came from the response cache
+
+        histogram = Histogram('test_seconds', 'Test.', ('route',), (1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value, 'a"b')
+        self.assertEqual(histogram.expose(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{route="a\\"b",le="1.0"} 2',
+            'test_seconds_bucket{route="a\\"b",le="2.0"} 3',
+            'test_seconds_bucket{route="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{route="a\\"b"} 6.0',
+            'test_seconds_count{route="a\\"b"} 4',
+        ])
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/posts/')
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)  # DEBUG is off in tests
+        with override_settings(METRICS_TOKEN = 'secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_401_UNAUTHORIZED)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION = 'Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('microblog_http_request_duration_seconds_bucket{route="posts-list",method="GET",status="200",le="+Inf"} 1', body)
+        self.assertIn('# TYPE microblog_http_request_db_queries histogram', body)
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with override_settings(SLOW_REQUEST_THRESHOLD = 0), self.assertLogs('Microblog_API.instrumentation', 'WARNING') as logs:
+            self.client.get('/api/posts/')
+        self.assertIn('Slow request: GET /api/posts/ -> 200', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    async def test_async_views_are_instrumented(self):
+        from .instrumentation import REQUEST_DURATION
+        with mock.patch('Microblog_API.async_views.delegate') as delegate:
+            response = await self.async_client.get('/api/posts/')
+        delegate.assert_not_called()
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        self.assertEqual(REQUEST_DURATION.samples(('posts-list', 'GET', '200'))['+Inf'], 1)
+
+
+class SeedTests(APITestCase):
+    def seed(self, **options):
+        output = StringIO()
+        sizes = {'users': 50, 'posts': 300, 'comments': 600, 'likes': 800, 'follows': 200}
+        call_command('seed_microblog', **{**sizes, **options}, workers = 1, batch_size = 100, stdout = output)
+        return output.getvalue()
+
+    def test_seeded_data_is_consistent(self):
+        output = self.seed()
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 600)
+        self.assertIn("Inserted", output)
+
+        # The counters were computed by the seeding, reconciling finds nothing to fix
+        from .counters import reconcile_comment_counters, reconcile_post_counters
+        self.assertEqual((reconcile_post_counters(), reconcile_comment_counters()), (0, 0))
+        self.assertGreater(Post.objects.filter(like_count__gt = 0).count(), 0)
+
+        from . import threads
+        replies = Comment.objects.filter(depth__gt = 0).select_related('parent')
+        self.assertTrue(replies.exists())
+        for reply in replies:
+            self.assertEqual((reply.path, reply.post_id), (threads.child_path(reply.parent), reply.parent.post_id))
+
+        # Every post is in its author's timeline, and the sequences continue after the explicit ids
+        self.assertEqual(FeedEntry.objects.filter(user_id = F('author_id')).count(), 300)
+        post = Post.objects.create(author = User.objects.first(), title = "New", content = "Content")
+        self.assertGreater(post.id, Post.objects.exclude(id = post.id).aggregate(last = Max('id'))['last'])
+
+    def test_old_seeded_posts_can_be_liked_and_commented(self):
+        from . import trending
+        self.seed()
+        threshold = trending.log_score(settings.TRENDING_MIN_SCORE)
+        self.assertFalse(Post.objects.filter(hot_score__lt = threshold).exists())  # Decayed scores were dropped
+        self.assertTrue(Post.objects.filter(hot_score__isnull = False).exists())
+
+        oldest = Post.objects.order_by('created_at').first()
+        self.client.force_authenticate(User.objects.create_user(username = "late", password = "1234"))
+        self.assertEqual(self.client.post(f'/api/posts/{oldest.id}/like/').status_code, status.HTTP_200_OK)
+        response = self.client.post(f'/api/posts/{oldest.id}/comments/', {"content": "Late"}, format = 'json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertAlmostEqual(Post.objects.get(id = oldest.id).hot_score, trending.log_score(trending.weight(1, 1)), places = 2)
+
+    def test_popularity_is_skewed(self):
+        self.seed(skew = 1.5, follows = 400)
+        likes = sorted(Post.objects.values_list('like_count', flat = True), reverse = True)
+        self.assertGreater(sum(likes[:30]), sum(likes[30:]))  # The top 10% get most of the likes
+        followers = Follow.objects.values('followee').annotate(n = Count('id')).order_by('-n').values_list('n', flat = True)
+        self.assertGreater(followers[0], 400 / 50 * 3)
+
+    def test_seeds_on_top_of_existing_rows(self):
+        user = User.objects.create_user(username = "martin", password = "1234")
+        Post.objects.create(author = user, title = "Title", content = "Content")
+        self.seed(users = 10, posts = 20, comments = 0, likes = 0, follows = 0, prefix = 'extra')
+        self.assertEqual(Post.objects.count(), 21)
+        self.assertTrue(User.objects.filter(username = f'extra{user.id + 1}').exists())
+
+
+class TrendingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.fans = [User.objects.create_user(username = f"fan{i}", password = "1234") for i in range(3)]
+        self.posts = [Post.objects.create(author = self.author, title = f"Post {i}", content = "Content") for i in range(3)]
+
+    def like(self, user, post):
+        self.client.force_authenticate(user)
+        return self.client.post(f'/api/posts/{post.id}/like/')
+
+    def trending(self, **params):
+        self.client.force_authenticate(None)
+        return [post['id'] for post in self.client.get('/api/posts/trending/', params).data['results']]
+
+    def test_ranks_by_decayed_likes_and_comments(self):
+        from . import trending
+        old, commented, liked = self.posts
+        # 3 likes two half-lives ago weigh 0.75, less than one like now
+        with mock.patch('Microblog_API.trending.timezone.now', return_value = timezone.now() - timedelta(seconds = 2 * settings.TRENDING_HALF_LIFE)):
+            trending.bump({old.id: 3})
+        self.like(self.fans[0], liked)
+        self.client.post(f'/api/posts/{commented.id}/comments/', {"content": "Nice"}, format = 'json')
+
+        self.assertEqual(self.trending(), [commented.id, liked.id, old.id])
+        self.assertEqual(self.trending(limit = 1), [commented.id])
+        self.assertEqual(self.client.get('/api/posts/trending/', {'limit': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_toggling_a_like_does_not_raise_the_score(self):
+        post = self.posts[0]
+        self.like(self.fans[0], post)
+        score = Post.objects.get(id = post.id).hot_score
+        self.like(self.fans[1], post)
+        self.like(self.fans[1], post)
+        self.assertLessEqual(Post.objects.get(id = post.id).hot_score, score)
+
+        self.like(self.fans[0], post)
+        self.assertIsNone(Post.objects.get(id = post.id).hot_score)
+        self.assertEqual(self.trending(), [])
+
+    @override_settings(LIKE_BUFFER = 'memory', LIKE_BUFFER_FLUSH_INTERVAL = 3600)
+    def test_buffered_likes_are_scored_on_flush(self):
+        buffer = get_like_buffer()
+        buffer.flush()
+        Post.objects.update(hot_score = None)  # Toggles other tests left in the buffer
+        for fan in self.fans:
+            self.like(fan, self.posts[1])
+        self.like(self.fans[0], self.posts[2])
+        self.like(self.fans[1], self.posts[2])
+        self.like(self.fans[1], self.posts[2])
+        buffer.flush()
+        self.assertEqual(self.trending(), [self.posts[1].id, self.posts[2].id])
+
+    def test_scores_far_apart_can_be_added_and_subtracted(self):
+        from . import trending
+        old, future = self.posts[:2]
+        # Far enough apart that power() would underflow on Postgres without the clamp
+        Post.objects.filter(id = old.id).update(hot_score = trending.log_score(1, timezone.now() - timedelta(days = 400)))
+        future_score = trending.log_score(1, timezone.now() + timedelta(days = 400))
+        Post.objects.filter(id = future.id).update(hot_score = future_score)
+        self.assertEqual(self.like(self.fans[0], old).status_code, status.HTTP_200_OK)
+        trending.bump({future.id: -1})
+
+        self.assertAlmostEqual(Post.objects.get(id = old.id).hot_score, trending.log_score(1), places = 3)
+        self.assertAlmostEqual(Post.objects.get(id = future.id).hot_score, future_score)
+        self.assertEqual(self.trending(), [future.id, old.id])
+
+    def test_update_trending_trims_and_rebuilds(self):
+        from . import trending
+        Post.objects.filter(id = self.posts[0].id).update(like_count = 10, created_at = timezone.now() - timedelta(days = 30))
+        Post.objects.filter(id = self.posts[1].id).update(like_count = 2, comment_count = 1)
+        output = StringIO()
+        call_command('update_trending', rebuild = True, stdout = output)
+        self.assertIn("Scored 3 post(s)", output.getvalue())
+        self.assertEqual(self.trending(), [self.posts[1].id, self.posts[0].id])
+
+        # A month of decay leaves nothing of the 10 likes
+        call_command('update_trending', stdout = output)
+        self.assertIn("Dropped 1 decayed score(s)", output.getvalue())
+        self.assertEqual(list(trending.top(10).values_list('id', flat = True)), [self.posts[1].id])
+
+
+job_calls = []
+
+
+@background_job(max_attempts = 2)
+def record_call(value, fail = False):
+    job_calls.append(value)
+    if fail:
+        raise RuntimeError("Job failed")
+
+
+@override_settings(JOBS_EAGER = False)
+class JobTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        job_calls.clear()
+        self.reader = User.objects.create_user(username = "reader", password = "1234")
+        self.author = User.objects.create_user(username = "author", password = "1234")
+
+    def work(self):
+        output = StringIO()
+        call_command('run_worker', once = True, stdout = output)
+        return output.getvalue()
+
+    def test_fan_out_and_backfill_run_in_the_worker(self):
+        from .models import Job
+        old = Post.objects.create(author = self.author, title = "Old", content = "Content")
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/users/{self.author.id}/follow/')
+        self.client.force_authenticate(self.author)
+        new = self.client.post('/api/posts/', {'title': "New", 'content': "Content"}, format = 'json').data['id']
+
+        self.assertFalse(FeedEntry.objects.filter(user = self.reader).exists())
+        self.assertEqual(Job.objects.filter(status = Job.PENDING).count(), 2)
+        self.assertIn("Ran 2 job(s)", self.work())
+        self.assertCountEqual(FeedEntry.objects.filter(user = self.reader).values_list('post_id', flat = True), [old.id, new])
+        self.assertEqual(Job.objects.filter(status = Job.DONE).count(), 2)
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        from . import jobs
+        from .models import Job
+        queued = jobs.enqueue(record_call, 1, fail = True)
+        with self.assertLogs('Microblog_API.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.PENDING, 1))
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds = settings.JOBS_RETRY_BACKOFF * 0.5 - 1))
+        self.assertIn("RuntimeError: Job failed", queued.last_error)
+        self.assertEqual(jobs.run_pending(), 0)  # Not due yet
+
+        Job.objects.filter(pk = queued.pk).update(run_at = timezone.now())
+        with self.assertLogs('Microblog_API.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.FAILED, 2))
+        self.assertEqual(job_calls, [1, 1])
+
+    def test_idempotency_keys_and_transactions(self):
+        from django.db import transaction
+        from . import jobs
+        from .models import Job
+        first = jobs.enqueue(record_call, 1, key = 'once')
+        self.assertEqual(jobs.enqueue(record_call, 2, key = 'once').pk, first.pk)
+        try:
+            with transaction.atomic():
+                jobs.enqueue(record_call, 3)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.work()
+        self.assertEqual(job_calls, [1])
+        self.assertEqual(jobs.enqueue(record_call, 1, key = 'once').status, Job.DONE)
+
+    def test_jobs_of_lost_workers_are_released(self):
+        from . import jobs
+        from .models import Job
+        locked_at = timezone.now() - timedelta(seconds = settings.JOBS_LOCK_TIMEOUT + 1)
+        lost = Job.objects.create(name = jobs.name_of(record_call), args = [1], status = Job.RUNNING, locked_at = locked_at, attempts = 1)
+        exhausted = Job.objects.create(name = jobs.name_of(record_call), args = [2], status = Job.RUNNING, locked_at = locked_at, attempts = 5)
+        running = Job.objects.create(name = jobs.name_of(record_call), args = [3], status = Job.RUNNING, locked_at = timezone.now(), attempts = 1)
+        self.work()
+        self.assertEqual(job_calls, [1])
+        self.assertEqual(
+            [Job.objects.get(pk = queued.pk).status for queued in (lost, exhausted, running)],
+            [Job.DONE, Job.FAILED, Job.RUNNING]
+        )
+
+    def test_jobs_released_meanwhile_are_left_to_their_new_worker(self):
+        from . import jobs
+        from .models import Job
+        first, second = jobs.enqueue(record_call, 1), jobs.enqueue(record_call, 2)
+        claimed = jobs.claim(10)
+        # While the first job ran, the second one was released and claimed by another worker
+        other_lock = timezone.now() + timedelta(seconds = 1)
+        Job.objects.filter(pk = second.pk).update(locked_at = other_lock)
+        with self.assertLogs('Microblog_API.jobs', 'WARNING'):
+            self.assertEqual([jobs.run(queued) for queued in claimed], [True, False])
+        self.assertEqual(job_calls, [1])
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.locked_at), (Job.RUNNING, other_lock))
+
+        # Released while running: it isn't marked as done, and what it wrote is rolled back
+        @background_job
+        def steal(value):
+            Post.objects.create(author = self.author, title = "Post", content = "Content")
+            Job.objects.filter(pk = second.pk).update(locked_at = timezone.now() + timedelta(seconds = 2))
+
+        queued = Job.objects.get(pk = second.pk)
+        with mock.patch.object(jobs, 'import_string', return_value = steal), self.assertLogs('Microblog_API.jobs', 'WARNING') as logs:
+            self.assertFalse(jobs.run(queued))
+        self.assertIn("released while running", logs.output[0])
+        self.assertEqual(Job.objects.get(pk = second.pk).status, Job.RUNNING)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(Job.objects.get(pk = first.pk).status, Job.DONE)
+
+    @override_settings(JOBS_EAGER = True)
+    def test_eager_mode_runs_jobs_right_away(self):
+        from . import jobs
+        from .models import Job
+        self.assertIsNone(jobs.enqueue(record_call, 1))
+        self.assertEqual(job_calls, [1])
+        self.assertFalse(Job.objects.exists())
+        with self.assertRaises(TypeError):
+            jobs.enqueue(record_call, object())  # Couldn't be stored
+        with self.assertRaises(ValueError):
+            jobs.enqueue(print, 1)
+
+
+class LikedByMeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username = "author", password = "1234")
+        self.reader = User.objects.create_user(username = "reader", password = "1234")
+        self.posts = [Post.objects.create(author = self.author, title = f"Post {i}", content = "Content") for i in range(5)]
+        for post in self.posts[:2]:
+            post.likes.add(self.reader)
+        self.posts[2].likes.add(self.author)
+
+    def flags(self, url = '/api/posts/'):
+        return {post['id']: post.get('liked_by_me') for post in self.client.get(url).data['results']}
+
+    def test_flags_of_a_page_take_one_query(self):
+        self.assertEqual(set(self.flags().values()), {None})  # Anonymous
+        self.client.force_authenticate(self.reader)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/posts/')
+        self.assertIn('Authorization', response['Vary'])
+        flags = {post['id']: post['liked_by_me'] for post in response.data['results']}
+        self.assertEqual(flags, {post.id: post in self.posts[:2] for post in self.posts})
+        self.assertTrue(self.client.get(f'/api/posts/{self.posts[0].id}/').data['liked_by_me'])
+        self.assertFalse(self.client.get(f'/api/posts/{self.posts[2].id}/').data['liked_by_me'])
+        self.assertEqual(self.flags('/api/posts/trending/'), {post.id: post in self.posts[:2] for post in self.posts[:3]})
+
+    @override_settings(LIKE_BUFFER = 'memory', LIKE_BUFFER_FLUSH_INTERVAL = 3600)
+    def test_flags_include_buffered_likes(self):
+        from .likes import InProcessLikeStore
+        self.client.force_authenticate(self.reader)
+        with mock.patch.object(get_like_buffer(), 'store', InProcessLikeStore()):  # Without the toggles of other tests
+            self.client.post(f'/api/posts/{self.posts[0].id}/like/')
+            self.client.post(f'/api/posts/{self.posts[4].id}/like/')
+            flags = self.flags()
+        self.assertEqual((flags[self.posts[0].id], flags[self.posts[1].id], flags[self.posts[4].id]), (False, True, True))
+
+    def test_likes_are_paginated(self):
+        post = self.posts[3]
+        fans = [User.objects.create_user(username = f"fan{i}", password = "1234") for i in range(25)]
+        for fan in fans:
+            post.likes.add(fan)
+
+        url, pages = f'/api/posts/{post.id}/likes/?page_size=10', []
+        while url:
+            with self.assertNumQueries(2):  # The post's counter, a page of usernames
+                response = self.client.get(url)
+            self.assertEqual(response.data['count'], 25)
+            pages.append(response.data['users'])
+            url = response.data['next']
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), [fan.username for fan in reversed(fans)])  # Newest first
+
+
+class PositiveIntTests(APITestCase):
+    def test_parses_query_parameters(self):
+        from .pagination import positive_int
+        self.assertEqual(positive_int('5'), 5)
+        self.assertEqual(positive_int('0'), 0)
+        self.assertEqual(positive_int('500', strict = True, cutoff = 100), 100)
+        for value, strict in (('0', True), ('-1', False), ('x', False), (None, False)):
+            with self.subTest(value = value), self.assertRaises((ValueError, TypeError)):
+                positive_int(value, strict = strict)
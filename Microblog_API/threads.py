@@ -0,0 +1,60 @@
+"""
+Reply threads of comments, stored as a materialized path.
+
+Comment.path holds the ids of the comment's ancestors, root first, each zero-padded to SEGMENT_WIDTH digits
+("" for a top-level comment, "0000000012" for a reply to comment 12, "00000000120000000040" for a reply to
+that reply). The replies of a comment are the rows with path == child_path(comment), and its whole subtree
+is a range of paths, so both are read from the (post, path, created_at, id) index in a single query,
+whatever the depth. Paths are only made of digits, so the range compares the same under any collation.
+
+Each comment counts its direct replies (reply_count) and its whole subtree (descendant_count). The
+receivers in signals.py keep both right when replies are created or deleted.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+SEGMENT_WIDTH = 10
+
+
+def get_max_depth():
+    """Deepest reply allowed, top-level comments are at depth 0. Bounded by the length of Comment.path."""
+    return getattr(settings, 'COMMENT_MAX_DEPTH', 20)
+
+
+def get_max_thread_size():
+    return getattr(settings, 'THREAD_MAX_COMMENTS', 500)
+
+
+def segment(comment_id):
+    return str(comment_id).zfill(SEGMENT_WIDTH)
+
+
+def child_path(comment):
+    """Path of the direct replies of `comment`."""
+    return comment.path + segment(comment.id)
+
+
+def ancestor_ids(path):
+    return [int(path[i:i + SEGMENT_WIDTH]) for i in range(0, len(path), SEGMENT_WIDTH)]
+
+
+def subtree_filter(comment, depth = None):
+    """Selects the replies of `comment` at any level (not the comment itself), down to `depth` levels below it."""
+    condition = Q(post_id = comment.post_id, path__gte = child_path(comment), path__lt = comment.path + segment(comment.id + 1))
+    if depth is not None:
+        condition &= Q(depth__lte = comment.depth + depth)
+    return condition
+
+
+def build_tree(root, descendants, represent):
+    """
+    Nests the representations of `descendants` under `root`: every node gets a "replies" list, in the order
+    of `descendants`. Replies that weren't loaded are left out, the client can tell from reply_count.
+    """
+    children = {}
+    for comment in descendants:
+        children.setdefault(comment.path, []).append(comment)
+
+    def node(comment):
+        return {**represent(comment), 'replies': [node(child) for child in children.get(child_path(comment), ())]}
+    return node(root)
@@ -0,0 +1,187 @@
+"""
+Rate limiting of the endpoints that are cheap to hammer and expensive to serve: login (per IP), registration
+(per IP) and likes (per user). The rates are the 'login', 'register' and 'like' scopes of
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+
+The limit is a sliding window counter: requests are counted per fixed window, and the count of the previous
+window is weighted by how much of it still overlaps the sliding one (previous * (1 - elapsed) + current).
+That's two integers per client and scope, and unlike fixed windows it doesn't let a client send twice the rate
+around a window boundary. DRF's own throttles keep the timestamp of every request in the cache and read-modify-
+write it, which lets concurrent requests overwrite each other.
+
+With Redis (RATE_LIMIT_STORE = 'redis') the check and the increment run as one Lua script, so every worker
+shares the counters and concurrent requests can't both take the last slot. The 'memory' store is local to the
+process (development and tests), and it is also used while Redis is unreachable: the limits then apply per
+process rather than not at all.
+
+Throttled responses are 429s with Retry-After. Every throttled endpoint also gets X-RateLimit-Limit,
+X-RateLimit-Remaining and X-RateLimit-Reset (seconds until the current window ends) through
+RateLimitHeadersMiddleware.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessWindowStore:
+    """Counters local to the worker process, in a dict of {key: (count, expires_at)}."""
+
+    def __init__(self, max_keys = 100000):
+        self.max_keys = max_keys
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key, now):
+        count, expires_at = self._counts.get(key, (0, 0))
+        return count if expires_at > now else 0
+
+    def hit(self, key, previous_key, limit, weight, duration, now):
+        with self._lock:
+            previous = self._count(previous_key, now)
+            current = self._count(key, now)
+            if previous * weight + current >= limit:
+                return False, previous, current
+            if len(self._counts) >= self.max_keys:
+                self._counts = {k: v for k, v in self._counts.items() if v[1] > now}
+            current += 1
+            self._counts[key] = (current, now + 2 * duration)
+            return True, previous, current
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class RedisWindowStore:
+    """Counters shared by every worker, one Redis key per client, scope and window."""
+
+    # KEYS: counter of the current window, counter of the previous one.
+    # ARGV: limit, weight of the previous window (0 to 1), window duration in seconds.
+    # Returns {allowed (0 or 1), previous count, current count}.
+    HIT = """
+        local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+        local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+        if previous * tonumber(ARGV[2]) + current >= tonumber(ARGV[1]) then
+            return {0, previous, current}
+        end
+        current = redis.call('INCR', KEYS[1])
+        if current == 1 then
+            redis.call('EXPIRE', KEYS[1], 2 * tonumber(ARGV[3]))
+        end
+        return {1, previous, current}
+    """
+
+    def __init__(self, url, retry_after = 5):
+        import redis
+        self.redis = redis.Redis.from_url(url, socket_connect_timeout = 0.5, socket_timeout = 0.5)
+        self._hit = self.redis.register_script(self.HIT)
+        self.fallback = InProcessWindowStore()
+        self.retry_after = retry_after
+        self._down_until = 0
+
+    def hit(self, key, previous_key, limit, weight, duration, now):
+        if time.monotonic() >= self._down_until:
+            try:
+                allowed, previous, current = self._hit(keys = [key, previous_key], args = [limit, repr(weight), duration])
+                return bool(allowed), previous, current
+            except Exception as exc:
+                logger.warning("Rate limit store unavailable, limiting per process: %s", exc)
+                self._down_until = time.monotonic() + self.retry_after
+        return self.fallback.hit(key, previous_key, limit, weight, duration, now)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    mode = getattr(settings, 'RATE_LIMIT_STORE', 'memory')
+    with _store_lock:
+        if _store is None or _store.mode != mode:
+            if mode == 'memory':
+                _store = InProcessWindowStore()
+            elif mode == 'redis':
+                if not settings.REDIS_URL:
+                    raise ImproperlyConfigured("RATE_LIMIT_STORE = 'redis' requires REDIS_URL.")
+                _store = RedisWindowStore(settings.REDIS_URL)
+            else:
+                raise ImproperlyConfigured(f"Unknown RATE_LIMIT_STORE {mode!r}, use 'memory' or 'redis'.")
+            _store.mode = mode
+        return _store
+
+
+def wait_time(previous, current, limit, weight, duration):
+    """Seconds until previous * weight + current, with the weight decreasing as time passes, falls under limit."""
+    if current < limit:
+        # The previous window still weighs too much: wait until enough of it has slid out
+        return max(duration * (weight - (limit - current) / previous), 0) if previous else 0
+    # This window is full: it becomes the previous one, and has to slide out far enough
+    return duration * weight + duration * (1 - limit / current)
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle (scope, rate parsing, client ident) with the sliding window counter of a shared store."""
+    cache_format = 'microblog:ratelimit:%(scope)s:%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window, elapsed = divmod(now, self.duration)
+        weight = 1 - elapsed / self.duration
+        allowed, previous, current = get_store().hit(
+            f'{self.key}:{int(window)}', f'{self.key}:{int(window) - 1}', self.num_requests, weight, self.duration, now
+        )
+
+        remaining = max(math.floor(self.num_requests - previous * weight - current), 0)
+        self.record(request, remaining, math.ceil(self.duration - elapsed))
+        self.wait_seconds = None if allowed else wait_time(previous, current, self.num_requests, weight, self.duration)
+        return allowed
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+    def record(self, request, remaining, reset):
+        # The most restrictive throttle of the request is the one reported (see RateLimitHeadersMiddleware)
+        current = getattr(request._request, 'rate_limit', None)
+        if current is None or remaining < current[1]:
+            request._request.rate_limit = (self.num_requests, remaining, reset)
+
+
+class IPRateThrottle(SlidingWindowRateThrottle):
+    """Per client IP (behind a proxy, see NUM_PROXIES in DRF's settings)."""
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UserRateThrottle(SlidingWindowRateThrottle):
+    """Per user, or per IP for anonymous requests."""
+
+    def get_cache_key(self, request, view):
+        ident = f'user:{request.user.pk}' if request.user and request.user.is_authenticated else self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class LoginRateThrottle(IPRateThrottle):
+    scope = 'login'
+
+
+class RegisterRateThrottle(IPRateThrottle):
+    scope = 'register'
+
+
+class LikeRateThrottle(UserRateThrottle):
+    scope = 'like'
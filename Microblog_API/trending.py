@@ -0,0 +1,125 @@
+"""
+Trending posts (/api/posts/trending/): posts ranked by their likes and comments, each one weighing half as
+much every TRENDING_HALF_LIFE seconds.
+
+The score of a post is the sum of weight * 2^((t - EPOCH) / half life) over its likes and comments (t being
+when they happened). All the scores grow by the same factor as time passes, so they are stored undecayed and
+ordering by the stored value is ordering by the decayed one. Post.hot_score holds its base 2 logarithm, which
+grows linearly with time, so it never overflows and no score ever has to be rewritten to move an epoch.
+
+- A like or comment adds to the score in the UPDATE of adjust_counters (or the like buffer's recount), as
+  a log-sum (max + log2(1 + 2^(min - max))), without reading the post. The exponent is clamped, so scores that
+  weren't trimmed yet still work however old they are.
+- Unlikes and deleted comments subtract their weight as of now, which is at least what they added when
+  they happened: toggling a like can't push a post up, and a score that would go to 0 or below becomes NULL.
+- Posts without a score (NULL) aren't in the partial (hot_score, id) index, so the top N is read from the
+  first N entries of a small index.
+- 'manage.py update_trending --loop' drops the scores that decayed under TRENDING_MIN_SCORE, which keeps that
+  index to the posts that can still rank. --rebuild scores every post from its counters instead, as if its
+  likes and comments had all come when it was published (for posts from before the column, or seeded ones).
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest, Least, Log, Power
+from django.utils import timezone
+from .models import Post
+
+EPOCH = datetime(2025, 1, 1, tzinfo = dt_timezone.utc)  # Changing it shifts every stored score, never do it
+
+# Lowest exponent passed to power(): 2^-1000 still fits in a double, while Postgres raises "value out of range:
+# underflow" past ~-1074 (scores that far apart, about 250 days at the default half-life, add nothing anyway)
+MIN_EXPONENT = Value(-1000.0, output_field = FloatField())
+
+
+def get_half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE', 6 * 3600)
+
+
+def weight(like_count = 0, comment_count = 0, **ignored):
+    """Weight of counter deltas, as passed to adjust_counters."""
+    return (
+        like_count * getattr(settings, 'TRENDING_LIKE_WEIGHT', 1.0)
+        + comment_count * getattr(settings, 'TRENDING_COMMENT_WEIGHT', 3.0)
+    )
+
+
+def log_score(amount, at = None):
+    """hot_score of `amount` (> 0) worth of likes happening at `at` (now by default)."""
+    at = at or timezone.now()
+    return math.log2(amount) + (at - EPOCH).total_seconds() / get_half_life()
+
+
+def score_change(amount):
+    """Expression adding `amount` (negative to subtract) to hot_score, as of now."""
+    x = Value(log_score(abs(amount)), output_field = FloatField())
+    score = F('hot_score')
+    if amount > 0:
+        high, low = Greatest(score, x), Least(score, x)
+        return Case(
+            When(hot_score__isnull = True, then = x),
+            default = high + Log(2, Value(1.0) + Power(2, Greatest(low - high, MIN_EXPONENT))),
+            output_field = FloatField(),
+        )
+    return Case(
+        When(Q(hot_score__isnull = True) | Q(hot_score__lte = x), then = Value(None)),
+        default = score + Log(2, Value(1.0) - Power(2, Greatest(x - score, MIN_EXPONENT))),
+        output_field = FloatField(),
+    )
+
+
+def score_changes(amounts):
+    """Expression adding {post_id: amount} to hot_score, with a branch per distinct amount (None if there's nothing to add)."""
+    by_amount = defaultdict(list)
+    for post_id, amount in amounts.items():
+        if amount:
+            by_amount[amount].append(post_id)
+    if not by_amount:
+        return None
+    return Case(
+        *[When(pk__in = post_ids, then = score_change(amount)) for amount, post_ids in by_amount.items()],
+        default = F('hot_score'),
+        output_field = FloatField(),
+    )
+
+
+def bump(amounts):
+    """Adds {post_id: amount} to the scores in one UPDATE."""
+    change = score_changes(amounts)
+    if change is not None:
+        Post.objects.filter(pk__in = list(amounts)).update(hot_score = change)
+
+
+def top(limit, posts = None):
+    """The `limit` posts (of all by default) with the highest scores, read from the start of post_hot_idx."""
+    posts = Post.objects.all() if posts is None else posts
+    return posts.filter(hot_score__isnull = False).order_by('-hot_score', '-id')[:limit]
+
+
+def trim(now = None):
+    """Drops the scores that decayed under TRENDING_MIN_SCORE. Returns how many."""
+    threshold = log_score(getattr(settings, 'TRENDING_MIN_SCORE', 0.5), now)
+    return Post.objects.filter(hot_score__lt = threshold).update(hot_score = None)
+
+
+def rebuild(posts = None, batch_size = 1000):
+    """Scores the posts (all by default) from their counters, as if their likes and comments had come when they were published."""
+    posts = Post.objects.all() if posts is None else posts
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            posts.filter(pk__gt = last_pk).order_by('pk')
+            .only('id', 'created_at', 'like_count', 'comment_count', 'hot_score')[:batch_size]
+        )
+        if not batch:
+            return updated
+        for post in batch:
+            amount = weight(like_count = post.like_count, comment_count = post.comment_count)
+            post.hot_score = log_score(amount, post.created_at) if amount > 0 else None
+        Post.objects.bulk_update(batch, ['hot_score'])
+        updated += len(batch)
+        last_pk = batch[-1].pk
@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework import routers
-from .api import UserViewSet, PostViewSet, CommentView, LoginView, LogoutView, RegisterViewSet
+from .api import UserViewSet, PostViewSet, CommentView, LoginView, LogoutView, RegisterViewSet, CommentBulkView, CommentExportView, CommentRepliesView, CommentThreadView, FeedView, CacheStatsView
+from .instrumentation import metrics_view
 from rest_framework_simplejwt.views import TokenRefreshView
 
 router = routers.DefaultRouter() # Crea el CRUD (Create - Read - Update - Delete)
@@ -17,5 +18,12 @@ urlpatterns = [
     path('api/logout/', LogoutView.as_view(), name="logout"),
     path('api/posts/<int:post_id>/comments/', CommentView.as_view(), name="comments"),
     path('api/posts/<int:post_id>/comments/<int:comment_id>/', CommentView.as_view(), name="comment"),
+    path('api/posts/<int:post_id>/comments/<int:comment_id>/replies/', CommentRepliesView.as_view(), name="comment_replies"),
+    path('api/posts/<int:post_id>/comments/<int:comment_id>/thread/', CommentThreadView.as_view(), name="comment_thread"),
+    path('api/posts/<int:post_id>/comments/bulk/', CommentBulkView.as_view(), name="comments_bulk"),
+    path('api/posts/<int:post_id>/comments/export/', CommentExportView.as_view(), name="comments_export"),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/feed/', FeedView.as_view(), name='feed'),
+    path('api/cache/stats/', CacheStatsView.as_view(), name='cache_stats'),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Throughput of the API under the development server and the production serving profiles.
+
+Each profile is started through serve.sh on its own port, warmed up, and then hit with --concurrency
+keep-alive clients for --duration seconds:
+
+    python benchmarks/http_throughput.py --path /api/posts/ --concurrency 16 --duration 10
+
+    profile     settings                  requests   req/s    p50 ms   p99 ms   errors
+    runserver   Microblog.settings        ...
+
+The database and cache are the ones the settings point at (DB_HOST, REDIS_URL...), migrated and seeded
+beforehand. The client runs in this process, so on a small machine it competes with the server for CPU:
+compare profiles against each other rather than reading the numbers as absolute capacity.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PROFILES = ('runserver', 'gunicorn', 'uvicorn')  # Values of SERVER in serve.sh
+
+
+def start(server, port, args):
+    env = {
+        **os.environ,
+        'SERVER': server,
+        'PORT': str(port),
+        'DJANGO_SETTINGS_MODULE': args.dev_settings if server == 'runserver' else args.prod_settings,
+        'SECRET_KEY': os.getenv('SECRET_KEY', 'benchmark-only-secret-key-not-for-production'),
+    }
+    if args.workers:
+        env['WEB_CONCURRENCY'] = str(args.workers)
+    process = subprocess.Popen(
+        ['sh', str(ROOT / 'serve.sh')], cwd = ROOT, env = env,
+        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL if not args.verbose else None,
+    )
+    return process, env['DJANGO_SETTINGS_MODULE']
+
+
+def wait_until_ready(url, process, timeout = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode} (run with --verbose to see why)")
+        try:
+            if requests.get(url, timeout = 1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass  # Not listening yet, or still loading the app
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} didn't answer within {timeout} seconds")
+
+
+def client(url, deadline, headers):
+    latencies = []
+    errors = 0
+    with requests.Session() as session:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = session.get(url, headers = headers, timeout = 10).status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+    return latencies, errors
+
+
+def run(url, args):
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    client(url, time.monotonic() + args.warmup, headers)  # Fills connection pools, caches and lazy imports
+
+    deadline = time.monotonic() + args.duration
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(lambda _: client(url, deadline, headers), range(args.concurrency)))
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    if not latencies:
+        return len(latencies), 0, None, None, errors
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    return len(latencies), len(latencies) / args.duration, statistics.median(latencies) * 1000, p99 * 1000, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', default = ','.join(PROFILES), help = "Comma separated, among: " + ', '.join(PROFILES))
+    parser.add_argument('--path', default = '/api/posts/')
+    parser.add_argument('--concurrency', type = int, default = 16)
+    parser.add_argument('--duration', type = float, default = 10, help = "Seconds measured per profile.")
+    parser.add_argument('--warmup', type = float, default = 2)
+    parser.add_argument('--workers', type = int, help = "WEB_CONCURRENCY of gunicorn/uvicorn (default: 2 * CPUs + 1).")
+    parser.add_argument('--port', type = int, default = 8100)
+    parser.add_argument('--token', help = "Access token, to measure authenticated requests.")
+    parser.add_argument('--dev-settings', default = 'Microblog.settings')
+    parser.add_argument('--prod-settings', default = 'Microblog.settings_prod')
+    parser.add_argument('--verbose', action = 'store_true', help = "Show the servers' error output.")
+    args = parser.parse_args()
+
+    print(f"{'profile':<11} {'settings':<25} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for offset, name in enumerate(args.profiles.split(',')):
+        port = args.port + offset
+        process, settings = start(name, port, args)
+        try:
+            url = f'http://127.0.0.1:{port}{args.path}'
+            wait_until_ready(url, process)
+            count, rate, p50, p99, errors = run(url, args)
+        except RuntimeError as exc:
+            print(f"{name:<11} {settings:<25} {exc}")
+            continue
+        finally:
+            process.terminate()
+            process.wait()
+        fmt = lambda value: f'{value:8.1f}' if value is not None else f"{'-':>8}"
+        print(f"{name:<11} {settings:<25} {count:>9} {rate:>8.0f} {fmt(p50)} {fmt(p99)} {errors:>7}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
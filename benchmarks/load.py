@@ -0,0 +1,372 @@
+"""
+Latency, throughput and SQL queries per endpoint for a mix of API requests, replayed against seeded data:
+
+    python benchmarks/load.py --database sqlite --output results/$(git rev-parse --short HEAD).json
+    python benchmarks/load.py --database postgres --server gunicorn --concurrency 16 --duration 20
+    python benchmarks/load.py --compare results/main.json results/branch.json
+
+    endpoint          requests  errors   req/s   p50 ms   p95 ms   p99 ms  queries
+    posts-list        ...
+
+The mix (--mix, benchmarks/mix.jsonl by default) has one request per line: name, method, path, weight, and
+optionally "auth": true (sent with the access token of one of the seeded users) and a JSON "body". {post} and
+{comment} in the path are filled with seeded rows, the popular posts being requested more often (--skew).
+
+The data is seeded by 'manage.py seed_microblog' into a database of its own, so the one of the settings is
+never touched: a SQLite file (--database sqlite, works offline without any server) or the test database of
+the settings' Postgres (--database postgres, test_<DB_NAME>). --keepdb reuses it, and its data, next time.
+
+--server client replays the requests one after the other through Django's test client, in this process.
+runserver, gunicorn and uvicorn start serve.sh on the same database and send --concurrency keep-alive
+clients at it for --duration seconds. Query counts come from the Server-Timing header of the responses
+(Microblog_API/instrumentation.py) in both cases.
+
+--output writes the results as JSON, and --compare prints the difference between two of those files and
+exits with 1 when an endpoint got slower (p95) by more than --threshold percent or runs more queries (half a
+query more per request on average).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SERVERS = ('client', 'runserver', 'gunicorn', 'uvicorn')
+
+
+# Data
+
+def zipf_weights(count, skew):
+    """Cumulative weights of ranks 1..count for random.choices, rank r being drawn in proportion to 1 / r^skew."""
+    total = 0.0
+    cumulative = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** skew
+        cumulative.append(total)
+    return cumulative
+
+
+def prepare_database(args):
+    """Migrates the benchmark database and seeds it with 'manage.py seed_microblog'. Returns its cleanup function."""
+    from django.core.management import call_command
+    from django.db import connection
+
+    if args.database == 'sqlite':
+        if not args.keepdb and os.path.exists(os.environ['DB_NAME']):
+            os.remove(os.environ['DB_NAME'])
+        call_command('migrate', verbosity = 0)
+        cleanup = lambda: None
+    else:
+        old_name = connection.settings_dict['NAME']
+        os.environ['DB_NAME'] = connection.creation.create_test_db(verbosity = 0, autoclobber = True, keepdb = args.keepdb, serialize = False)
+        cleanup = lambda: connection.creation.destroy_test_db(old_name, verbosity = 0, keepdb = args.keepdb)
+
+    from django.contrib.auth.models import User
+    if not User.objects.filter(username__startswith = 'bench').exists():
+        call_command(
+            'seed_microblog', users = args.users, posts = args.posts, comments = args.comments, likes = args.likes,
+            follows = args.follows, skew = args.skew, seed = args.seed, prefix = 'bench', stdout = sys.stderr,
+        )
+    return cleanup
+
+
+# Requests
+
+class Mix:
+    """Draws the requests of the mix, with the placeholders filled from the seeded rows."""
+
+    def __init__(self, path, skew, auth_users, rng):
+        from django.contrib.auth.models import User
+        from Microblog_API.authentication import ClaimsRefreshToken
+        from Microblog_API.models import Comment, Post
+
+        with open(path) as lines:
+            self.entries = [json.loads(line) for line in lines if line.strip()]
+        self.weights = [entry.get('weight', 1) for entry in self.entries]
+        self.rng = rng
+
+        # Most liked first, so the zipf weights make them the most requested
+        self.post_ids = list(Post.objects.order_by('-like_count', 'id').values_list('id', flat = True)[:100000])
+        self.post_weights = zipf_weights(len(self.post_ids), skew)
+        self.comments = list(Comment.objects.filter(parent = None).values_list('id', 'post_id')[:100000])
+        self.tokens = [
+            str(ClaimsRefreshToken.for_user(user).access_token)
+            for user in User.objects.filter(username__startswith = 'bench').order_by('id')[:auth_users]
+        ]
+
+    def fork(self, index):
+        """Same mix with its own random generator, for another client thread."""
+        clone = object.__new__(Mix)
+        clone.__dict__.update(self.__dict__)
+        clone.rng = random.Random(f'{self.rng.random()}:{index}')
+        return clone
+
+    def draw(self):
+        """(name, method, path, body, headers)"""
+        entry = self.rng.choices(self.entries, weights = self.weights)[0]
+        path = entry['path']
+        if '{comment}' in path:
+            comment_id, post_id = self.rng.choice(self.comments)
+            path = path.replace('{comment}', str(comment_id)).replace('{post}', str(post_id))
+        elif '{post}' in path:
+            path = path.replace('{post}', str(self.rng.choices(self.post_ids, cum_weights = self.post_weights)[0]))
+        headers = {'Authorization': f'Bearer {self.rng.choice(self.tokens)}'} if entry.get('auth') else {}
+        return entry['name'], entry['method'], path, entry.get('body'), headers
+
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def queries_of(response_headers):
+    match = QUERIES.search(response_headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def replay_in_process(mix, args):
+    """[(name, status, seconds, queries)] of --requests requests sent through the test client."""
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    setup_test_environment()  # ALLOWED_HOSTS for the test client
+    client = Client()
+
+    def send():
+        name, method, path, body, headers = mix.draw()
+        started = time.perf_counter()
+        if method == 'GET':
+            response = client.get(path, headers = headers)
+        else:
+            response = client.generic(method, path, json.dumps(body or {}), 'application/json', headers = headers)
+        return name, response.status_code, time.perf_counter() - started, queries_of(response.headers)
+
+    for _ in range(args.warmup_requests):
+        send()
+    started = time.perf_counter()
+    samples = [send() for _ in range(args.requests)]
+    return samples, time.perf_counter() - started
+
+
+def start_server(args, port):
+    env = {
+        **os.environ,
+        'SERVER': args.server,
+        'PORT': str(port),
+    }
+    if args.workers:
+        env['WEB_CONCURRENCY'] = str(args.workers)
+    return subprocess.Popen(
+        ['sh', str(ROOT / 'serve.sh')], cwd = ROOT, env = env,
+        stdout = subprocess.DEVNULL, stderr = None if args.verbose else subprocess.DEVNULL,
+    )
+
+
+def wait_until_ready(url, process, timeout = 30):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode} (run with --verbose to see why)")
+        try:
+            if requests.get(url, timeout = 1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass  # Not listening yet, or still loading the app
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} didn't answer within {timeout} seconds")
+
+
+def replay_over_http(mix, args):
+    """[(name, status, seconds, queries)] of --concurrency clients sending requests for --duration seconds."""
+    import requests
+    base = f'http://127.0.0.1:{args.port}'
+    process = start_server(args, args.port)
+    try:
+        wait_until_ready(f'{base}/api/posts/', process)
+
+        def client(deadline, mix):
+            samples = []
+            with requests.Session() as session:
+                while time.monotonic() < deadline:
+                    name, method, path, body, headers = mix.draw()
+                    started = time.perf_counter()
+                    try:
+                        response = session.request(method, base + path, json = body, headers = headers, timeout = 30)
+                        sample = (name, response.status_code, time.perf_counter() - started, queries_of(response.headers))
+                    except requests.RequestException:
+                        sample = (name, 0, time.perf_counter() - started, None)
+                    samples.append(sample)
+            return samples
+
+        client(time.monotonic() + args.warmup, mix)
+        # One generator per client (random.Random isn't shared between threads), all derived from --seed
+        mixes = [mix.fork(index) for index in range(args.concurrency)]
+        started = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(lambda m: client(deadline, m), mixes))
+        return [sample for result in results for sample in result], time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+
+# Results
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values."""
+    return values[min(max(math.ceil(fraction * len(values)) - 1, 0), len(values) - 1)]
+
+
+def summarize(samples, elapsed):
+    def stats(group):
+        latencies = sorted(seconds * 1000 for _, _, seconds, _ in group)
+        queries = [count for *_, count in group if count is not None]
+        return {
+            'requests': len(group),
+            'errors': sum(1 for _, code, _, _ in group if not 200 <= code < 400),
+            'status': dict(sorted(Counter(str(code) for _, code, _, _ in group).items())),
+            'throughput': round(len(group) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+
+    by_name = defaultdict(list)
+    for sample in samples:
+        by_name[sample[0]].append(sample)
+    return {name: stats(group) for name, group in sorted(by_name.items())}, stats(samples)
+
+
+def print_table(endpoints, total):
+    print(f"{'endpoint':<17} {'requests':>8} {'errors':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for name, row in [*endpoints.items(), ('total', total)]:
+        queries = f"{row['queries']:>8.1f}" if row['queries'] is not None else f"{'-':>8}"
+        print(
+            f"{name:<17} {row['requests']:>8} {row['errors']:>7} {row['throughput']:>7.0f} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {queries}"
+        )
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = ROOT, capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path, threshold):
+    """Prints the change of every endpoint between two result files. Returns True when one regressed."""
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    for key in ('database', 'server', 'concurrency', 'data'):
+        if before['meta'][key] != after['meta'][key]:
+            print(f"Warning: different {key} ({before['meta'][key]} / {after['meta'][key]}), the numbers aren't comparable")
+    before, after = before['endpoints'], after['endpoints']
+
+    print(f"{'endpoint':<17} {'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'queries':>13}")
+    regressed = False
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0
+            cells.append(f"{new[key]:>8.1f} ({change:+5.0f}%)")
+        slower = old['p95_ms'] and (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 > threshold
+        # Averages, which move a little with the response cache hits: half a query more per request is a regression
+        more_queries = old['queries'] is not None and new['queries'] is not None and new['queries'] >= old['queries'] + 0.5
+        queries = f"{old['queries']} -> {new['queries']}" if old['queries'] != new['queries'] else str(new['queries'])
+        flag = '  REGRESSION' if slower or more_queries else ''
+        regressed |= bool(flag)
+        print(f"{name:<17} {' '.join(cells)} {queries:>13}{flag}")
+    for name in sorted(before.keys() ^ after.keys()):
+        print(f"{name:<17} only in {before_path if name in before else after_path}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--compare', nargs = 2, metavar = ('BEFORE', 'AFTER'), help = "Compare two --output files and exit.")
+    parser.add_argument('--threshold', type = float, default = 10, help = "p95 increase, in percent, reported as a regression.")
+    parser.add_argument('--database', choices = ('sqlite', 'postgres'), default = 'sqlite')
+    parser.add_argument('--sqlite-path', default = os.path.join(tempfile.gettempdir(), 'microblog_benchmark.sqlite3'))
+    parser.add_argument('--keepdb', action = 'store_true', help = "Keep the database (and its data) for the next run.")
+    parser.add_argument('--settings', default = 'Microblog.settings_prod', help = "What production runs, DEBUG skews every number.")
+    parser.add_argument('--mix', default = str(ROOT / 'benchmarks' / 'mix.jsonl'))
+    parser.add_argument('--server', choices = SERVERS, default = 'client')
+    parser.add_argument('--requests', type = int, default = 2000, help = "Requests measured with --server client.")
+    parser.add_argument('--warmup-requests', type = int, default = 100)
+    parser.add_argument('--duration', type = float, default = 10, help = "Seconds measured with a real server.")
+    parser.add_argument('--warmup', type = float, default = 2)
+    parser.add_argument('--concurrency', type = int, default = 8)
+    parser.add_argument('--workers', type = int, help = "WEB_CONCURRENCY of gunicorn/uvicorn.")
+    parser.add_argument('--port', type = int, default = 8200)
+    parser.add_argument('--users', type = int, default = 1000)
+    parser.add_argument('--posts', type = int, default = 10000)
+    parser.add_argument('--comments', type = int, default = 30000)
+    parser.add_argument('--likes', type = int, default = 50000)
+    parser.add_argument('--follows', type = int, default = 20000)
+    parser.add_argument('--skew', type = float, default = 1.1, help = "Zipf exponent of the popularity of posts and users.")
+    parser.add_argument('--auth-users', type = int, default = 200, help = "Users whose tokens sign the authenticated requests.")
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--output', help = "Write the results to this JSON file.")
+    parser.add_argument('--verbose', action = 'store_true', help = "Show the server's error output.")
+    args = parser.parse_args()
+
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+
+    sys.path.insert(0, str(ROOT))
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key-not-for-production')  # Same key in the server
+    if args.database == 'sqlite':
+        os.environ['DB_ENGINE'] = 'sqlite'
+        os.environ['DB_NAME'] = args.sqlite_path
+    import django
+    django.setup()
+    from django.db import connection
+
+    cleanup = prepare_database(args)
+    try:
+        mix = Mix(args.mix, args.skew, args.auth_users, random.Random(args.seed))
+        replay = replay_in_process if args.server == 'client' else replay_over_http
+        samples, elapsed = replay(mix, args)
+        vendor = connection.vendor
+    finally:
+        cleanup()
+
+    endpoints, total = summarize(samples, elapsed)
+    print_table(endpoints, total)
+    if args.output:
+        results = {
+            'meta': {
+                'commit': git_commit(),
+                'date': datetime.now(timezone.utc).isoformat(timespec = 'seconds'),
+                'database': vendor,
+                'server': args.server,
+                'settings': args.settings,
+                'concurrency': 1 if args.server == 'client' else args.concurrency,
+                'seconds': round(elapsed, 2),
+                'data': {key: getattr(args, key) for key in ('users', 'posts', 'comments', 'likes', 'follows', 'skew', 'seed')},
+            },
+            'endpoints': endpoints,
+            'total': total,
+        }
+        Path(args.output).parent.mkdir(parents = True, exist_ok = True)
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent = 2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
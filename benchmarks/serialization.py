@@ -0,0 +1,93 @@
+"""
+Serialization and rendering time of a page of PostSerializer rows, going through DRF's fields with its
+stock DateTimeField and JSONRenderer (before), and the way the API does it (after):
+
+    python benchmarks/serialization.py --rows 10000 --repeat 5
+
+    step        before ms   after ms   speedup
+    serialize   ...
+
+The posts are built in memory, so no database is needed; only the settings are loaded (--settings).
+Both sides must render the same bytes, the script stops otherwise.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def posts(count):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from Microblog_API.models import Post
+
+    now = timezone.now()
+    authors = [User(id = i, username = f'user{i}') for i in range(1, 101)]
+    return [
+        Post(
+            id = i, author = authors[i % len(authors)], title = f'Post {i}', content = 'Lorem ipsum dolor sit amet ' * 4,
+            created_at = now - timedelta(minutes = i), updated_at = now, comment_count = i % 7, like_count = i % 13,
+        )
+        for i in range(count)
+    ]
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type = int, default = 10000)
+    parser.add_argument('--repeat', type = int, default = 5, help = "The best of these runs is reported.")
+    parser.add_argument('--settings', default = 'Microblog.settings')
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', args.settings)
+    import django
+    django.setup()
+    from rest_framework import serializers
+    from rest_framework.renderers import JSONRenderer
+    from Microblog_API.renderers import ORJSONRenderer
+    from Microblog_API.serializers import PostSerializer
+
+    class StockPostSerializer(PostSerializer):
+        created_at = serializers.DateTimeField(read_only = True)
+        updated_at = serializers.DateTimeField(read_only = True)
+
+        def to_representation(self, instance):
+            return serializers.ModelSerializer.to_representation(self, instance)
+
+    rows = posts(args.rows)
+    results = {}
+    for side, serializer_class, renderer in (
+        ('before', StockPostSerializer, JSONRenderer()),
+        ('after', PostSerializer, ORJSONRenderer()),
+    ):
+        serialize, data = best_of(args.repeat, lambda: serializer_class(rows, many = True).data)
+        render, body = best_of(args.repeat, lambda: renderer.render(data))
+        results[side] = serialize, render, body
+
+    if results['before'][2] != results['after'][2]:
+        sys.exit("The rendered bodies differ")
+
+    print(f"{'step':<11} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for index, step in enumerate(('serialize', 'render')):
+        before, after = results['before'][index], results['after'][index]
+        print(f"{step:<11} {before:>10.1f} {after:>10.1f} {before / after:>7.2f}x")
+    before, after = sum(results['before'][:2]), sum(results['after'][:2])
+    print(f"{'total':<11} {before:>10.1f} {after:>10.1f} {before / after:>7.2f}x")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
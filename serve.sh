@@ -0,0 +1,34 @@
+#!/bin/sh
+# Starts the web server chosen by SERVER:
+#   runserver (default)  Django's development server
+#   gunicorn             WSGI workers (Microblog/wsgi.py)
+#   uvicorn              ASGI workers (Microblog/asgi.py)
+# In production also set DJANGO_SETTINGS_MODULE=Microblog.settings_prod and SECRET_KEY.
+set -e
+
+PORT="${PORT:-8000}"
+WORKERS="${WEB_CONCURRENCY:-$(( 2 * $(nproc) + 1 ))}"
+
+case "${SERVER:-runserver}" in
+  gunicorn)
+    exec gunicorn Microblog.wsgi:application \
+      --bind "0.0.0.0:$PORT" \
+      --workers "$WORKERS" \
+      --threads "${GUNICORN_THREADS:-1}" \
+      --keep-alive 5 \
+      --max-requests 10000 --max-requests-jitter 1000
+    ;;
+  uvicorn)
+    exec uvicorn Microblog.asgi:application \
+      --host 0.0.0.0 --port "$PORT" \
+      --workers "$WORKERS" \
+      --no-access-log
+    ;;
+  runserver)
+    exec python manage.py runserver "0.0.0.0:$PORT"
+    ;;
+  *)
+    echo "Unknown SERVER '$SERVER', use runserver, gunicorn or uvicorn." >&2
+    exit 1
+    ;;
+esac